@@ -0,0 +1,23 @@
+# app.py
+#
+# Ponto de entrada único: `streamlit run app.py`.
+#
+# Todas as páginas rodam no mesmo servidor e compartilham o processo: os
+# módulos, o servidor de assets e os caches (`st.cache_data`/`st.cache_resource`)
+# são carregados uma vez só. Só o script da página aberta é executado, então
+# dependências pesadas (geopandas, PIL...) entram apenas quando alguma página
+# precisa delas. Os scripts continuam podendo rodar sozinhos com `streamlit run`.
+
+import streamlit as st
+
+st.set_page_config(page_title="Mapa Fundiário do Ceará", layout="wide")
+
+PAGINAS = [
+    st.Page("app_streamlit_folium.py", title="Mapa Fundiário Interativo", icon="🗺️", default=True),
+    st.Page("app_streamlit_folium_grupos_por_tipo.py", title="Mapa por Tipo de Propriedade", icon="🧭"),
+    st.Page("app_streamlit_pixioverlay.py", title="Mapa Interativo (PixiOverlay)", icon="⚡"),
+    st.Page("app_streamlit_map-assentamentos.py", title="Assentamentos", icon="🏘️"),
+    st.Page("app_shapefile.py", title="Exportar Shapefile", icon="💾"),
+]
+
+st.navigation(PAGINAS).run()
@@ -1,10 +1,10 @@
 # app_shapefile.py
 
 import streamlit as st
-import geopandas as gpd
-import pandas as pd
 from pathlib import Path
-from streamlit_folium import st_folium
+from modules.data_loader import fetch_versao_dados
+from modules.export_jobs import CONCLUIDO, obter_fila
+from modules.parallel_export import FORMATOS
 
 # Configuração da página
 st.set_page_config(page_title="Exportar por Tipo de Propriedade", layout="wide")
@@ -15,76 +15,106 @@ st.title("Exportar Propriedades por Tipo - Ceará")
 OUTPUT_DIR = Path("output_shapes")
 OUTPUT_DIR.mkdir(exist_ok=True)
 
+# Tipos de propriedade e o valor correspondente do campo 'categoria'
+CATEGORIAS = {
+    "Todas": {"filtro": None},
+    "Pequena Propriedade < 1 MF": {"filtro": "Pequena Propriedade < 1 MF"},
+    "Pequena Propriedade": {"filtro": "Pequena Propriedade"},
+    "Média Propriedade": {"filtro": "Média Propriedade"},
+    "Grande Propriedade": {"filtro": "Grande Propriedade"},
+    "Sem Classificação": {"filtro": "Sem Classificação"},
+}
+
 # Seleção do tipo de propriedade com opção "Todas"
 tipo_selecionado = st.selectbox("Selecione o tipo de propriedade", list(CATEGORIAS.keys()))
 
-def buscar_propriedades_em_todos_municipios(filtro_categoria=None):
-    """Busca propriedades em todos os municípios, com filtro opcional por categoria"""
-    municipios = fetch_municipios_all()
-    if not municipios:
+# Faixas opcionais de área e módulo fiscal (0 = sem limite)
+with st.expander("Filtros de área e módulo fiscal"):
+    col_area_min, col_area_max, col_mf_min, col_mf_max = st.columns(4)
+    area_min = col_area_min.number_input("Área mínima (ha)", min_value=0.0, value=0.0)
+    area_max = col_area_max.number_input("Área máxima (ha)", min_value=0.0, value=0.0)
+    mf_min = col_mf_min.number_input("Módulo fiscal mínimo", min_value=0.0, value=0.0)
+    mf_max = col_mf_max.number_input("Módulo fiscal máximo", min_value=0.0, value=0.0)
+
+def faixa(minimo, maximo):
+    """Converte os campos da interface em (mínimo, máximo), com None para 'sem limite'"""
+    return (minimo or None, maximo or None)
+
+def buscar_propriedades_em_todos_municipios(filtro_categoria=None, faixa_area=None, faixa_modulo_fiscal=None):
+    """Busca propriedades em todos os municípios, com filtros opcionais por categoria, área e módulo fiscal"""
+    # Importações tardias: geopandas e a base estadual só entram após o clique
+    import geopandas as gpd
+    from modules.geo_store import obter_store
+    from modules.query import Consulta
+
+    # Base estadual compartilhada entre sessões: a busca é um recorte em memória
+    store = obter_store(fetch_versao_dados())
+    total_municipios = len(store.municipios())
+    if not total_municipios:
         st.error("Erro ao carregar municípios.")
-        return gpd.GeoDataFrame()
-    
-    progresso = st.progress(0)
-    gdf_final = gpd.GeoDataFrame()
-    total_municipios = len(municipios)
-    municipios_com_dados = 0
-    
-    for i, municipio in enumerate(municipios):
-        progresso.progress((i + 1) / total_municipios)
-        
-        try:
-            geojson = fetch_geojson_por_municipio(municipio)
-            if not geojson or not geojson.get("features"):
-                continue
-            
-            # Filtra features conforme seleção
-            if filtro_categoria:
-                features_filtradas = [
-                    f for f in geojson["features"]
-                    if f.get("properties", {}).get("categoria") == filtro_categoria
-                ]
-            else:  # Caso "Todas"
-                features_filtradas = geojson["features"]
-            
-            if features_filtradas:
-                gdf_municipio = gpd.GeoDataFrame.from_features(features_filtradas)
-                gdf_final = pd.concat([gdf_final, gdf_municipio], ignore_index=True)
-                municipios_com_dados += 1
-                
-        except Exception as e:
-            st.warning(f"Erro no município {municipio}: {str(e)}")
-            continue
-    
-    if not gdf_final.empty:
-        gdf_final.crs = "EPSG:4326"
-    
-    return gdf_final, municipios_com_dados, total_municipios
-
-def gerar_shapefile_local(gdf, tipo):
-    """Gera Shapefile localmente com campos essenciais"""
-    colunas_necessarias = {
-        'nome_municipio': 'municipio',
-        'categoria': 'tipo',
-        'nome_municipio_original': 'mun_orig',
-        'modulo_fiscal': 'mod_fisc',
-        'geometry': 'geometry'
+        return gpd.GeoDataFrame(), 0, 0
+
+    # Categoria pelo índice do store, faixas por máscara sobre as colunas;
+    # só as linhas selecionadas são copiadas
+    resultado = Consulta(
+        "propriedades",
+        categoria=filtro_categoria,
+        area=faixa_area,
+        modulo_fiscal=faixa_modulo_fiscal
+    ).no_store(store)
+    municipios_com_dados = resultado.distintos("nome_municipio")
+
+    return resultado.gdf(), municipios_com_dados, total_municipios
+
+def nome_exportacao(tipo):
+    """Nome do arquivo exportado (sem sufixo) para o tipo de propriedade"""
+    return f"propriedades_{tipo.lower().replace(' ', '_').replace('<', 'lt') if tipo != 'Todas' else 'todas_categorias'}"
+
+def submeter_exportacao(tipo, faixa_area, faixa_modulo_fiscal, formato):
+    """Enfileira a exportação com os filtros atuais; pedidos iguais reaproveitam o mesmo trabalho"""
+    from modules.data_loader import fetch_regioes
+    parametros = {
+        "categoria": CATEGORIAS[tipo]["filtro"],
+        "area": faixa_area,
+        "modulo_fiscal": faixa_modulo_fiscal,
+        "formato": formato,
+        "versao": fetch_versao_dados(),
     }
-    
-    gdf_filtrado = gdf[[col for col in colunas_necessarias.keys() if col in gdf.columns]]
-    gdf_filtrado = gdf_filtrado.rename(columns={
-        col: new_name for col, new_name in colunas_necessarias.items() 
-        if col in gdf_filtrado.columns
-    })
-    
-    nome_arquivo = f"propriedades_{tipo.lower().replace(' ', '_').replace('<', 'lt') if tipo != 'Todas' else 'todas_categorias'}"
-    caminho_shp = OUTPUT_DIR / nome_arquivo
-    
-    gdf_filtrado.to_file(caminho_shp, driver='ESRI Shapefile', encoding='utf-8')
-    st.success(f"Shapefile gerado em: {caminho_shp}.shp")
+    trabalho = obter_fila(str(OUTPUT_DIR / "exportacoes")).submeter(
+        parametros, fetch_regioes(), nome_exportacao(tipo)
+    )
+    ids = st.session_state.setdefault("exportacoes", [])
+    if trabalho.id not in ids:
+        ids.append(trabalho.id)
+
+def mostrar_exportacoes(atualizando: bool = False):
+    """
+    Estado das exportações pedidas nesta sessão. Com `atualizando` (fragmento
+    com `run_every`), roda o app de novo quando nenhuma está mais em
+    andamento, para o fragmento ser recriado sem a atualização periódica.
+    """
+    fila = obter_fila(str(OUTPUT_DIR / "exportacoes"))
+    ativos = False
+    for id_trabalho in reversed(st.session_state.get("exportacoes", [])):
+        trabalho = fila.obter(id_trabalho)
+        if trabalho is None:
+            continue
+        ativos = ativos or trabalho.ativo
+        descricao = f"{trabalho.nome} ({trabalho.parametros['formato']})"
+        if trabalho.ativo:
+            st.progress(trabalho.progresso, text=f"{descricao}: {trabalho.estado} {trabalho.mensagem}")
+        elif trabalho.estado == CONCLUIDO and trabalho.total:
+            st.success(f"{descricao}: {trabalho.total} propriedades exportadas em {trabalho.caminho}")
+        elif trabalho.estado == CONCLUIDO:
+            st.warning(f"{descricao}: nenhuma propriedade encontrada para exportar.")
+        else:
+            st.error(f"{descricao}: {trabalho.erro}")
+    if atualizando and not ativos:
+        st.rerun()
 
 def calcular_resumo_areas(gdf):
     """Calcula resumo de áreas com percentuais para todas as categorias"""
+    import pandas as pd
     if gdf.empty or 'area' not in gdf.columns:
         return pd.DataFrame(), 0
     
@@ -114,19 +144,27 @@ def calcular_resumo_areas(gdf):
     
     return resumo, total_area
 
+# A última busca fica na sessão: reruns causados por outros widgets (ex.: o
+# botão de exportação) reexibem o resultado em vez de sumir com ele
 if st.button("Buscar Propriedades"):
-    filtro = CATEGORIAS[tipo_selecionado]["filtro"] if tipo_selecionado != "Todas" else None
+    st.session_state["busca_propriedades"] = (tipo_selecionado, faixa(area_min, area_max), faixa(mf_min, mf_max))
+
+if "busca_propriedades" in st.session_state:
+    tipo_busca, faixa_area_busca, faixa_mf_busca = st.session_state["busca_propriedades"]
+    filtro = CATEGORIAS[tipo_busca]["filtro"]
     
     with st.spinner("Buscando propriedades em todos os municípios..."):
-        propriedades, municipios_com_dados, total_municipios = buscar_propriedades_em_todos_municipios(filtro)
+        propriedades, municipios_com_dados, total_municipios = buscar_propriedades_em_todos_municipios(
+            filtro, faixa_area_busca, faixa_mf_busca
+        )
     
     if propriedades.empty:
         st.warning(f"Nenhuma propriedade encontrada em {total_municipios} municípios.")
     else:
-        if tipo_selecionado == "Todas":
+        if tipo_busca == "Todas":
             st.success(f"✅ Encontradas {len(propriedades)} propriedades (todas categorias) em {municipios_com_dados}/{total_municipios} municípios")
         else:
-            st.success(f"✅ Encontradas {len(propriedades)} propriedades do tipo '{tipo_selecionado}' em {municipios_com_dados}/{total_municipios} municípios")
+            st.success(f"✅ Encontradas {len(propriedades)} propriedades do tipo '{tipo_busca}' em {municipios_com_dados}/{total_municipios} municípios")
         
         # Seção de Resumo
         st.subheader("📊 Resumo de Áreas por Categoria")
@@ -160,7 +198,22 @@ if st.button("Buscar Propriedades"):
         # Seção de Dados Completos
         with st.expander("Ver dados completos"):
             st.dataframe(propriedades.drop(columns='geometry'))
-        
-        # Geração do Shapefile
-        if st.button("Gerar Shapefile Local"):
-            gerar_shapefile_local(propriedades, tipo_selecionado)
\ No newline at end of file
+
+
+# Exportação em segundo plano: o trabalho roda fora desta sessão (cada região
+# num processo, ver modules.parallel_export), sobrevive a reruns e fica
+# gravado em OUTPUT_DIR; o mesmo pedido de outro usuário reaproveita o resultado
+st.markdown("---")
+st.subheader("Exportar arquivo")
+st.caption("Usa o tipo de propriedade e as faixas selecionados acima.")
+formato_exportacao = st.selectbox("Formato", list(FORMATOS))
+if st.button("Gerar arquivo"):
+    submeter_exportacao(tipo_selecionado, faixa(area_min, area_max), faixa(mf_min, mf_max), formato_exportacao)
+
+if st.session_state.get("exportacoes"):
+    fila = obter_fila(str(OUTPUT_DIR / "exportacoes"))
+    em_andamento = any(
+        trabalho.ativo for trabalho in map(fila.obter, st.session_state["exportacoes"]) if trabalho
+    )
+    # Enquanto houver exportação em andamento, só este trecho é atualizado a cada 2 s
+    st.fragment(run_every=2 if em_andamento else None)(mostrar_exportacoes)(em_andamento)
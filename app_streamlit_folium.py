@@ -2,33 +2,27 @@
 import streamlit as st
 import folium
 import json
-import geopandas as gpd
 
 from streamlit_folium import st_folium
-from folium.plugins import Fullscreen
+from streamlit.components.v1 import html
+from folium.plugins import Fullscreen, VectorGridProtobuf
 from modules.data_loader import (
     fetch_regioes, fetch_municipios,
-    fetch_geojson_por_regiao, fetch_geojson_por_municipio,
-    fetch_geojson_limites
+    fetch_geojson_por_municipio,
+    fetch_geojson_limites, fetch_versao_dados
 )
+from modules.asset_server import publicar_json
+from modules.map_layers import CamadaCategorias, CamadaLimites, CamadaProgressiva, GeoJsonRemoto, estilos_por_categoria
+from modules.progressive import url_progressiva
 
 def simplify_geojson(geojson_data, tolerance=0.001):
-    if not geojson_data or not geojson_data.get("features"):
-        return geojson_data
-    gdf = gpd.GeoDataFrame.from_features(geojson_data["features"])
-    gdf["geometry"] = gdf["geometry"].simplify(tolerance)
-    return json.loads(gdf.to_json())
-
-def get_map_center(geojson):
-    for f in geojson["features"]:
-        g = f["geometry"]
-        if g["type"] == "Polygon":
-            lng, lat = g["coordinates"][0][0]
-            return [lat, lng]
-        elif g["type"] == "MultiPolygon":
-            lng, lat = g["coordinates"][0][0][0]
-            return [lat, lng]
-    return [-5.2, -39.0]
+    """Converte para a coleção compacta (arrays planos) e simplifica as geometrias"""
+    from modules.ragged import FeicoesCompactas  # importação tardia: só o modo município usa
+    return FeicoesCompactas.de_geojson(geojson_data).simplificar(tolerance)
+
+def get_map_center(feicoes):
+    # Centro do retângulo envolvente, calculado sobre o array plano de coordenadas
+    return feicoes.centro() or [-5.2, -39.0]
 
 st.set_page_config(page_title="Mapa Fundiário Interativo", layout="wide")
 st.title("Mapa Fundiário Interativo do Ceará")
@@ -41,6 +35,68 @@ CORES = {
     "Sem Classificação": "#eeeee4"
 }
 
+modo = st.radio(
+    "Modo de visualização",
+    ["Região / município", "Estado inteiro (tiles vetoriais)"],
+    horizontal=True
+)
+
+if modo == "Estado inteiro (tiles vetoriais)":
+    from modules.raster_tiles import preparar_tiles_raster
+    from modules.vector_tiles import ZOOM_MAX_NATIVO, ZOOM_MIN_PROPRIEDADES, preparar_tiles
+
+    cor_agregada = st.radio(
+        "Cor nos zooms baixos",
+        ["categoria", "densidade"],
+        format_func=lambda v: "Categoria predominante" if v == "categoria" else "Densidade de propriedades",
+        horizontal=True
+    )
+
+    # Só os tiles visíveis são baixados; cada um traz as feições já recortadas
+    tiles_url = preparar_tiles()
+    raster_url = preparar_tiles_raster(CORES, cor_agregada)
+    m = folium.Map(location=[-5.2, -39.0], zoom_start=7, tiles=None, control_scale=True)
+    folium.TileLayer(
+        tiles='https://{s}.basemaps.cartocdn.com/rastertiles/voyager/{z}/{x}/{y}{r}.png',
+        attr='© OpenStreetMap contributors, © CARTO',
+        name='OpenpenStreetMap',
+        control=False,
+        overlay=True
+    ).add_to(m)
+    # Zooms baixos: tiles PNG agregados no servidor; a partir de
+    # ZOOM_MIN_PROPRIEDADES as propriedades passam a vir nos tiles vetoriais
+    folium.TileLayer(
+        tiles=raster_url,
+        attr='TerraGeo',
+        name='Propriedades (agregado)',
+        max_zoom=ZOOM_MIN_PROPRIEDADES - 1,
+        overlay=True,
+        control=False
+    ).add_to(m)
+    VectorGridProtobuf(
+        tiles_url,
+        name="Propriedades e Limites Municipais",
+        options=f"""{{
+            "maxNativeZoom": {ZOOM_MAX_NATIVO},
+            "vectorTileLayerStyles": {{
+                "propriedades": function(p) {{
+                    var cores = {json.dumps(CORES)};
+                    return {{
+                        fill: true, fillColor: cores[p.categoria] || cores["Sem Classificação"],
+                        fillOpacity: 0.6, color: "#000", weight: 0.5
+                    }};
+                }},
+                "limites": {{
+                    color: "#003366", weight: 2, opacity: 0.8, fill: false, dashArray: "5, 5"
+                }}
+            }}
+        }}"""
+    ).add_to(m)
+    folium.LayerControl(collapsed=False).add_to(m)
+    Fullscreen().add_to(m)
+    st_folium(m, width=1200, height=900, returned_objects=[])
+    st.stop()
+
 regioes = fetch_regioes()
 if not regioes:
     st.error("Erro ao carregar regiões.")
@@ -50,34 +106,55 @@ regiao = st.selectbox("Selecione a região administrativa", regioes)
 municipios = fetch_municipios(regiao)
 municipio = st.selectbox("Selecione o município (opcional)", ["(toda a região)"] + municipios)
 
+# Tolerância de simplificação das geometrias (graus)
+TOLERANCIA = 0.001
 
-
-
-if st.button("Gerar Mapa"):
-    try:
-        if municipio == "(toda a região)":
-            geojson_data = fetch_geojson_por_regiao(regiao)
-            boundaries = []
-            for m in municipios:
-                b = fetch_geojson_limites(m)
-                if b and b.get("features"):
-                    boundaries.extend(b["features"])
-            boundary_geojson = {"type":"FeatureCollection", "features":boundaries} if boundaries else None
-        else:
-            geojson_data = fetch_geojson_por_municipio(municipio)
-            boundary_geojson = fetch_geojson_limites(municipio)
-    except Exception as e:
-        st.error(f"Erro ao baixar dados: {e}")
-        st.stop()
-
-    if not geojson_data or not geojson_data.get("features"):
-        st.warning("Nenhuma geometria encontrada.")
-        st.stop()
-
-    geojson_data = simplify_geojson(geojson_data)
-    center = get_map_center(geojson_data)
-
-    m = folium.Map(location=center, zoom_start=9, tiles=None, control_scale=True)
+ESTILO_LIMITES = {
+    'color': '#003366', 'weight': 2, 'opacity': 0.8,
+    'fill': False, 'dashArray': '5, 5'
+}
+ESTILO_REGIOES = {'color': '#003366', 'weight': 3, 'opacity': 0.9, 'fill': False}
+
+
+@st.cache_data(max_entries=64, ttl=3600, show_spinner=False)
+def render_mapa_html(regiao, municipio, tolerance, versao):
+    """
+    Monta o mapa folium da seleção e devolve o HTML final.
+
+    O resultado é compartilhado entre sessões: seleções repetidas (inclusive de
+    outros usuários) não refazem a simplificação nem a geração do HTML.
+    `versao` identifica a versão dos dados; quando muda, a entrada antiga deixa
+    de ser usada e é descartada pelo limite de `max_entries`/`ttl`.
+    Retorna o HTML e a lista de degradações aplicadas para caber no orçamento
+    de transferência (ver `modules.payload`), ou None quando o município
+    selecionado não tem geometrias.
+    """
+    degradacoes = []
+    progressivo = municipio == "(toda a região)"
+    if progressivo:
+        # Região inteira: nada é buscado aqui. O navegador recebe um stream com
+        # um município por linha, buscados em paralelo e desenhados ao chegar;
+        # os limites vêm prontos (contornos regionais + malha municipal)
+        from modules.boundaries import ZOOM_MUNICIPIOS, urls_limites
+        limites = urls_limites(versao, regiao)
+        center, zoom = [-5.2, -39.0], 8
+    else:
+        geojson_data = fetch_geojson_por_municipio(municipio)
+        boundary_geojson = fetch_geojson_limites(municipio)
+
+        if not geojson_data or not geojson_data.get("features"):
+            return None
+
+        feicoes = simplify_geojson(geojson_data, tolerance)
+        from modules.payload import ajustar_feicoes
+        from modules.precision import casas_para
+        # A coleção segue em arrays até a publicação (só vira GeoJSON se degradada)
+        propriedades, degradacoes = ajustar_feicoes(feicoes)
+        center, zoom = get_map_center(feicoes), 9
+        # Precisão das coordenadas pela extensão do município (ver modules.precision)
+        casas = casas_para(limites=feicoes.limites_totais())
+
+    m = folium.Map(location=center, zoom_start=zoom, tiles=None, control_scale=True)
 
     folium.TileLayer(
         # tiles='https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png',
@@ -89,45 +166,75 @@ if st.button("Gerar Mapa"):
         overlay=True
     ).add_to(m)
 
-
-    if boundary_geojson and boundary_geojson.get("features"):
-        folium.GeoJson(
-            boundary_geojson,
-            name='<span><svg width="12" height="12"><rect width="12" height="12" fill="#003366"/></svg> Limites Municipais</span>',
-            style_function=lambda x: {
-                'color': '#003366', 'weight': 2, 'opacity': 0.8,
-                'fill': False, 'dashArray': '5, 5'
-            },
-            tooltip=folium.GeoJsonTooltip(fields=['nome_municipio'], aliases=['Município:'])
+    estilos = estilos_por_categoria(CORES, color='#000', weight=0.5, fillOpacity=0.6)
+    campos = ['nome_municipio', 'area', 'categoria']
+    aliases = ['Município:', 'Área (ha):', 'Categoria:']
+
+    if progressivo:
+        if limites["bounds"]:
+            m.fit_bounds(limites["bounds"])
+        # Afastado, só os contornos das regiões; as linhas municipais
+        # aparecem a partir de ZOOM_MUNICIPIOS
+        CamadaLimites(
+            limites["regioes"],
+            limites["municipios"],
+            estilo_regioes=ESTILO_REGIOES,
+            estilo_municipios=ESTILO_LIMITES,
+            zoom_municipios=ZOOM_MUNICIPIOS,
+            campos=['nome_municipio'], aliases=['Município:'],
+            name='<span><svg width="12" height="12"><rect width="12" height="12" fill="#003366"/></svg> Limites</span>'
+        ).add_to(m)
+        CamadaProgressiva(
+            url_progressiva(regiao, None, tolerance, versao),
+            estilos,
+            campos=campos,
+            aliases=aliases
         ).add_to(m)
+    else:
+        if boundary_geojson and boundary_geojson.get("features"):
+            # Os dados vão para um arquivo estático com cache; o HTML leva só a URL
+            GeoJsonRemoto(
+                publicar_json(boundary_geojson, "limites", casas=casas),
+                name='<span><svg width="12" height="12"><rect width="12" height="12" fill="#003366"/></svg> Limites Municipais</span>',
+                estilo=ESTILO_LIMITES,
+                campos=['nome_municipio'], aliases=['Município:']
+            ).add_to(m)
+
+        # Uma só camada para todas as categorias: a tabela de estilos vai uma vez
+        # para o navegador e a legenda filtra as categorias no próprio cliente
+        CamadaCategorias(
+            publicar_json(propriedades, "propriedades", casas=casas),
+            estilos,
+            campos=campos,
+            aliases=aliases
+        ).add_to(m)
+
+    folium.LayerControl(collapsed=False).add_to(m)
+    Fullscreen().add_to(m)
+    return m.get_root().render(), degradacoes
 
-    for categoria, cor in CORES.items():
-        feats = [f for f in geojson_data["features"]
-                 if f.get("properties", {}).get("categoria", "Sem Classificação") == categoria]
-        if not feats:
-            continue
-        cat_geojson = {"type": "FeatureCollection", "features": feats}
-        name_html = (
-            f'<span><svg width="12" height="12">'
-            f'<circle cx="6" cy="6" r="6" fill="{cor}" /></svg> {categoria}</span>'
-        )
-        fg = folium.FeatureGroup(name=name_html, overlay=True, control=True)
-        folium.GeoJson(
-            cat_geojson,
-            style_function=lambda x, cor=cor: {
-                'fillColor': cor, 'color': '#000', 'weight': 0.5, 'fillOpacity': 0.6
-            },
-            tooltip=folium.GeoJsonTooltip(
-                fields=['nome_municipio', 'area', 'categoria'],
-                aliases=['Município:', 'Área (ha):', 'Categoria:'],
-                localize=True
-            )
-        ).add_to(fg)
-        fg.add_to(m)
 
+# A seleção do último "Gerar Mapa" fica na sessão: reruns causados por outros
+# widgets reexibem o mapa a partir do cache em vez de sumir com ele
+if st.button("Gerar Mapa"):
+    st.session_state["selecao_mapa"] = (regiao, municipio)
 
+if "selecao_mapa" in st.session_state:
+    regiao_mapa, municipio_mapa = st.session_state["selecao_mapa"]
     with st.spinner("Gerando mapa..."):
-        folium.LayerControl(collapsed=False).add_to(m)
-        Fullscreen().add_to(m)
-        st_folium(m, width=1200, height=900, returned_objects=[])
-    st.stop()
\ No newline at end of file
+        try:
+            mapa = render_mapa_html(regiao_mapa, municipio_mapa, TOLERANCIA, fetch_versao_dados())
+        except Exception as e:
+            st.error(f"Erro ao baixar dados: {e}")
+            st.stop()
+
+    if mapa is None:
+        st.warning("Nenhuma geometria encontrada.")
+        st.stop()
+
+    mapa_html, degradacoes = mapa
+    if degradacoes:
+        from modules.payload import avisar_degradacoes
+        avisar_degradacoes(degradacoes)
+    html(mapa_html, width=1200, height=900)
+    st.stop()
@@ -1,17 +1,10 @@
 import streamlit as st
 import folium
-import json
-import geopandas as gpd
 from streamlit_folium import st_folium
 from folium.plugins import Fullscreen
-import base64
 from io import BytesIO
-from PIL import Image
-from modules.data_loader import (
-    fetch_regioes, fetch_municipios,
-    fetch_geojson_por_municipio,
-    fetch_geojson_limites
-)
+from modules.map_layers import CamadaCategorias, CamadaLimites, estilos_por_categoria
+from modules.data_loader import fetch_regioes, fetch_versao_dados
 
 # Cores para as categorias de propriedade
 CORES = {
@@ -22,75 +15,25 @@ CORES = {
     "Sem Classificação": "#eeeee4"
 }
 
-def simplify_geojson(geojson_data, tolerance=0.001):
-    if not geojson_data or not geojson_data.get("features"):
-        return geojson_data
-    gdf = gpd.GeoDataFrame.from_features(geojson_data["features"])
-    gdf["geometry"] = gdf["geometry"].simplify(tolerance)
-    return json.loads(gdf.to_json())
+def create_map(categoria_selecionada, regiao="(todos)"):
+    """
+    Cria o mapa da categoria a partir da partição estadual por categoria.
 
-def get_map_center(geojson):
-    for f in geojson["features"]:
-        g = f["geometry"]
-        if g["type"] == "Polygon":
-            lng, lat = g["coordinates"][0][0]
-            return [lat, lng]
-        elif g["type"] == "MultiPolygon":
-            lng, lat = g["coordinates"][0][0][0]
-            return [lat, lng]
-    return [-5.2, -39.0]  # Centro do Ceará
+    A partição (propriedades simplificadas e serializadas) é montada uma vez
+    por versão dos dados e compartilhada entre sessões: trocar de categoria ou
+    de região só recorta os índices e publica o GeoJSON, que o navegador baixa
+    do servidor de assets. Os limites vêm prontos de `modules.boundaries`.
+    """
+    from modules.boundaries import ZOOM_MUNICIPIOS, urls_limites
+    from modules.category_partition import url_categoria
+    versao = fetch_versao_dados()
+    filtro_regiao = None if regiao == "(todos)" else regiao
+    url_propriedades, quantidade = url_categoria(versao, categoria_selecionada, filtro_regiao)
+    limites = urls_limites(versao, filtro_regiao)
 
-def create_map(categoria_selecionada, regiao="(todos)"):
-    # Busca todos os municípios do Ceará
-    regioes = fetch_regioes()
-    if not regioes:
-        st.error("Erro ao carregar regiões.")
-        return None
-    
-    all_features = []
-    boundaries = []
-    
-    # Se for selecionada uma região específica, busca apenas seus municípios
-    if regiao != "(todos)":
-        municipios = fetch_municipios(regiao)
-    else:
-        # Busca municípios de todas as regiões
-        municipios = []
-        for r in regioes:
-            municipios.extend(fetch_municipios(r))
-    
-    with st.spinner(f"Carregando propriedades {categoria_selecionada} de {len(municipios)} municípios..."):
-        for municipio in municipios:
-            try:
-                geojson_data = fetch_geojson_por_municipio(municipio)
-                if geojson_data and geojson_data.get("features"):
-                    # Filtra apenas as features da categoria selecionada
-                    feats = [f for f in geojson_data["features"] 
-                            if f.get("properties", {}).get("categoria", "Sem Classificação") == categoria_selecionada]
-                    all_features.extend(feats)
-                    
-                    # Adiciona limites do município
-                    boundary = fetch_geojson_limites(municipio)
-                    if boundary and boundary.get("features"):
-                        boundaries.extend(boundary["features"])
-            except Exception as e:
-                st.warning(f"Erro ao processar {municipio}: {str(e)}")
-                continue
-    
-    if not all_features:
-        st.warning(f"Nenhuma propriedade encontrada para a categoria {categoria_selecionada}")
-        return None
-    
-    # Cria o GeoJSON com todas as propriedades da categoria selecionada
-    propriedades_geojson = {"type": "FeatureCollection", "features": all_features}
-    propriedades_geojson = simplify_geojson(propriedades_geojson)
-    
-    # Cria o GeoJSON com os limites dos municípios
-    boundary_geojson = {"type": "FeatureCollection", "features": boundaries} if boundaries else None
-    
-    # Cria o mapa
-    center = get_map_center(propriedades_geojson)
-    m = folium.Map(location=center, zoom_start=7, tiles=None, control_scale=True)
+    m = folium.Map(location=[-5.2, -39.0], zoom_start=7, tiles=None, control_scale=True)
+    if limites["bounds"]:
+        m.fit_bounds(limites["bounds"])
     
     # Adiciona o tile layer
     folium.TileLayer(
@@ -100,49 +43,60 @@ def create_map(categoria_selecionada, regiao="(todos)"):
         control=False,
         overlay=True
     ).add_to(m)
+
+    # Contornos das regiões sempre; linhas municipais só a partir de ZOOM_MUNICIPIOS
+    CamadaLimites(
+        limites["regioes"],
+        limites["municipios"],
+        estilo_regioes={'color': '#003366', 'weight': 2.5, 'opacity': 0.9, 'fill': False},
+        estilo_municipios={
+            'color': '#003366', 'weight': 1, 'opacity': 0.7,
+            'fill': False, 'dashArray': '5, 5'
+        },
+        zoom_municipios=ZOOM_MUNICIPIOS,
+        name='<span><svg width="12" height="12"><rect width="12" height="12" fill="#003366"/></svg> Limites</span>'
+    ).add_to(m)
     
-    # Adiciona os limites dos municípios
-    if boundary_geojson and boundary_geojson.get("features"):
-        folium.GeoJson(
-            boundary_geojson,
-            name='<span><svg width="12" height="12"><rect width="12" height="12" fill="#003366"/></svg> Limites Municipais</span>',
-            style_function=lambda x: {
-                'color': '#003366', 'weight': 1, 'opacity': 0.7,
-                'fill': False, 'dashArray': '5, 5'
-            },
-            tooltip=folium.GeoJsonTooltip(fields=['nome_municipio'], aliases=['Município:'])
-        ).add_to(m)
-    
-    # Adiciona as propriedades da categoria selecionada
+    # Propriedades da categoria, com estilo aplicado no navegador
     cor = CORES.get(categoria_selecionada, "#eeeeee")
-    name_html = (
-        f'<span><svg width="12" height="12">'
-        f'<circle cx="6" cy="6" r="6" fill="{cor}" /></svg> {categoria_selecionada}</span>'
-    )
-    fg = folium.FeatureGroup(name=name_html, overlay=True, control=True)
-    
-    folium.GeoJson(
-        propriedades_geojson,
-        style_function=lambda x, cor=cor: {
-            'fillColor': cor, 'color': '#000', 'weight': 0.3, 'fillOpacity': 0.7
-        },
-        tooltip=folium.GeoJsonTooltip(
-            fields=['nome_municipio', 'area', 'categoria'],
-            aliases=['Município:', 'Área (ha):', 'Categoria:'],
-            localize=True
-        )
-    ).add_to(fg)
-    fg.add_to(m)
+    CamadaCategorias(
+        url_propriedades,
+        estilos_por_categoria({categoria_selecionada: cor}, color='#000', weight=0.3, fillOpacity=0.7),
+        padrao=categoria_selecionada,
+        campos=['nome_municipio', 'area', 'categoria'],
+        aliases=['Município:', 'Área (ha):', 'Categoria:']
+    ).add_to(m)
     
     # Adiciona controles
     folium.LayerControl(collapsed=False).add_to(m)
     Fullscreen().add_to(m)
     
-    return m
+    return m, quantidade
+
+def coletar_dados(categoria_selecionada, regiao="(todos)"):
+    """Recorta as propriedades da categoria e os limites municipais do store estadual (para a exportação PNG)"""
+    # Importações tardias: a base estadual e o rasterizador só entram na exportação
+    from modules.geo_store import obter_store
+    store = obter_store(fetch_versao_dados())
+    filtro_regiao = None if regiao == "(todos)" else regiao
+    propriedades = store.propriedades.selecionar(regiao=filtro_regiao, categoria=categoria_selecionada)
+    if propriedades.empty:
+        return None, None
+    limites = store.limites.selecionar(regiao=filtro_regiao)
+    return propriedades, (limites if not limites.empty else None)
 
-def get_map_image(m):
-    """Converte o mapa folium em uma imagem PNG"""
-    img_data = m._to_png(5)
+def get_map_image(propriedades, limites, categoria):
+    """Rasteriza as propriedades e limites em uma imagem PNG, sem navegador"""
+    from PIL import Image
+    from modules.raster_export import renderizar_png
+    img_data = renderizar_png(
+        propriedades,
+        {categoria: CORES.get(categoria, "#eeeeee")},
+        limites,
+        largura=2400,
+        titulo="Tipo de Propriedade",
+        padrao=categoria
+    )
     img = Image.open(BytesIO(img_data))
     return img
 
@@ -166,14 +120,26 @@ def main():
         index=0
     )
     
+    # A seleção fica na sessão para que o botão de PNG (que causa um rerun)
+    # não faça o mapa sumir
     if st.button("Gerar Mapa"):
-        m = create_map(categoria_selecionada, regiao_selecionada)
-        if m:
-            # Exibe o mapa
-            st_folium(m, width=1200, height=800, returned_objects=[])
-            
-            # Botão para download da imagem
-            img = get_map_image(m)
+        st.session_state["selecao_grupos"] = (categoria_selecionada, regiao_selecionada)
+    
+    if "selecao_grupos" in st.session_state:
+        categoria_mapa, regiao_mapa = st.session_state["selecao_grupos"]
+        m, quantidade = create_map(categoria_mapa, regiao_mapa)
+        st.caption(f"{quantidade:,} propriedades do tipo {categoria_mapa}".replace(",", "."))
+        # Exibe o mapa
+        st_folium(m, width=1200, height=800, returned_objects=[])
+        
+        # Exportação PNG sob demanda: só então todos os dados são reunidos no servidor
+        if st.button("Preparar PNG"):
+            with st.spinner("Gerando imagem..."):
+                propriedades, limites = coletar_dados(categoria_mapa, regiao_mapa)
+            if propriedades is None:
+                st.warning(f"Nenhuma propriedade encontrada para a categoria {categoria_mapa}")
+                return
+            img = get_map_image(propriedades, limites, categoria_mapa)
             buf = BytesIO()
             img.save(buf, format="PNG")
             byte_im = buf.getvalue()
@@ -181,7 +147,7 @@ def main():
             st.download_button(
                 label="Baixar Mapa como PNG",
                 data=byte_im,
-                file_name=f"mapa_{categoria_selecionada.lower().replace(' ', '_')}_ceara.png",
+                file_name=f"mapa_{categoria_mapa.lower().replace(' ', '_')}_ceara.png",
                 mime="image/png"
             )
 
@@ -292,11 +292,16 @@
 
 import streamlit as st
 import folium
-from streamlit_folium import st_folium
+from streamlit.components.v1 import html
 from folium.plugins import MiniMap, Fullscreen
 import requests
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
 import math
+import numpy as np
+from modules.data_loader import fetch_assentamentos_municipios, fetch_versao_dados
+from modules.query import Consulta, Resultado, executar
+from modules.payload import ETAPAS_SEM_AGREGACAO, ajustar_geojson, avisar_degradacoes
+from modules.precision import arredondar_geojson, casas_para
 
 # Configuração da página
 st.set_page_config(page_title="Assentamentos do Ceará", layout="wide")
@@ -332,10 +337,14 @@ CORES_MARKERS = {
 CENTRO_CEARA = [-5.2, -39.0]
 ZOOM_PADRAO = 8
 
-# Carga dos dados para o Mapa de Assentamentos
+# Campos exibidos nos tooltips, presentes em todas as features depois da normalização
+CAMPOS_MINIMOS = [
+    'cd_sipra', 'tipo_assentamento', 'nome_assentamento',
+    'nome_municipio_original', 'num_familias', 'forma_obtecao',
+    'area', 'perimetro'
+]
 
-# Controle de simplificação
-tolerancia = 0.001
+# Carga dos dados para o Mapa de Assentamentos
 
 def formatar_valor(valor):
     """Substitui valores inválidos por 'Não Disponível'"""
@@ -350,16 +359,43 @@ def formatar_valor(valor):
             return "Não Disponível"
     return valor
 
-def carregar_geojson(municipio: str = "todos", tipo: str = "todos", tolerancia: float = 0.001) -> Optional[dict]:
-    """Carrega dados GeoJSON da API com filtros"""
-    try:
-        url = f"http://localhost:8000/geojson_assentamentos?municipio={municipio}&tipo={tipo}&tolerance={tolerancia}"
-        response = requests.get(url, timeout=30)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        st.error(f"Erro ao carregar dados: {str(e)}")
-        return None
+# A página é um pipeline de etapas em cache, cada uma com a chave das entradas
+# de que realmente depende: busca e normalização por município; filtro,
+# estatísticas e mapa por município e tipo. Trocar só o tipo refiltra e
+# redesenha, sem nova busca nem nova normalização.
+
+@st.cache_resource(ttl=3600, max_entries=64, show_spinner="Carregando assentamentos...")
+def carregar_assentamentos(municipio: str, versao: str) -> Resultado:
+    """Etapa de busca: todos os tipos de assentamento do município (compartilhado entre sessões)"""
+    # O município vai como parâmetro da requisição (ou recorta a base estadual,
+    # se já estiver em memória). As geometrias vêm simplificadas com tolerância 0.001
+    consulta = Consulta("assentamentos", municipio=None if municipio == "todos" else municipio)
+    return executar(consulta, versao)
+
+def filtrar_tipo(resultado: Resultado, tipo: str) -> Resultado:
+    """Etapa de filtro: máscara sobre as linhas já carregadas, sem nova busca"""
+    if tipo == "todos":
+        return resultado
+    return Consulta("assentamentos", tipo=tipo).refinar(resultado)
+
+def formatar_propriedades(features: List[Dict]) -> None:
+    """Garante os campos mínimos nas propriedades e formata os valores inválidos"""
+    for feature in features:
+        props = feature['properties']
+        for campo in CAMPOS_MINIMOS:
+            if campo not in props:
+                props[campo] = "Não Disponível"
+            else:
+                props[campo] = formatar_valor(props[campo])
+
+@st.cache_data(ttl=3600, max_entries=64, show_spinner=False)
+def normalizar_assentamentos(municipio: str, versao: str) -> Dict:
+    """Etapa de normalização: GeoJSON do município com campos formatados, todos os tipos"""
+    geojson_data = carregar_assentamentos(municipio, versao).geojson()
+    # O GeoJson do folium vai embutido no HTML: coordenadas na precisão do zoom do mapa
+    geojson_data = arredondar_geojson(geojson_data, casas_para(zoom=ZOOM_PADRAO))
+    formatar_propriedades(geojson_data.get("features", []))
+    return geojson_data
 
 def criar_mapa_base() -> folium.Map:
     """Cria um mapa Folium base com configurações padrão"""
@@ -371,34 +407,13 @@ def criar_mapa_base() -> folium.Map:
         prefer_canvas=True
     )
 
-def adicionar_camadas(mapa: folium.Map, geojson_data: dict, tipo_filtrado: str = "todos"):
+def adicionar_camadas(mapa: folium.Map, geojson_data: dict):
     if not geojson_data or not geojson_data.get("features"):
         st.warning("Nenhum dado de assentamento para exibir.")
         return
     
-    # Filtra features pelo tipo selecionado (se não for "todos")
+    # As features já chegam filtradas e formatadas (ver normalizar_assentamentos)
     features = geojson_data['features']
-    if tipo_filtrado != "todos":
-        features = [f for f in features if f['properties'].get('tipo_assentamento', '').lower() == tipo_filtrado.lower()]
-    
-    # Pré-processa as features para formatar os valores e garantir campos mínimos
-    campos_minimos = [
-        'cd_sipra', 'tipo_assentamento', 'nome_assentamento', 
-        'nome_municipio_original', 'num_familias', 'forma_obtecao', 
-        'area', 'perimetro'
-    ]
-    
-    for feature in features:
-        props = feature['properties']
-        
-        # Garante que todos os campos mínimos existam
-        for campo in campos_minimos:
-            if campo not in props:
-                props[campo] = "Não Disponível"
-            else:
-                props[campo] = formatar_valor(props[campo])
-    
-    # Cria um novo GeoJSON apenas com as features filtradas
     filtered_geojson = {
         "type": "FeatureCollection",
         "features": features
@@ -411,7 +426,7 @@ def adicionar_camadas(mapa: folium.Map, geojson_data: dict, tipo_filtrado: str =
         available_fields = []
     
     # Defina os campos a serem usados com fallback
-    tooltip_fields = campos_minimos
+    tooltip_fields = CAMPOS_MINIMOS
     
     # Filtre apenas campos disponíveis
     fields_to_use = [f for f in tooltip_fields if f in available_fields]
@@ -504,116 +519,115 @@ def adicionar_camadas(mapa: folium.Map, geojson_data: dict, tipo_filtrado: str =
     Fullscreen().add_to(mapa)
 
 def obter_municipios() -> list:
-    """Obtém lista de municípios da API"""
+    """Obtém lista de municípios da API (em cache, pelo limite de requisições ao backend)"""
     try:
-        url = "http://localhost:8000/assentamentos_municipios"
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        return response.json().get("municipios", [])
+        return fetch_assentamentos_municipios()
     except requests.exceptions.RequestException:
         return []
 
-def obter_estatisticas(geojson_data: dict, tipo_filtrado: str = "todos"):
+def obter_estatisticas(resultado: Optional[Resultado]):
     """Calcula estatísticas com base nos dados filtrados"""
-    if not geojson_data or not geojson_data.get("features"):
+    if not resultado:
         return {
             "total_assentamentos": 0,
             "area_total": 0,
             "area_media": 0
         }
     
-    features = geojson_data['features']
-    
-    # Aplica filtro de tipo se necessário
-    if tipo_filtrado != "todos":
-        features = [f for f in features if f['properties'].get('tipo_assentamento', '').lower() == tipo_filtrado.lower()]
-    
-    areas = []
-    for f in features:
-        area = f['properties'].get('area')
-        # Ignora valores não numéricos ou inválidos
-        if area is not None and area != "Não Disponível":
-            try:
-                area_val = float(area)
-                if not math.isnan(area_val):
-                    areas.append(area_val)
-            except (ValueError, TypeError):
-                pass
-    
-    num_assentamentos = len(features)
-    
+    # Somas vetorizadas sobre a coluna de área; valores não numéricos são ignorados
     return {
-        "total_assentamentos": num_assentamentos,
-        "area_total": round(sum(areas), 2) if areas else 0,
-        "area_media": round(sum(areas)/len(areas), 2) if areas else 0
+        "total_assentamentos": len(resultado),
+        "area_total": round(resultado.soma("area"), 2),
+        "area_media": round(resultado.media("area"), 2)
     }
 
+@st.cache_data(ttl=3600, max_entries=256, show_spinner=False)
+def estatisticas_assentamentos(municipio: str, tipo: str, versao: str) -> Dict:
+    """Etapa de estatísticas, sobre os dados completos do filtro (antes do orçamento do mapa)"""
+    return obter_estatisticas(filtrar_tipo(carregar_assentamentos(municipio, versao), tipo))
+
+@st.cache_data(ttl=3600, max_entries=64, show_spinner=False)
+def render_mapa_html(municipio: str, tipo: str, versao: str) -> Optional[Tuple[str, List[str]]]:
+    """
+    Etapa do mapa: HTML do folium para o município e o tipo, compartilhado
+    entre sessões. Devolve também as degradações aplicadas para caber no
+    orçamento de transferência (cada assentamento continua individual), ou
+    None quando não há assentamentos no filtro.
+    """
+    features = normalizar_assentamentos(municipio, versao).get("features", [])
+    if tipo != "todos":
+        # As linhas do mesmo resultado refinado das estatísticas, tiradas das
+        # features já normalizadas (uma por linha, na ordem do resultado)
+        resultado = carregar_assentamentos(municipio, versao)
+        selecionadas = np.flatnonzero(np.isin(resultado.posicoes, filtrar_tipo(resultado, tipo).posicoes))
+        features = [features[i] for i in selecionadas]
+    if not features:
+        return None
+    geojson_data, degradacoes = ajustar_geojson(
+        {"type": "FeatureCollection", "features": features}, etapas=ETAPAS_SEM_AGREGACAO
+    )
+    mapa = criar_mapa_base()
+    adicionar_camadas(mapa, geojson_data)
+    return mapa.get_root().render(), degradacoes
+
 # Carrega dados e adiciona ao mapa
 municipios = ["Todos"] + obter_municipios()
 tipos_assentamento = ["Todos", "Estadual", "Federal"]
 
-# Corpo principal
-col1, col2 = st.columns([12, 4])
-
-with col2:
-    st.markdown(f"### Filtros")
-
-    # Filtro por município
-    municipio_selecionado = st.selectbox(
-        "Selecione o município:",
-        municipios,
-        index=0
-    )
-
-    # Filtro por tipo de assentamento
-    tipo_selecionado = st.selectbox(
-        "Selecione o tipo de assentamento:",
-        tipos_assentamento,
-        index=0
-    )
-    
-    st.markdown("---")
-    st.markdown("### Informações")
-    
-    # Carrega os dados com base nos filtros selecionados
-    geojson_data = carregar_geojson(
-        municipio="todos" if municipio_selecionado == "Todos" else municipio_selecionado,
-        tipo="todos",  # Carregamos todos os tipos e filtramos depois
-        tolerancia=tolerancia
-    )
+@st.fragment
+def painel(municipios: List[str], versao: str):
+    """
+    Filtros, métricas e mapa. Num fragmento: mudar um filtro reexecuta só
+    este trecho, e as etapas em cache fazem só o que a mudança exige.
+    """
+    col1, col2 = st.columns([12, 4])
+
+    with col2:
+        st.markdown(f"### Filtros")
+
+        # Filtro por município
+        municipio_selecionado = st.selectbox(
+            "Selecione o município:",
+            municipios,
+            index=0
+        )
 
-    # Obtém estatísticas com os filtros aplicados
-    stats = obter_estatisticas(geojson_data, tipo_selecionado.lower() if tipo_selecionado != "Todos" else "todos")
-    
-    # Exibe métricas
-    st.metric("Total de assentamentos", stats["total_assentamentos"])
-    st.metric("Área total (ha)", stats["area_total"])
-    
-    if municipio_selecionado == 'Todos' and tipo_selecionado == 'Todos':
-        st.metric("Área média (ha)", stats["area_media"])
+        # Filtro por tipo de assentamento
+        tipo_selecionado = st.selectbox(
+            "Selecione o tipo de assentamento:",
+            tipos_assentamento,
+            index=0
+        )
 
-    st.markdown("---")
-    for tipo, cor in CORES_ASSENTAMENTOS.items():
-        st.markdown(f"<span style='color:{cor}; font-weight:bold'>■</span> {tipo}", unsafe_allow_html=True)
+        st.markdown("---")
+        st.markdown("### Informações")
 
-with col1:
-    # Cria o mapa base
-    mapa = criar_mapa_base()
-        
-    if geojson_data:
-        # Aplica os filtros no momento de exibição
-        adicionar_camadas(
-            mapa, 
-            geojson_data, 
-            tipo_filtrado=tipo_selecionado.lower() if tipo_selecionado != "Todos" else "todos"
-        )
-        
-        # Exibe o mapa
-        st_folium(
-            mapa,
-            width=1200,
-            height=700,
-            returned_objects=[]
-        )
-    else:
-        st.warning("Nenhum dado disponível para os filtros selecionados.")
\ No newline at end of file
+        municipio = "todos" if municipio_selecionado == "Todos" else municipio_selecionado
+        tipo = "todos" if tipo_selecionado == "Todos" else tipo_selecionado.lower()
+        try:
+            stats = estatisticas_assentamentos(municipio, tipo, versao)
+            mapa = render_mapa_html(municipio, tipo, versao)
+        except requests.exceptions.RequestException as e:
+            st.error(f"Erro ao carregar dados: {str(e)}")
+            stats, mapa = obter_estatisticas(None), None
+
+        # Exibe métricas
+        st.metric("Total de assentamentos", stats["total_assentamentos"])
+        st.metric("Área total (ha)", stats["area_total"])
+
+        if municipio_selecionado == 'Todos' and tipo_selecionado == 'Todos':
+            st.metric("Área média (ha)", stats["area_media"])
+
+        st.markdown("---")
+        for tipo_legenda, cor in CORES_ASSENTAMENTOS.items():
+            st.markdown(f"<span style='color:{cor}; font-weight:bold'>■</span> {tipo_legenda}", unsafe_allow_html=True)
+
+    with col1:
+        if mapa:
+            mapa_html, degradacoes = mapa
+            avisar_degradacoes(degradacoes)
+            html(mapa_html, width=1200, height=700)
+        else:
+            st.warning("Nenhum dado disponível para os filtros selecionados.")
+
+painel(municipios, fetch_versao_dados())
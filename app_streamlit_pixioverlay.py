@@ -4,10 +4,10 @@ import streamlit as st
 from modules.data_loader import (
     fetch_regioes,
     fetch_municipios,
-    fetch_geojson_por_regiao,
-    fetch_geojson_por_municipio,
-    fetch_geojson_limites
+    fetch_versao_dados
 )
+from modules.asset_server import publicar_json
+from modules.map_layers import DECODIFICAR_JS
 from streamlit.components.v1 import html
 import json
 
@@ -39,41 +39,39 @@ municipio = st.selectbox(
 geojson = None
 boundary_geojson = None
 if st.button("Gerar Mapa"):
+    # Recorte em memória da base estadual compartilhada entre sessões
+    # (importada aqui: geopandas só entra quando o mapa é gerado)
+    from modules.geo_store import obter_store
+    store = obter_store(fetch_versao_dados())
+    boundary_url = None
     if municipio == "(toda a região)":
-        # chama /geojson?regiao=regiao
-        try:
-            geojson = fetch_geojson_por_regiao(regiao)
-            # Busca os limites de todos os municípios da região
-            boundaries = []
-            for m in municipios:
-                try:
-                    boundary = fetch_geojson_limites(m)
-                    if boundary and boundary.get("features"):
-                        boundaries.extend(boundary["features"])
-                except:
-                    continue
-            boundary_geojson = {"type": "FeatureCollection", "features": boundaries} if boundaries else None
-        except Exception as e:
-            st.error(f"Não foi possível carregar GeoJSON da região '{regiao}':\n{e}")
-            st.stop()
+        geojson = store.propriedades.geojson(regiao=regiao)
+        # Malha municipal simplificada da região, já publicada pelo serviço de limites
+        from modules.boundaries import urls_limites
+        boundary_url = urls_limites(fetch_versao_dados(), regiao)["municipios"]
     else:
-        # chama /geojson?municipio=municipio
-        try:
-            geojson = fetch_geojson_por_municipio(municipio)
-            # Busca o limite do município específico
-            boundary_geojson = fetch_geojson_limites(municipio)
-        except Exception as e:
-            st.error(f"Não foi possível carregar GeoJSON do município '{municipio}':\n{e}")
-            st.stop()
+        geojson = store.propriedades.geojson(nome_municipio=municipio)
+        boundary_geojson = store.limites.geojson(nome_municipio=municipio)
 
     # Se retornou GeoJSON vazio ou sem features:
     if not geojson or not geojson.get("features"):
         st.warning("Nenhuma geometria encontrada para o filtro selecionado.")
         st.stop()
 
-    # 5) Converte para string JSON para injetar no HTML do PixiOverlay
-    geojson_str = json.dumps(geojson)
-    boundary_str = json.dumps(boundary_geojson) if boundary_geojson and boundary_geojson.get("features") else "null"
+    # Regiões muito grandes são reduzidas até caber no orçamento de transferência
+    from modules.payload import ETAPAS_POLIGONOS, ajustar_geojson, avisar_degradacoes
+    geojson, degradacoes = ajustar_geojson(geojson, etapas=ETAPAS_POLIGONOS)
+    avisar_degradacoes(degradacoes)
+
+    # 5) Publica os dados como arquivos estáticos com hash no nome; o HTML do
+    #    PixiOverlay recebe apenas as URLs e o navegador reaproveita o cache.
+    #    Coordenadas quantizadas para o zoom 10 em que o mapa abre; arquivos
+    #    grandes vão gzipados e o navegador descomprime (`baixarJson`)
+    from modules.precision import casas_para
+    casas = casas_para(zoom=10)
+    geojson_url = publicar_json(geojson, "propriedades", casas=casas)
+    if boundary_geojson and boundary_geojson.get("features"):
+        boundary_url = publicar_json(boundary_geojson, "limites", casas=casas)
 
     # 6) Cores para categorias (deve coincidir com o que está no backend)
     CORES = {
@@ -256,9 +254,11 @@ if st.button("Gerar Mapa"):
         <script src="https://cdnjs.cloudflare.com/ajax/libs/pixi.js/5.3.10/pixi.min.js"></script>
         <script src="https://unpkg.com/leaflet-pixi-overlay@1.9.4/L.PixiOverlay.min.js"></script>
         <script>
+              {DECODIFICAR_JS}
               const CORES = {json.dumps(CORES)};
-              const geojson = {geojson_str};
-              const boundaryGeojson = {boundary_str};
+              const geojsonUrl = {json.dumps(geojson_url)};
+              const boundaryUrl = {json.dumps(boundary_url)};
+              let geojson, boundaryGeojson;
               let map, pixiOverlay, boundaryLayer;
               const categoryContainers = {{}};
               const categoryBounds = {{}};
@@ -383,8 +383,15 @@ if st.button("Gerar Mapa"):
                 }}, mainContainer).addTo(map);
               }}
 
-              // Inicializar o mapa
-              initMap();
+              // Baixa os dados (com cache do navegador) e inicializa o mapa
+              Promise.all([
+                baixarJson(geojsonUrl).then(decodificarGeojson),
+                boundaryUrl ? baixarJson(boundaryUrl).then(decodificarGeojson) : Promise.resolve(null)
+              ]).then(([dados, limites]) => {{
+                geojson = dados;
+                boundaryGeojson = limites;
+                initMap();
+              }});
               
               // ===== FUNÇÕES DE CONTROLE =====
               
@@ -0,0 +1,211 @@
+# benchmarks/carga.py
+#
+# Teste de carga com usuários simultâneos, sem navegador:
+#
+#   python benchmarks/carga.py --sessoes 20 --interacoes 5
+#   python benchmarks/carga.py --paginas app_streamlit_folium.py --sessoes 50 --processos 8 --latencia-ms 80
+#
+# Sobe o substituto local do TerraGeo (`terrageo_local.py`) e dispara N sessões,
+# cada uma um `AppTest` de uma página, sem nada do Streamlit substituído. O
+# AppTest mantém um Runtime simulado global por run, então sessões simultâneas
+# rodam em processos separados (`--processos`), cada um como um worker do
+# servidor: os caches em memória e o agendador são do processo; a réplica e os
+# caches em disco, de todos. Cada sessão escolhe regiões, municípios e
+# categorias ao acaso e gera o mapa. O relatório traz os percentis de latência
+# dos reruns, as requisições ao backend e a memória dos processos.
+
+import argparse
+import json
+import os
+import random
+import resource
+import sys
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+RAIZ = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RAIZ))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from terrageo_local import TerraGeoLocal  # noqa: E402
+
+
+def memoria_rss_mb() -> float:
+    """Memória residente atual do processo (Linux); fora dele, o pico."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3
+
+
+def _widget(widgets, rotulo: str):
+    for w in widgets:
+        if rotulo in w.label:
+            return w
+    raise LookupError(f"Widget não encontrado: {rotulo}")
+
+
+def _escolher(at, rng: random.Random, rotulo: str, evitar=()):
+    caixa = _widget(at.selectbox, rotulo)
+    opcoes = [o for o in caixa.options if o not in evitar] or caixa.options
+    caixa.set_value(rng.choice(opcoes))
+
+
+# Uma interação por página: lista de passos; cada passo altera widgets e
+# provoca um rerun (cuja latência é medida)
+Passo = Callable[[object, random.Random], None]
+
+CENARIOS: Dict[str, List[Passo]] = {
+    "app_streamlit_folium.py": [
+        lambda at, rng: _escolher(at, rng, "região administrativa"),
+        lambda at, rng: _escolher(at, rng, "município"),
+        lambda at, rng: _widget(at.button, "Gerar Mapa").click(),
+    ],
+    "app_streamlit_folium_grupos_por_tipo.py": [
+        lambda at, rng: _escolher(at, rng, "tipo de propriedade"),
+        lambda at, rng: _escolher(at, rng, "região administrativa", evitar=["(todos)"]),
+        lambda at, rng: _widget(at.button, "Gerar Mapa").click(),
+    ],
+    "app_streamlit_pixioverlay.py": [
+        lambda at, rng: _escolher(at, rng, "região administrativa"),
+        lambda at, rng: _escolher(at, rng, "município"),
+        lambda at, rng: _widget(at.button, "Gerar Mapa").click(),
+    ],
+    "app_streamlit_map-assentamentos.py": [
+        lambda at, rng: _escolher(at, rng, "município"),
+        lambda at, rng: _escolher(at, rng, "tipo de assentamento"),
+    ],
+    "app_shapefile.py": [
+        lambda at, rng: _escolher(at, rng, "tipo de propriedade"),
+        lambda at, rng: _widget(at.button, "Buscar Propriedades").click(),
+    ],
+}
+
+
+class Sessao:
+    """Um usuário: abre a página e repete as interações do cenário."""
+
+    def __init__(self, pagina: str, semente: int, timeout: float):
+        self.pagina = pagina
+        self.rng = random.Random(semente)
+        self.timeout = timeout
+        self.latencias: List[float] = []
+        self.erros: List[str] = []
+        # Memória e threads do processo que rodou a sessão (antes, depois)
+        self.memoria_mb = (0.0, 0.0)
+        self.threads = 0
+
+    def _rerun(self, at) -> None:
+        inicio = time.perf_counter()
+        at.run(timeout=self.timeout)
+        self.latencias.append(time.perf_counter() - inicio)
+        self.erros.extend(str(e.value) for e in at.exception)
+
+    def executar(self, interacoes: int) -> "Sessao":
+        from streamlit.testing.v1 import AppTest
+        try:
+            at = AppTest.from_file(str(RAIZ / self.pagina), default_timeout=self.timeout)
+            self._rerun(at)
+            for _ in range(interacoes):
+                for passo in CENARIOS[self.pagina]:
+                    passo(at, self.rng)
+                    self._rerun(at)
+        except Exception as e:  # widget ausente, timeout...
+            self.erros.append(f"{type(e).__name__}: {e}")
+        return self
+
+
+def _iniciar_processo(base_url: str) -> None:
+    """Cada processo do pool aponta as páginas para o backend local."""
+    import modules.data_loader as data_loader
+    data_loader.BASE_URL = base_url
+
+
+def _executar_sessao(sessao: Sessao, interacoes: int) -> Sessao:
+    antes = memoria_rss_mb()
+    sessao.executar(interacoes)
+    sessao.memoria_mb = (antes, memoria_rss_mb())
+    sessao.threads = threading.active_count()
+    return sessao
+
+
+def _percentis(valores: List[float]) -> str:
+    if not valores:
+        return "-"
+    p50, p90, p99 = np.percentile(valores, [50, 90, 99])
+    return f"p50 {p50:6.3f}s  p90 {p90:6.3f}s  p99 {p99:6.3f}s  máx {max(valores):6.3f}s"
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Teste de carga das páginas Streamlit com o TerraGeo local")
+    parser.add_argument("--sessoes", type=int, default=10)
+    parser.add_argument("--interacoes", type=int, default=3)
+    parser.add_argument("--paginas", nargs="*", default=list(CENARIOS), choices=list(CENARIOS))
+    parser.add_argument("--parcelas", type=int, default=20000)
+    parser.add_argument("--vertices", type=int, default=16)
+    parser.add_argument("--latencia-ms", type=float, default=0)
+    parser.add_argument("--porta", type=int, default=8000)
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--processos", type=int, default=4, help="sessões simultâneas (uma por processo)")
+    parser.add_argument("--json", type=Path, help="grava o relatório também em JSON")
+    args = parser.parse_args(argv)
+
+    backend = TerraGeoLocal(args.parcelas, args.vertices, latencia_ms=args.latencia_ms)
+    base_url = backend.iniciar(porta=args.porta)
+    processos = max(1, min(args.processos, args.sessoes))
+
+    sessoes = [Sessao(args.paginas[i % len(args.paginas)], i, args.timeout) for i in range(args.sessoes)]
+    print(f"{args.sessoes} sessões x {args.interacoes} interações em {processos} processos, backend {base_url} "
+          f"({backend.versao}, latência {args.latencia_ms:g} ms)")
+
+    inicio = time.perf_counter()
+    # spawn: cada processo importa as páginas do zero, como um worker novo
+    with ProcessPoolExecutor(processos, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_iniciar_processo, initargs=(base_url,)) as pool:
+        sessoes = list(pool.map(_executar_sessao, sessoes, [args.interacoes] * len(sessoes)))
+    duracao = time.perf_counter() - inicio
+    metricas = backend.metricas()
+
+    crescimento = [depois - antes for antes, depois in (s.memoria_mb for s in sessoes)]
+    relatorio = {"duracao_s": duracao, "processos": processos, "paginas": {}, "backend": metricas,
+                 "memoria_mb": {"maxima_por_processo": max(depois for _, depois in (s.memoria_mb for s in sessoes)),
+                                "por_sessao": float(np.mean(crescimento))},
+                 "threads_ativas": max(s.threads for s in sessoes)}
+
+    print(f"\nLatência dos reruns (duração total {duracao:.1f}s):")
+    for pagina in args.paginas:
+        da_pagina = [s for s in sessoes if s.pagina == pagina]
+        latencias = [l for s in da_pagina for l in s.latencias]
+        erros = [e for s in da_pagina for e in s.erros]
+        relatorio["paginas"][pagina] = {
+            "sessoes": len(da_pagina), "reruns": len(latencias), "erros": erros,
+            "latencias_s": latencias,
+        }
+        print(f"  {pagina:42s} {len(latencias):4d} reruns  {_percentis(latencias)}  erros {len(erros)}")
+        for erro in sorted(set(erros))[:3]:
+            print(f"      {erro[:150]}")
+
+    print(f"\nBackend: {metricas['total']} requisições "
+          f"({metricas['total'] / max(1, args.sessoes):.1f}/sessão), {metricas['bytes_enviados'] / 1e6:.1f} MB enviados")
+    for endpoint, n in sorted(metricas["requisicoes"].items(), key=lambda x: -x[1]):
+        print(f"  {endpoint:28s} {n}")
+    print(f"\nMemória: até {relatorio['memoria_mb']['maxima_por_processo']:.0f} MB por processo "
+          f"({relatorio['memoria_mb']['por_sessao']:+.1f} MB/sessão)")
+
+    if args.json:
+        args.json.write_text(json.dumps(relatorio, indent=2, ensure_ascii=False))
+    return 1 if any(s.erros for s in sessoes) else 0
+
+
+if __name__ == "__main__":
+    # Pelo nome do módulo: o AppTest troca o `__main__` dos processos do pool
+    # pela página, e as sessões e funções enviadas a eles precisam ser achadas
+    import carga
+    sys.exit(carga.main())
@@ -0,0 +1,132 @@
+# benchmarks/dados_sinteticos.py
+#
+# Fixtures sintéticas na escala do Ceará (184 municípios em 14 regiões),
+# geradas de forma determinística a partir de uma semente: propriedades,
+# limites municipais e assentamentos com os mesmos atributos do backend.
+
+import math
+from typing import Dict, List
+
+import geopandas as gpd
+import numpy as np
+import shapely
+
+# Envelope aproximado do Ceará (lon/lat)
+BBOX_CEARA = (-41.42, -7.86, -37.25, -2.78)
+N_MUNICIPIOS = 184
+N_REGIOES = 14
+
+CATEGORIAS = [
+    "Pequena Propriedade < 1 MF",
+    "Pequena Propriedade",
+    "Média Propriedade",
+    "Grande Propriedade",
+    "Sem Classificação",
+]
+PROPORCAO_CATEGORIAS = [0.45, 0.30, 0.15, 0.05, 0.05]
+
+# Hectares por grau² no equador
+_HA_POR_GRAU2 = 111.32 ** 2 * 100
+
+
+def _grade_municipios() -> List[Dict]:
+    """Divide o envelope em células retangulares, uma por município."""
+    minx, miny, maxx, maxy = BBOX_CEARA
+    colunas = math.ceil(math.sqrt(N_MUNICIPIOS * (maxx - minx) / (maxy - miny)))
+    linhas = math.ceil(N_MUNICIPIOS / colunas)
+    dx, dy = (maxx - minx) / colunas, (maxy - miny) / linhas
+    celulas = []
+    for i in range(N_MUNICIPIOS):
+        c, l = i % colunas, i // colunas
+        celulas.append({
+            "nome_municipio": f"Municipio {i + 1:03d}",
+            "regiao": f"Regiao {c * N_REGIOES // colunas + 1:02d}",
+            "bounds": (minx + c * dx, miny + l * dy, minx + (c + 1) * dx, miny + (l + 1) * dy),
+        })
+    return celulas
+
+
+def _poligonos(rng: np.random.Generator, cx: np.ndarray, cy: np.ndarray, raio: np.ndarray, vertices: int):
+    """Polígonos estrelados (sempre válidos) com `vertices` vértices em torno de cada centro."""
+    n = len(cx)
+    angulos = np.sort(rng.uniform(0, 2 * np.pi, (n, vertices)), axis=1)
+    r = raio[:, None] * rng.uniform(0.6, 1.0, (n, vertices))
+    xy = np.stack([cx[:, None] + r * np.cos(angulos), cy[:, None] + r * np.sin(angulos)], axis=-1)
+    xy = np.concatenate([xy, xy[:, :1]], axis=1)  # fecha o anel
+    return shapely.polygons(xy)
+
+
+def _area_ha(geometrias, lat: np.ndarray) -> np.ndarray:
+    return shapely.area(geometrias) * _HA_POR_GRAU2 * np.cos(np.radians(lat))
+
+
+def gerar(parcelas: int = 20000, vertices: int = 16, semente: int = 42) -> Dict[str, gpd.GeoDataFrame]:
+    """
+    Gera as camadas sintéticas.
+
+    `parcelas` é o total de propriedades no estado e `vertices` o nº de
+    vértices de cada polígono (densidade da geometria).
+    """
+    rng = np.random.default_rng(semente)
+    municipios = _grade_municipios()
+
+    # Limites: o retângulo de cada município, densificado como um limite real
+    limites = gpd.GeoDataFrame(
+        {
+            "nome_municipio": [m["nome_municipio"] for m in municipios],
+            "regiao": [m["regiao"] for m in municipios],
+        },
+        geometry=shapely.segmentize(
+            shapely.box(*np.array([m["bounds"] for m in municipios]).T), 0.01
+        ),
+        crs="EPSG:4326",
+    )
+
+    # Propriedades: distribuídas uniformemente entre os municípios
+    idx = rng.integers(0, N_MUNICIPIOS, parcelas)
+    bounds = np.array([m["bounds"] for m in municipios])[idx]
+    cx = rng.uniform(bounds[:, 0], bounds[:, 2])
+    cy = rng.uniform(bounds[:, 1], bounds[:, 3])
+    # Raios log-normais: de ~1 ha a alguns milhares de ha
+    raio = np.clip(rng.lognormal(math.log(0.003), 0.9, parcelas), 0.0005, 0.03)
+    geometrias = _poligonos(rng, cx, cy, raio, vertices)
+    area = _area_ha(geometrias, cy)
+    nomes = np.array([m["nome_municipio"] for m in municipios])[idx]
+    propriedades = gpd.GeoDataFrame(
+        {
+            "categoria": rng.choice(CATEGORIAS, parcelas, p=PROPORCAO_CATEGORIAS),
+            "area": area.round(4),
+            "nome_municipio": nomes,
+            "modulo_fiscal": rng.choice([5.0, 10.0, 20.0, 30.0, 40.0, 55.0], parcelas),
+            "nome_municipio_original": np.char.upper(nomes.astype(str)),
+            "regiao": np.array([m["regiao"] for m in municipios])[idx],
+        },
+        geometry=geometrias,
+        crs="EPSG:4326",
+    )
+
+    # Assentamentos: ~1% das parcelas, maiores e com os atributos do INCRA
+    n_ass = max(10, parcelas // 100)
+    idx = rng.integers(0, N_MUNICIPIOS, n_ass)
+    bounds = np.array([m["bounds"] for m in municipios])[idx]
+    cx = rng.uniform(bounds[:, 0], bounds[:, 2])
+    cy = rng.uniform(bounds[:, 1], bounds[:, 3])
+    geometrias = _poligonos(rng, cx, cy, np.clip(rng.lognormal(math.log(0.02), 0.5, n_ass), 0.005, 0.06), vertices * 2)
+    nomes = np.array([m["nome_municipio"] for m in municipios])[idx]
+    assentamentos = gpd.GeoDataFrame(
+        {
+            "cd_sipra": [f"CE{n:07d}" for n in rng.integers(0, 10 ** 7, n_ass)],
+            "tipo_assentamento": rng.choice(["Estadual", "Federal"], n_ass),
+            "nome_assentamento": [f"Assentamento {i + 1}" for i in range(n_ass)],
+            "nome_municipio": nomes,
+            "nome_municipio_original": np.char.upper(nomes.astype(str)),
+            "num_familias": rng.integers(5, 400, n_ass),
+            "forma_obtecao": rng.choice(["Desapropriação", "Compra", "Doação", None], n_ass),
+            "area": _area_ha(geometrias, cy).round(2),
+            "perimetro": (shapely.length(geometrias) * 111.32).round(2),
+        },
+        geometry=geometrias,
+        crs="EPSG:4326",
+    )
+
+    return {"propriedades": propriedades, "limites": limites, "assentamentos": assentamentos}
@@ -0,0 +1,310 @@
+# benchmarks/desempenho.py
+#
+# Benchmarks offline dos caminhos quentes de geometria e renderização:
+#
+#   python benchmarks/desempenho.py                      # compara com baseline.json
+#   python benchmarks/desempenho.py --salvar-baseline    # grava um novo baseline
+#   python benchmarks/desempenho.py --parcelas 200000 --vertices 32 --casos simplify_geojson
+#
+# Roda sobre fixtures sintéticas (ver `dados_sinteticos.py`), sem backend nem
+# navegador. Para cada caso mede o tempo (melhor de N repetições), o pico de
+# memória alocada pelo Python (tracemalloc; memória interna do GEOS não entra)
+# e o tamanho da saída. Sai com código 1 se algum caso regredir além da
+# tolerância em relação ao baseline gravado com a mesma escala.
+
+import argparse
+import ast
+import copy
+import gc
+import json
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+RAIZ = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RAIZ))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import dados_sinteticos  # noqa: E402
+
+BASELINE = Path(__file__).resolve().parent / "baseline.json"
+
+# Regressão = valor acima do baseline por mais que esta fração
+TOLERANCIA = {"tempo_s": 0.30, "pico_mb": 0.20, "saida_bytes": 0.05}
+# Casos cujo tempo varia mais entre execuções que a tolerância geral. No
+# pixioverlay_html (codificação + gzip de 8 MB por repetição), o mesmo código
+# mediu de 0,47 s a 0,83 s em execuções completas da suíte
+TOLERANCIA_POR_CASO = {"pixioverlay_html": {"tempo_s": 0.75}}
+# Diferenças de tempo abaixo disso são ruído de medição
+TEMPO_MINIMO_S = 0.01
+
+
+def carregar_da_pagina(arquivo: str, funcoes: Iterable[str] = (), atribuicoes: Iterable[str] = ()) -> Dict[str, Any]:
+    """
+    Extrai funções e constantes de uma página Streamlit sem executar a interface.
+
+    As páginas executam widgets no nível do módulo, então não podem ser
+    importadas. Aqui só os imports, as constantes literais do topo, as funções
+    pedidas e as atribuições nomeadas em `atribuicoes` (em qualquer nível,
+    ex.: dentro de um `if st.button(...)`) são compiladas e executadas.
+    """
+    arvore = ast.parse((RAIZ / arquivo).read_text(encoding="utf-8"))
+    funcoes, atribuicoes = set(funcoes), set(atribuicoes)
+    corpo = []
+    for no in arvore.body:
+        if isinstance(no, (ast.Import, ast.ImportFrom)):
+            corpo.append(no)
+        elif isinstance(no, ast.FunctionDef) and no.name in funcoes:
+            corpo.append(no)
+        elif isinstance(no, ast.Assign):
+            try:
+                ast.literal_eval(no.value)
+            except ValueError:
+                continue
+            corpo.append(no)
+    for no in ast.walk(arvore):
+        if isinstance(no, ast.Assign) and any(isinstance(a, ast.Name) and a.id in atribuicoes for a in no.targets):
+            corpo.append(no)
+    namespace: Dict[str, Any] = {"__name__": f"benchmark:{arquivo}"}
+    exec(compile(ast.Module(body=corpo, type_ignores=[]), arquivo, "exec"), namespace)
+    return namespace
+
+
+def _expressao(arquivo: str, nome: str) -> Any:
+    """Código compilado do lado direito da atribuição `nome = ...` de uma página."""
+    arvore = ast.parse((RAIZ / arquivo).read_text(encoding="utf-8"))
+    for no in ast.walk(arvore):
+        if isinstance(no, ast.Assign) and any(isinstance(a, ast.Name) and a.id == nome for a in no.targets):
+            return compile(ast.Expression(no.value), arquivo, "eval")
+    raise KeyError(f"{nome} não encontrado em {arquivo}")
+
+
+def _tamanho(saida: Any) -> int:
+    if saida is None:
+        return 0
+    if isinstance(saida, (bytes, str)):
+        return len(saida)
+    if isinstance(saida, Path):
+        return sum(f.stat().st_size for f in saida.parent.glob(saida.stem + ".*"))
+    if isinstance(saida, tuple):
+        return _tamanho(saida[0])
+    if hasattr(saida, "para_geojson_bytes"):
+        return len(saida.para_geojson_bytes())
+    if hasattr(saida, "to_json"):
+        return len(saida.to_json())
+    return len(json.dumps(saida, separators=(",", ":"), default=str))
+
+
+# Cada caso recebe as fixtures e devolve a função a ser medida (a preparação
+# fora dela não entra no tempo)
+
+def caso_simplify_geojson(dados):
+    pagina = carregar_da_pagina("app_streamlit_folium.py", ["simplify_geojson"])
+    geojson = dados["propriedades_geojson"]
+    return lambda: pagina["simplify_geojson"](geojson, 0.001)
+
+
+def caso_get_map_center(dados):
+    from modules.ragged import FeicoesCompactas
+    pagina = carregar_da_pagina("app_streamlit_folium.py", ["get_map_center"])
+    feicoes = FeicoesCompactas.de_geojson(dados["propriedades_geojson"])
+    return lambda: pagina["get_map_center"](feicoes)
+
+
+def caso_camada_categorias(dados):
+    import folium
+    from modules.map_layers import CamadaCategorias, estilos_por_categoria
+    pagina = carregar_da_pagina("app_streamlit_folium.py")
+    estilos = estilos_por_categoria(pagina["CORES"], color="#000", weight=0.5, fillOpacity=0.6)
+    geojson = dados["propriedades_geojson"]
+
+    def executar():
+        m = folium.Map(location=[-5.2, -39.0], zoom_start=8, tiles=None)
+        CamadaCategorias(
+            geojson, estilos,
+            campos=["nome_municipio", "area", "categoria"],
+            aliases=["Município:", "Área (ha):", "Categoria:"]
+        ).add_to(m)
+        return m.get_root().render()
+    return executar
+
+
+def caso_calcular_resumo_areas(dados):
+    pagina = carregar_da_pagina("app_shapefile.py", ["calcular_resumo_areas"])
+    gdf = dados["propriedades"].drop(columns="geometry")
+    return lambda: pagina["calcular_resumo_areas"](gdf.copy())
+
+
+def caso_gerar_shapefile_local(dados):
+    from modules.parallel_export import preparar_exportacao
+    pagina = carregar_da_pagina("app_shapefile.py", ["nome_exportacao"])
+    destino = Path(tempfile.mkdtemp(prefix="bench_shp_")) / f"{pagina['nome_exportacao']('Todas')}.shp"
+    gdf = dados["propriedades"]
+
+    def executar():
+        # O mesmo preparo e gravação de cada parte da exportação (ver modules.parallel_export)
+        preparar_exportacao(gdf).to_file(destino, driver="ESRI Shapefile", encoding="utf-8")
+        return destino
+    return executar
+
+
+def caso_pixioverlay_html(dados):
+    import modules.asset_server as asset_server
+    asset_server.ASSETS_DIR = Path(tempfile.mkdtemp(prefix="bench_assets_"))
+    pagina = carregar_da_pagina("app_streamlit_pixioverlay.py", atribuicoes=["CORES"])
+    html_code = _expressao("app_streamlit_pixioverlay.py", "html_code")
+    geojson, limites = dados["propriedades_geojson"], dados["limites_geojson"]
+
+    def executar():
+        # Cada repetição publica conteúdo novo, como uma seleção ainda não vista
+        pagina["geojson_url"] = pagina["publicar_json"](
+            dict(geojson, _rodada=time.perf_counter_ns()), "propriedades", casas=6
+        )
+        pagina["boundary_url"] = pagina["publicar_json"](limites, "limites", casas=6)
+        return eval(html_code, pagina)
+    return executar
+
+
+def caso_mapa_municipio(dados):
+    # Caminho da página no modo município: simplificação, orçamento,
+    # publicação dos payloads e HTML do folium (sem o cache da função)
+    import modules.asset_server as asset_server
+    pagina = carregar_da_pagina(
+        "app_streamlit_folium.py", ["simplify_geojson", "get_map_center", "render_mapa_html"]
+    )
+    pagina["fetch_geojson_por_municipio"] = lambda municipio: dados["propriedades_geojson"]
+    pagina["fetch_geojson_limites"] = lambda municipio: dados["limites_geojson"]
+    render = pagina["render_mapa_html"].__wrapped__
+
+    def executar():
+        # Pasta nova a cada repetição: os payloads são gravados (e gzipados) de verdade
+        asset_server.ASSETS_DIR = Path(tempfile.mkdtemp(prefix="bench_assets_"))
+        return render("Regiao 01", "Municipio 001", pagina["TOLERANCIA"], "benchmark")
+    return executar
+
+
+def caso_adicionar_camadas(dados):
+    pagina = carregar_da_pagina(
+        "app_streamlit_map-assentamentos.py",
+        ["formatar_valor", "formatar_propriedades", "criar_mapa_base", "adicionar_camadas"]
+    )
+    original = dados["assentamentos_geojson"]
+
+    def executar():
+        mapa = pagina["criar_mapa_base"]()
+        geojson = copy.deepcopy(original)
+        pagina["formatar_propriedades"](geojson["features"])
+        pagina["adicionar_camadas"](mapa, geojson)
+        return mapa.get_root().render()
+    return executar
+
+
+def caso_renderizar_png(dados):
+    from modules.raster_export import renderizar_png
+    pagina = carregar_da_pagina("app_streamlit_folium.py")
+    return lambda: renderizar_png(dados["propriedades"], pagina["CORES"], dados["limites"], largura=2000)
+
+
+def caso_estimar_payload(dados):
+    from modules.payload import estimar_bytes
+    return lambda: str(estimar_bytes(dados["propriedades"]))
+
+
+CASOS: Dict[str, Callable] = {
+    "simplify_geojson": caso_simplify_geojson,
+    "get_map_center": caso_get_map_center,
+    "camada_categorias": caso_camada_categorias,
+    "calcular_resumo_areas": caso_calcular_resumo_areas,
+    "gerar_shapefile_local": caso_gerar_shapefile_local,
+    "pixioverlay_html": caso_pixioverlay_html,
+    "mapa_municipio": caso_mapa_municipio,
+    "adicionar_camadas": caso_adicionar_camadas,
+    "renderizar_png": caso_renderizar_png,
+    "estimar_payload": caso_estimar_payload,
+}
+
+
+def medir(executar: Callable[[], Any], repeticoes: int) -> Dict[str, float]:
+    """Melhor tempo de `repeticoes` execuções, pico de memória e tamanho da saída."""
+    tempos = []
+    for _ in range(repeticoes):
+        gc.collect()
+        inicio = time.perf_counter()
+        saida = executar()
+        tempos.append(time.perf_counter() - inicio)
+    tracemalloc.start()
+    executar()
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"tempo_s": min(tempos), "pico_mb": pico / 1e6, "saida_bytes": _tamanho(saida)}
+
+
+def comparar(resultados: Dict[str, Dict], baseline: Dict[str, Dict]) -> List[str]:
+    """Lista as regressões em relação ao baseline."""
+    regressoes = []
+    for caso, medidas in resultados.items():
+        base = baseline.get(caso)
+        if not base:
+            continue
+        for metrica, tolerancia in dict(TOLERANCIA, **TOLERANCIA_POR_CASO.get(caso, {})).items():
+            if metrica == "tempo_s" and medidas[metrica] - base.get(metrica, 0) < TEMPO_MINIMO_S:
+                continue
+            if base.get(metrica) and medidas[metrica] > base[metrica] * (1 + tolerancia):
+                regressoes.append(
+                    f"{caso}: {metrica} {medidas[metrica]:.4g} > baseline {base[metrica]:.4g} (+{tolerancia:.0%})"
+                )
+    return regressoes
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks offline dos caminhos quentes de geometria e renderização")
+    parser.add_argument("--parcelas", type=int, default=20000)
+    parser.add_argument("--vertices", type=int, default=16)
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--casos", nargs="*", default=list(CASOS), choices=list(CASOS))
+    parser.add_argument("--salvar-baseline", action="store_true")
+    args = parser.parse_args(argv)
+
+    escala = {"parcelas": args.parcelas, "vertices": args.vertices}
+    print(f"Gerando fixtures: {args.parcelas} parcelas, {args.vertices} vértices...")
+    dados = dados_sinteticos.gerar(**escala)
+    for nome in ("propriedades", "limites", "assentamentos"):
+        dados[f"{nome}_geojson"] = json.loads(dados[nome].to_json(drop_id=True))
+
+    resultados = {}
+    print(f"{'caso':24s} {'tempo (s)':>10s} {'pico (MB)':>10s} {'saída (KB)':>11s}")
+    for nome in args.casos:
+        medidas = medir(CASOS[nome](dados), args.repeticoes)
+        resultados[nome] = medidas
+        print(f"{nome:24s} {medidas['tempo_s']:10.4f} {medidas['pico_mb']:10.1f} {medidas['saida_bytes'] / 1e3:11.1f}")
+
+    if args.salvar_baseline:
+        anterior = json.loads(BASELINE.read_text()) if BASELINE.exists() else {}
+        casos = anterior.get("casos", {}) if anterior.get("escala") == escala else {}
+        casos.update(resultados)
+        BASELINE.write_text(json.dumps({"escala": escala, "casos": casos}, indent=2, sort_keys=True) + "\n")
+        print(f"\nBaseline gravado em {BASELINE}")
+        return 0
+
+    if not BASELINE.exists():
+        print("\nSem baseline; rode com --salvar-baseline para criar um.")
+        return 0
+    baseline = json.loads(BASELINE.read_text())
+    if baseline.get("escala") != escala:
+        print(f"\nBaseline gravado com outra escala ({baseline.get('escala')}); comparação ignorada.")
+        return 0
+    regressoes = comparar(resultados, baseline["casos"])
+    if regressoes:
+        print("\nRegressões:")
+        for r in regressoes:
+            print(f"  {r}")
+        return 1
+    print("\nSem regressões em relação ao baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+# benchmarks/inicializacao.py
+#
+# Mede o tempo de inicialização das páginas:
+#
+#   python benchmarks/inicializacao.py
+#
+# - "isolada": cada página em um processo Python novo, como quando cada uma
+#   roda no seu próprio `streamlit run` (import + primeira renderização);
+# - "app.py": o ponto de entrada multipage em um processo novo, abrindo as
+#   páginas uma após a outra (a partir da segunda, os módulos já estão carregados).
+#
+# Para cada medição também lista quais dependências pesadas foram importadas.
+# As páginas chamam o backend TerraGeo (TERRAGEO_URL); sem ele, os tempos
+# incluem as mensagens de erro, mas continuam comparáveis entre si.
+
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+RAIZ = Path(__file__).resolve().parent.parent
+
+PAGINAS = [
+    "app_streamlit_folium.py",
+    "app_streamlit_folium_grupos_por_tipo.py",
+    "app_streamlit_pixioverlay.py",
+    "app_streamlit_map-assentamentos.py",
+    "app_shapefile.py",
+]
+
+PESADOS = ["geopandas", "pandas", "shapely", "folium", "PIL.Image", "numpy", "requests"]
+
+_MEDIR_PAGINA = """
+import json, sys, time
+inicio = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+streamlit_s = time.perf_counter() - inicio
+t = time.perf_counter()
+at = AppTest.from_file(sys.argv[1], default_timeout=300).run()
+print(json.dumps({
+    "streamlit_s": streamlit_s,
+    "render_s": time.perf_counter() - t,
+    "erros": len(at.exception),
+    "pesados": [m for m in json.loads(sys.argv[2]) if m in sys.modules],
+}))
+"""
+
+_MEDIR_MULTIPAGE = """
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+paginas = json.loads(sys.argv[1])
+resultados = []
+t = time.perf_counter()
+at = AppTest.from_file(sys.argv[3], default_timeout=300).run()
+resultados.append({"pagina": paginas[0], "render_s": time.perf_counter() - t, "erros": len(at.exception),
+                   "pesados": [m for m in json.loads(sys.argv[2]) if m in sys.modules]})
+for pagina in paginas[1:]:
+    t = time.perf_counter()
+    at.switch_page(pagina).run()
+    resultados.append({"pagina": pagina, "render_s": time.perf_counter() - t, "erros": len(at.exception),
+                       "pesados": [m for m in json.loads(sys.argv[2]) if m in sys.modules]})
+print(json.dumps(resultados))
+"""
+
+
+def _rodar(codigo: str, *args: str):
+    saida = subprocess.run(
+        [sys.executable, "-c", codigo, *args],
+        cwd=RAIZ, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(saida.strip().splitlines()[-1])
+
+
+def main() -> None:
+    print("Páginas isoladas (um processo por página):")
+    total = 0.0
+    for pagina in PAGINAS:
+        r = _rodar(_MEDIR_PAGINA, str(RAIZ / pagina), json.dumps(PESADOS))
+        total += r["streamlit_s"] + r["render_s"]
+        print(f"  {pagina:45s} streamlit {r['streamlit_s']:.2f}s  1ª renderização {r['render_s']:.2f}s"
+              f"  erros {r['erros']}  [{', '.join(r['pesados'])}]")
+    print(f"  soma: {total:.2f}s")
+
+    print("\napp.py (um processo, páginas abertas em sequência):")
+    resultados = _rodar(_MEDIR_MULTIPAGE, json.dumps(PAGINAS), json.dumps(PESADOS), str(RAIZ / "app.py"))
+    for r in resultados:
+        print(f"  {r['pagina']:45s} 1ª renderização {r['render_s']:.2f}s  erros {r['erros']}"
+              f"  [{', '.join(r['pesados'])}]")
+    print(f"  soma: {sum(r['render_s'] for r in resultados):.2f}s")
+
+
+if __name__ == "__main__":
+    main()
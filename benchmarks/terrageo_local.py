@@ -0,0 +1,157 @@
+# benchmarks/terrageo_local.py
+#
+# Substituto local do backend TerraGeo, servindo as fixtures sintéticas
+# (ver `dados_sinteticos.py`) com os mesmos endpoints usados pelas páginas:
+#
+#   python benchmarks/terrageo_local.py --porta 8000 --parcelas 20000
+#
+# Conta as requisições por endpoint (GET /_metricas; /_metricas?zerar=1 zera)
+# e pode simular a latência do backend real com --latencia-ms.
+
+import argparse
+import hashlib
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+import dados_sinteticos
+
+
+def _colecao(features: List[str]) -> bytes:
+    # Features já serializadas: montar a resposta é só concatenar bytes
+    return ('{"type":"FeatureCollection","features":[' + ",".join(features) + "]}").encode("utf-8")
+
+
+class TerraGeoLocal:
+    """Dados pré-serializados por município e contadores de requisições."""
+
+    def __init__(self, parcelas: int = 20000, vertices: int = 16, semente: int = 42, latencia_ms: float = 0):
+        camadas = dados_sinteticos.gerar(parcelas, vertices, semente)
+        self.versao = f"sintetico-{parcelas}-{vertices}-{semente}"
+        self.latencia = latencia_ms / 1000
+        self.regioes: Dict[str, List[str]] = {}
+        for municipio, regiao in camadas["limites"][["nome_municipio", "regiao"]].itertuples(index=False):
+            self.regioes.setdefault(regiao, []).append(municipio)
+
+        def por_municipio(gdf, coluna="nome_municipio") -> Dict[str, List[str]]:
+            features = json.loads(gdf.drop(columns=[c for c in ["regiao"] if c in gdf.columns]).to_json(drop_id=True))["features"]
+            agrupado: Dict[str, List[str]] = {}
+            for f in features:
+                agrupado.setdefault(f["properties"][coluna], []).append(json.dumps(f, separators=(",", ":")))
+            return agrupado
+
+        self.propriedades = por_municipio(camadas["propriedades"])
+        self.limites = por_municipio(camadas["limites"])
+        self.assentamentos = por_municipio(camadas["assentamentos"])
+        self.tipos_assentamento = {
+            m: [json.loads(f)["properties"]["tipo_assentamento"].lower() for f in fs]
+            for m, fs in self.assentamentos.items()
+        }
+        self.contagem: Counter = Counter()
+        self.bytes_enviados = 0
+        self._lock = threading.Lock()
+
+    def municipios(self, regiao: Optional[str] = None) -> List[str]:
+        if regiao is not None:
+            return self.regioes.get(regiao, [])
+        return [m for ms in self.regioes.values() for m in ms]
+
+    def responder(self, caminho: str, q: Dict[str, str]) -> Optional[bytes]:
+        """Corpo JSON da resposta, ou None para 404."""
+        if caminho == "/regioes":
+            return json.dumps({"regioes": list(self.regioes)}).encode()
+        if caminho == "/municipios":
+            municipios = self.municipios(q.get("regiao"))
+            return json.dumps({"municipios": municipios}).encode() if municipios else None
+        if caminho == "/municipios_todos":
+            return json.dumps({"municipios": self.municipios()}).encode()
+        if caminho == "/versao":
+            return json.dumps({"versao": self.versao}).encode()
+        if caminho in ("/geojson", "/geojson_muni"):
+            municipios = [q["municipio"]] if "municipio" in q else self.municipios(q.get("regiao"))
+            return _colecao([f for m in municipios for f in self.propriedades.get(m, [])])
+        if caminho == "/geojson_limites":
+            return _colecao(self.limites.get(q.get("municipio"), []))
+        if caminho == "/geojson_assentamentos":
+            municipio = q.get("municipio", "todos")
+            tipo = q.get("tipo", "todos").lower()
+            municipios = self.assentamentos if municipio == "todos" else [municipio]
+            return _colecao([
+                f for m in municipios
+                for f, t in zip(self.assentamentos.get(m, []), self.tipos_assentamento.get(m, []))
+                if tipo == "todos" or t == tipo
+            ])
+        if caminho == "/versoes_municipios":
+            # Hash por camada e município: a réplica local só baixa o que mudou
+            return json.dumps({
+                camada: {m: hashlib.sha256("".join(fs).encode()).hexdigest() for m, fs in dados.items()}
+                for camada, dados in (("propriedades", self.propriedades), ("limites", self.limites),
+                                      ("assentamentos", self.assentamentos))
+            }).encode()
+        if caminho in ("/assentamentos_municipio", "/assentamentos_municipios"):
+            return json.dumps({"municipios": sorted(self.assentamentos)}).encode()
+        return None
+
+    def metricas(self, zerar: bool = False) -> Dict:
+        with self._lock:
+            dados = {"requisicoes": dict(self.contagem), "total": sum(self.contagem.values()),
+                     "bytes_enviados": self.bytes_enviados}
+            if zerar:
+                self.contagem.clear()
+                self.bytes_enviados = 0
+        return dados
+
+    def servidor(self, host: str = "127.0.0.1", porta: int = 8000) -> ThreadingHTTPServer:
+        backend = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                q = {k: v[0] for k, v in parse_qs(url.query).items()}
+                if url.path == "/_metricas":
+                    corpo = json.dumps(backend.metricas("zerar" in q)).encode()
+                else:
+                    if backend.latencia:
+                        time.sleep(backend.latencia)
+                    corpo = backend.responder(url.path, q)
+                    with backend._lock:
+                        backend.contagem[url.path] += 1
+                        backend.bytes_enviados += len(corpo or b"")
+                if corpo is None:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(corpo)))
+                self.end_headers()
+                self.wfile.write(corpo)
+
+        servidor = ThreadingHTTPServer((host, porta), _Handler)
+        servidor.daemon_threads = True
+        return servidor
+
+    def iniciar(self, host: str = "127.0.0.1", porta: int = 8000) -> str:
+        """Sobe o servidor em uma thread e retorna a URL base."""
+        servidor = self.servidor(host, porta)
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+        return f"http://{host}:{servidor.server_address[1]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backend TerraGeo local com dados sintéticos")
+    parser.add_argument("--porta", type=int, default=8000)
+    parser.add_argument("--parcelas", type=int, default=20000)
+    parser.add_argument("--vertices", type=int, default=16)
+    parser.add_argument("--latencia-ms", type=float, default=0)
+    args = parser.parse_args()
+    backend = TerraGeoLocal(args.parcelas, args.vertices, latencia_ms=args.latencia_ms)
+    print(f"TerraGeo local em http://127.0.0.1:{args.porta} ({backend.versao})")
+    backend.servidor(porta=args.porta).serve_forever()
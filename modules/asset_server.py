@@ -0,0 +1,241 @@
+# modules/asset_server.py
+
+import gzip
+import hashlib
+import json
+import logging
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+import streamlit as st
+
+# Pasta onde os payloads dos mapas são gravados com nome derivado do conteúdo
+ASSETS_DIR = Path(st.secrets.get("ASSETS_DIR", "static_assets"))
+ASSETS_HOST = st.secrets.get("ASSETS_HOST", "127.0.0.1")
+ASSETS_PORT = int(st.secrets.get("ASSETS_PORT", 8502))
+# URL pública do servidor (ex.: atrás de proxy reverso). Obrigatória quando o
+# app é acessado de outra máquina: sem ela, a URL é local e só funciona para um
+# navegador no próprio servidor
+ASSETS_URL = st.secrets.get("ASSETS_URL", "").rstrip("/")
+# Assets não publicados de novo há mais que isso são apagados (na partida e a cada hora)
+ASSETS_IDADE_MAXIMA_S = float(st.secrets.get("ASSETS_IDADE_MAXIMA_DIAS", 7)) * 24 * 3600
+LIMPEZA_INTERVALO_S = 3600
+# Endereços do navegador que alcançam a URL local padrão
+HOSTS_LOCAIS = {"localhost", "::1"}
+
+# JSON publicado acima deste tamanho vai gzipado (`.json.gz`), descomprimido no
+# navegador com `DecompressionStream` (ver `modules.map_layers.DECODIFICAR_JS`)
+COMPRIMIR_ACIMA_BYTES = 8 * 1024
+# Nível do gzip dos arquivos publicados: a compressão roda no rerun que publica
+# uma seleção nova, e num payload de 8 MB o nível 1 leva ~0,07 s contra ~0,38 s
+# do nível 6, por ~15% a mais de bytes (que o navegador baixa uma vez só)
+NIVEL_GZIP = 1
+
+# Arquivos com hash no nome nunca mudam, então o navegador pode guardá-los por 1 ano
+# (respostas transmitidas aos poucos vão com no-store)
+CACHE_IMUTAVEL = "public, max-age=31536000, immutable"
+
+logger = logging.getLogger(__name__)
+
+# Rotas dinâmicas registradas por outros módulos: prefixo -> função(caminho) -> (corpo, content-type),
+# onde o corpo é `bytes` ou um iterável de `bytes` transmitido aos poucos
+Corpo = Union[bytes, Iterable[bytes]]
+_ROTAS: Dict[str, Callable[[str], Optional[Tuple[Corpo, str]]]] = {}
+
+
+def registrar_rota(prefixo: str, handler: Callable[[str], Optional[Tuple[Corpo, str]]]) -> None:
+    """Registra um gerador de respostas para caminhos que começam com `prefixo`."""
+    _ROTAS["/" + prefixo.strip("/") + "/"] = handler
+
+
+class _AssetHandler(SimpleHTTPRequestHandler):
+    """Serve arquivos de ASSETS_DIR e rotas dinâmicas com cabeçalhos de cache longo."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, directory=str(ASSETS_DIR), **kwargs)
+
+    def end_headers(self):
+        self.send_header("Access-Control-Allow-Origin", "*")
+        if getattr(self, "_cacheavel", True):
+            self.send_header("Cache-Control", CACHE_IMUTAVEL)
+        super().end_headers()
+
+    def do_GET(self):
+        caminho = urlsplit(self.path).path
+        for prefixo, handler in _ROTAS.items():
+            if caminho.startswith(prefixo):
+                self._responder_rota(handler, caminho[len(prefixo):])
+                return
+        super().do_GET()
+
+    def _responder_rota(self, handler, resto: str):
+        try:
+            resposta = handler(resto)
+        except Exception as e:
+            self._cacheavel = False
+            self.send_error(500, str(e))
+            return
+        if resposta is None:
+            self._cacheavel = False
+            self.send_error(404)
+            return
+        corpo, content_type = resposta
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        if isinstance(corpo, (bytes, bytearray)):
+            self.send_header("Content-Length", str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+            return
+        # Corpo iterável: cada pedaço é enviado assim que fica pronto (HTTP/1.0
+        # sem Content-Length; o fim da resposta é o fechamento da conexão).
+        # Um stream pode levar erros passageiros (ex.: um município que falhou),
+        # então não vai para o cache do navegador
+        self._cacheavel = False
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        try:
+            for pedaco in corpo:
+                self.wfile.write(pedaco)
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # O navegador desistiu da resposta (ex.: novo rerun)
+            pass
+
+    def send_error(self, code, message=None, explain=None):
+        self._cacheavel = False
+        super().send_error(code, message, explain)
+
+    def log_message(self, format, *args):
+        # Silencia o log padrão para não poluir o terminal do Streamlit
+        pass
+
+
+@st.cache_resource
+def _iniciar_servidor() -> str:
+    """Inicia (uma vez por processo) o servidor de assets e a limpeza periódica; retorna a URL base."""
+    ASSETS_DIR.mkdir(parents=True, exist_ok=True)
+    try:
+        servidor = ThreadingHTTPServer((ASSETS_HOST, ASSETS_PORT), _AssetHandler)
+    except OSError as e:
+        if ASSETS_URL:
+            # A URL configurada leva a essa porta, e o processo que a ocupa não
+            # tem os arquivos publicados nem as rotas dinâmicas deste
+            raise RuntimeError(
+                f"Porta {ASSETS_PORT} do servidor de assets ocupada ({e}), e ASSETS_URL aponta para ela: "
+                f"configure um ASSETS_PORT (e um ASSETS_URL) próprio para cada processo do Streamlit."
+            ) from e
+        # Sem URL configurada, qualquer porta livre: o processo serve os próprios arquivos e rotas
+        logger.warning("Porta %s do servidor de assets ocupada (%s); usando uma porta livre", ASSETS_PORT, e)
+        servidor = ThreadingHTTPServer((ASSETS_HOST, 0), _AssetHandler)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    threading.Thread(target=_limpar_periodicamente, name="limpeza-assets", daemon=True).start()
+    host = ASSETS_HOST if ASSETS_HOST not in ("", "0.0.0.0", "::") else "127.0.0.1"
+    return ASSETS_URL or f"http://{host}:{servidor.server_address[1]}"
+
+
+def iniciar_servidor() -> str:
+    """
+    Inicia o servidor de assets (uma vez por processo) e retorna a URL base
+    usada pelo navegador. Sem `ASSETS_URL`, essa URL é local: se o app foi
+    aberto de outra máquina, levanta RuntimeError em vez de devolver uma URL
+    que o navegador não alcança.
+    """
+    url = _iniciar_servidor()
+    if not ASSETS_URL and not _acesso_local():
+        raise RuntimeError(
+            "O app foi aberto de outra máquina, mas o servidor de assets só é alcançável localmente: "
+            "configure ASSETS_URL (e ASSETS_HOST) em .streamlit/secrets.toml."
+        )
+    return url
+
+
+def _acesso_local() -> bool:
+    """O navegador da sessão atual abriu o app na própria máquina (fora de uma sessão, conta como local)."""
+    url = st.context.url
+    host = urlsplit(url).hostname if url else None
+    return host is None or host in HOSTS_LOCAIS or host.startswith("127.")
+
+
+def publicar_json(dados, prefixo: str = "mapa", casas: Optional[int] = None) -> str:
+    """
+    Grava `dados` como JSON compacto em arquivo nomeado pelo hash do conteúdo.
+
+    Retorna a URL do arquivo. Como o nome muda sempre que o conteúdo muda,
+    o navegador reaproveita o download em reruns com os mesmos dados.
+    Com `casas`, um GeoJSON (ou uma coleção `FeicoesCompactas`) vai
+    quantizado e em delta (ver `modules.precision.codificar_bytes`). Arquivos grandes vão gzipados; quem lê
+    usa `baixarJson` e `decodificarGeojson` de `DECODIFICAR_JS`.
+    """
+    if casas is not None:
+        from modules.precision import codificar_bytes  # importação tardia: puxa shapely
+        texto = codificar_bytes(dados, casas)
+    else:
+        texto = json.dumps(dados, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    return publicar_json_bytes(texto, prefixo)
+
+
+def publicar_json_bytes(texto: bytes, prefixo: str) -> str:
+    """Publica JSON já serializado, gzipado quando passa de `COMPRIMIR_ACIMA_BYTES`."""
+    if len(texto) > COMPRIMIR_ACIMA_BYTES:
+        return publicar_bytes(texto, prefixo, "json.gz", gravar=comprimir)
+    return publicar_bytes(texto, prefixo, "json")
+
+
+def comprimir(conteudo: bytes, nivel: int = NIVEL_GZIP) -> bytes:
+    """Gzip determinístico (sem data no cabeçalho), para o hash do nome não mudar entre reruns."""
+    return gzip.compress(conteudo, compresslevel=nivel, mtime=0)
+
+
+def publicar_bytes(
+    conteudo: bytes, prefixo: str, extensao: str, gravar: Optional[Callable[[bytes], bytes]] = None
+) -> str:
+    """
+    Grava bytes arbitrários com nome baseado em hash e retorna a URL.
+
+    `gravar` transforma o conteúdo só na hora de criar o arquivo (ex.:
+    `comprimir`); o nome vem do conteúdo original, então um rerun com os
+    mesmos dados não paga a transformação de novo.
+    """
+    base_url = iniciar_servidor()
+    digest = hashlib.sha256(conteudo).hexdigest()[:20]
+    nome = f"{prefixo}-{digest}.{extensao}"
+    caminho = ASSETS_DIR / nome
+    if not caminho.exists():
+        temporario = caminho.with_name(f"{nome}.{threading.get_ident()}.tmp")
+        temporario.write_bytes(gravar(conteudo) if gravar else conteudo)
+        temporario.replace(caminho)
+    else:
+        # Atualiza o mtime para que a limpeza preserve arquivos em uso
+        caminho.touch()
+    return f"{base_url}/{nome}"
+
+
+def limpar_assets(idade_maxima: float = ASSETS_IDADE_MAXIMA_S) -> int:
+    """Remove assets não publicados de novo há mais de `idade_maxima` segundos."""
+    if not ASSETS_DIR.exists():
+        return 0
+    limite = time.time() - idade_maxima
+    removidos = 0
+    for arquivo in ASSETS_DIR.glob("*.*"):
+        if arquivo.is_file() and arquivo.stat().st_mtime < limite:
+            arquivo.unlink(missing_ok=True)
+            removidos += 1
+    return removidos
+
+
+def _limpar_periodicamente() -> None:
+    """Laço da thread de limpeza: cada payload tem nome próprio, então a pasta só cresce sem ela."""
+    while True:
+        try:
+            removidos = limpar_assets()
+            if removidos:
+                logger.info("%d assets antigos removidos de %s", removidos, ASSETS_DIR)
+        except OSError:
+            logger.exception("Falha ao limpar %s", ASSETS_DIR)
+        time.sleep(LIMPEZA_INTERVALO_S)
@@ -0,0 +1,163 @@
+# modules/boundaries.py
+
+import os
+import shutil
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import geopandas as gpd
+import numpy as np
+import shapely
+import streamlit as st
+
+from modules.asset_server import publicar_json_bytes
+from modules.geo_store import CamadaIndexada, carregar_limites, store_em_memoria
+from modules.precision import casas_para, codificar_features, colecao_codificada
+from modules.ragged import FeicoesCompactas
+
+# Cache em disco dos limites derivados: LIMITES_DIR/<versao>/{regioes,municipios}.geojson
+LIMITES_DIR = Path(st.secrets.get("LIMITES_DIR", "limites_cache"))
+
+# Tolerâncias de simplificação (graus) dos contornos regionais e da malha municipal
+TOLERANCIA_REGIOES = 0.005
+TOLERANCIA_MUNICIPIOS = 0.002
+
+# A partir deste zoom as linhas municipais aparecem sobre os contornos das regiões
+ZOOM_MUNICIPIOS = 9
+
+# Coordenadas servidas quantizadas e em delta, na precisão de um mapa estadual
+CASAS = casas_para()
+
+
+def _simplificar_cobertura(geometrias: np.ndarray, tolerancia: float) -> np.ndarray:
+    """
+    Simplifica polígonos que se tocam mantendo as divisas compartilhadas
+    idênticas (sem frestas nem sobreposições entre vizinhos). Sem suporte do
+    GEOS, ou com uma cobertura inválida, cai na simplificação por geometria.
+    """
+    try:
+        return shapely.coverage_simplify(geometrias, tolerancia)
+    except (AttributeError, shapely.errors.GEOSException):
+        return shapely.simplify(geometrias, tolerancia, preserve_topology=True)
+
+
+def _serializar(gdf: gpd.GeoDataFrame) -> np.ndarray:
+    """Uma string JSON codificada (ver `modules.precision`) por feição, na ordem das linhas."""
+    if gdf.empty:
+        return np.array([], dtype=object)
+    return np.array(codificar_features(FeicoesCompactas.de_gdf(gdf), CASAS), dtype=object)
+
+
+class ServicoLimites:
+    """
+    Limites prontos para servir: o contorno dissolvido de cada região
+    administrativa e a malha municipal simplificada do estado inteiro.
+
+    Ambos derivam dos limites municipais, são gravados em disco por
+    versão dos dados e serializados uma única vez; uma região é só um recorte
+    por índice das strings já prontas.
+    """
+
+    ARQUIVOS = {"regioes": "regioes.geojson", "municipios": "municipios.geojson"}
+
+    def __init__(self, regioes: gpd.GeoDataFrame, municipios: gpd.GeoDataFrame):
+        self.regioes = CamadaIndexada(regioes, ["regiao"])
+        self.municipios = CamadaIndexada(municipios, ["regiao", "nome_municipio"])
+        self._json_regioes = _serializar(regioes)
+        self._json_municipios = _serializar(municipios)
+
+    @classmethod
+    def construir(cls, limites: gpd.GeoDataFrame) -> "ServicoLimites":
+        """Dissolve as regiões e simplifica as duas camadas a partir dos limites municipais."""
+        limites = limites[["nome_municipio", "regiao", "geometry"]].astype({"nome_municipio": object, "regiao": object})
+        limites = limites[~limites.geometry.is_empty & limites.geometry.notna()].reset_index(drop=True)
+
+        regioes = limites.dissolve("regiao", as_index=False)[["regiao", "geometry"]]
+        regioes["municipios"] = regioes["regiao"].map(limites["regiao"].value_counts()).astype(int)
+        regioes["geometry"] = _simplificar_cobertura(regioes.geometry.values, TOLERANCIA_REGIOES)
+
+        municipios = limites.assign(
+            geometry=_simplificar_cobertura(limites.geometry.values, TOLERANCIA_MUNICIPIOS)
+        )
+        return cls(regioes, municipios)
+
+    @classmethod
+    def ler(cls, pasta: Path) -> Optional["ServicoLimites"]:
+        """Lê as camadas gravadas por `gravar`, ou None se ainda não existem."""
+        caminhos = {nome: pasta / arquivo for nome, arquivo in cls.ARQUIVOS.items()}
+        if not all(c.exists() for c in caminhos.values()):
+            return None
+        return cls(*(gpd.read_file(caminhos[nome]) for nome in ("regioes", "municipios")))
+
+    def gravar(self, pasta: Path) -> None:
+        pasta.mkdir(parents=True, exist_ok=True)
+        for nome, arquivo in self.ARQUIVOS.items():
+            # Grava e renomeia: um processo concorrente nunca lê um arquivo pela metade
+            temporario = pasta / f".{arquivo}.{os.getpid()}"
+            # Em disco fica GeoJSON comum (legível pelo GDAL em `ler`)
+            camada = self.regioes if nome == "regioes" else self.municipios
+            temporario.write_text(camada.gdf.to_json(drop_id=True), encoding="utf-8")
+            temporario.replace(pasta / arquivo)
+
+    def geojson_bytes(self, camada: str, regiao: Optional[str] = None) -> bytes:
+        """GeoJSON de `camada` ("regioes" ou "municipios"), opcionalmente só de uma região."""
+        indexada, serializadas = (
+            (self.regioes, self._json_regioes) if camada == "regioes"
+            else (self.municipios, self._json_municipios)
+        )
+        return colecao_codificada(serializadas[indexada.posicoes(regiao=regiao)], CASAS)
+
+    def bounds(self, regiao: Optional[str] = None) -> Optional[List[List[float]]]:
+        """Enquadramento [[sul, oeste], [norte, leste]] da região (ou do estado)."""
+        selecao = self.regioes.gdf.iloc[self.regioes.posicoes(regiao=regiao)]
+        if selecao.empty:
+            return None
+        b = selecao.total_bounds
+        if not np.all(np.isfinite(b)):
+            return None
+        return [[float(b[1]), float(b[0])], [float(b[3]), float(b[2])]]
+
+
+@st.cache_resource(ttl=3600, max_entries=1, show_spinner="Preparando os limites regionais e municipais...")
+def obter_limites(versao: str) -> ServicoLimites:
+    """
+    Serviço de limites da versão `versao` dos dados, compartilhado entre sessões.
+
+    Usa o que já estiver gravado em disco para a versão; só na primeira vez
+    os limites municipais são lidos para dissolver e simplificar. Eles vêm
+    do store se ele já está em memória; senão só a camada de limites é
+    buscada, sem esperar propriedades e assentamentos do estado inteiro.
+    """
+    pasta = LIMITES_DIR / versao
+    servico = ServicoLimites.ler(pasta)
+    if servico is None:
+        store = store_em_memoria(versao)
+        limites = store.limites.gdf if store is not None else carregar_limites()
+        servico = ServicoLimites.construir(limites)
+        servico.gravar(pasta)
+        _remover_outras_versoes(versao)
+    return servico
+
+
+def _remover_outras_versoes(versao: str) -> None:
+    """
+    Apaga as pastas das outras versões em LIMITES_DIR. Sem /versao no
+    backend a versão muda a cada hora, e cada uma deixaria a sua pasta.
+    """
+    for pasta in LIMITES_DIR.iterdir():
+        if pasta.is_dir() and pasta.name != versao:
+            shutil.rmtree(pasta, ignore_errors=True)
+
+
+@st.cache_data(ttl=3600, max_entries=64, show_spinner=False)
+def urls_limites(versao: str, regiao: Optional[str] = None) -> Dict:
+    """
+    URLs (servidor de assets) dos contornos de todas as regiões e da malha
+    municipal de `regiao` (None = estado inteiro), com o enquadramento do mapa.
+    """
+    servico = obter_limites(versao)
+    return {
+        "regioes": publicar_json_bytes(servico.geojson_bytes("regioes"), "regioes"),
+        "municipios": publicar_json_bytes(servico.geojson_bytes("municipios", regiao), "limites"),
+        "bounds": servico.bounds(regiao),
+    }
@@ -0,0 +1,62 @@
+# modules/category_partition.py
+
+from typing import Optional, Tuple
+
+import numpy as np
+import streamlit as st
+
+from modules.asset_server import publicar_json_bytes
+from modules.geo_store import CamadaIndexada, obter_store
+from modules.precision import casas_para, codificar_features, colecao_codificada
+from modules.ragged import FeicoesCompactas
+
+# Coordenadas servidas quantizadas e em delta, na precisão de um mapa estadual
+CASAS = casas_para()
+
+
+def _features_serializadas(camada: CamadaIndexada, tolerancia: float) -> np.ndarray:
+    """Cada feição da camada já simplificada e codificada (uma string JSON por linha)."""
+    gdf = camada.gdf
+    if gdf.empty:
+        return np.array([], dtype=object)
+    gdf = gdf.assign(geometry=gdf.geometry.simplify(tolerancia)) if tolerancia else gdf
+    return np.array(codificar_features(FeicoesCompactas.de_gdf(gdf), CASAS), dtype=object)
+
+
+class ParticaoCategorias:
+    """
+    Partição estadual das propriedades por categoria, pronta para servir.
+
+    As geometrias são simplificadas e serializadas uma única vez; trocar de
+    categoria ou de região é só cruzar os índices do store e concatenar as
+    strings já prontas de cada feição.
+    """
+
+    def __init__(self, versao: str, tolerancia: float):
+        store = obter_store(versao)
+        self.propriedades = store.propriedades
+        self._json_propriedades = _features_serializadas(store.propriedades, tolerancia)
+
+    def geojson_bytes(self, categoria: Optional[str], regiao: Optional[str] = None) -> bytes:
+        return colecao_codificada(
+            self._json_propriedades[self.propriedades.posicoes(categoria=categoria, regiao=regiao)], CASAS
+        )
+
+    def quantidade(self, categoria: Optional[str], regiao: Optional[str] = None) -> int:
+        return len(self.propriedades.posicoes(categoria=categoria, regiao=regiao))
+
+
+@st.cache_resource(ttl=3600, max_entries=2, show_spinner="Preparando a partição estadual por categoria...")
+def obter_particao(versao: str, tolerancia: float = 0.001) -> ParticaoCategorias:
+    """Partição por categoria da versão `versao` dos dados, compartilhada entre sessões."""
+    return ParticaoCategorias(versao, tolerancia)
+
+
+@st.cache_data(ttl=3600, max_entries=256, show_spinner=False)
+def url_categoria(versao: str, categoria: str, regiao: Optional[str], tolerancia: float = 0.001) -> Tuple[str, int]:
+    """URL (servidor de assets) do GeoJSON da categoria na região, e a quantidade de feições."""
+    particao = obter_particao(versao, tolerancia)
+    return (
+        publicar_json_bytes(particao.geojson_bytes(categoria, regiao), "categoria"),
+        particao.quantidade(categoria, regiao),
+    )
@@ -0,0 +1,49 @@
+# modules/chunked_fetch.py
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Sequence, Tuple, TypeVar
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+Parte = TypeVar("Parte")
+
+
+def buscar_em_partes(
+    buscar: Callable[[Parte], List[Dict]],
+    partes: Sequence[Parte],
+    workers: int = 8,
+    tentativas: int = 3,
+    espera_s: float = 1.0,
+) -> Tuple[List[Dict], List[Parte]]:
+    """
+    Busca uma coleção grande repartida em `partes` (ex.: municípios), em
+    paralelo, e junta as feições na ordem das partes.
+
+    Uma parte que falha não derruba as outras: ao fim de cada rodada só as
+    que falharam são pedidas de novo, com espera crescente entre rodadas.
+    Devolve as feições obtidas e as partes que falharam em todas as tentativas.
+    """
+    resultados: Dict[int, List[Dict]] = {}
+    pendentes = list(range(len(partes)))
+    for rodada in range(tentativas):
+        if not pendentes:
+            break
+        if rodada:
+            time.sleep(espera_s * 2 ** (rodada - 1))
+        falhas = []
+        with ThreadPoolExecutor(min(workers, len(pendentes)), thread_name_prefix="partes") as pool:
+            futuros = {pool.submit(buscar, partes[i]): i for i in pendentes}
+            for futuro in as_completed(futuros):
+                i = futuros[futuro]
+                try:
+                    resultados[i] = futuro.result()
+                except (requests.exceptions.RequestException, ValueError) as e:
+                    logger.warning("Falha ao buscar a parte %s (tentativa %d): %s", partes[i], rodada + 1, e)
+                    falhas.append(i)
+        pendentes = sorted(falhas)
+    features = [f for i in sorted(resultados) for f in resultados[i]]
+    return features, [partes[i] for i in pendentes]
@@ -1,22 +1,67 @@
 # modules/data_loader.py
 
+import json
+import sqlite3
+import time
 import requests
 import streamlit as st
 from typing import Dict, List, Optional
 
+from modules.chunked_fetch import buscar_em_partes
+from modules.replica import REPLICA_SINCRONIZAR, obter_replica
+from modules.request_scheduler import em_lote_na_sessao, obter_agendador
+
 BASE_URL = st.secrets.get("TERRAGEO_URL", "http://127.0.0.1:8000")
+# Requisições simultâneas na busca estadual em partes (um município por parte)
+MAX_WORKERS = int(st.secrets.get("TERRAGEO_WORKERS", 8))
+# Rodadas de nova tentativa para as partes que falharem
+TENTATIVAS_PARTES = 3
+
+
+def _get(caminho: str, params: Optional[Dict] = None, timeout: float = 120) -> requests.Response:
+    """
+    GET no TerraGeo dentro do limite global de requisições do processo
+    (ver `modules.request_scheduler`): interativa por padrão, lote dentro
+    de `em_lote()` ou de `em_lote_na_sessao`.
+    """
+    with obter_agendador().vaga():
+        return requests.get(f"{BASE_URL}{caminho}", params=params, timeout=timeout)
+
+def metricas_backend() -> Dict:
+    """Vagas em uso, profundidade das filas e tempos de espera das requisições ao TerraGeo."""
+    return obter_agendador().metricas()
+
+def _da_replica(camada: str, **filtros) -> Optional[Dict]:
+    """
+    GeoJSON lido da réplica local (ver `modules.replica`), ou None quando ela
+    ainda não foi sincronizada ou não pôde ser lida: aí o backend responde.
+    """
+    replica = obter_replica()
+    if not replica.disponivel():
+        return None
+    try:
+        geojson = replica.geojson(camada, **filtros)
+    except (OSError, sqlite3.Error):
+        return None
+    return geojson
 
 @st.cache_data(ttl=3600)
 def fetch_regioes() -> List[str]:
     """Busca todas as regiões administrativas."""
-    resp = requests.get(f"{BASE_URL}/regioes", timeout=120)
+    regioes = obter_replica().regioes()
+    if regioes:
+        return list(regioes)
+    resp = _get("/regioes")
     resp.raise_for_status()
     return resp.json().get("regioes", [])
 
 @st.cache_data(ttl=3600)
 def fetch_municipios(regiao: str) -> List[str]:
     """Busca municípios de uma região específica."""
-    resp = requests.get(f"{BASE_URL}/municipios", params={"regiao": regiao}, timeout=120)
+    regioes = obter_replica().regioes()
+    if regiao in regioes:
+        return regioes[regiao]
+    resp = _get("/municipios", params={"regiao": regiao})
     if resp.status_code == 404:
         return []
     resp.raise_for_status()
@@ -25,7 +70,10 @@ def fetch_municipios(regiao: str) -> List[str]:
 @st.cache_data(ttl=3600)
 def fetch_municipios_all() -> List[str]:
     """Busca TODOS os municípios do Ceará."""
-    resp = requests.get(f"{BASE_URL}/municipios_todos", timeout=120)
+    regioes = obter_replica().regioes()
+    if regioes:
+        return [m for municipios in regioes.values() for m in municipios]
+    resp = _get("/municipios_todos")
     if resp.status_code == 404:
         return []
     resp.raise_for_status()
@@ -34,50 +82,223 @@ def fetch_municipios_all() -> List[str]:
 @st.cache_data(ttl=3600)
 def fetch_geojson_municipio(municipio: str) -> Dict:
     """Busca GeoJSON específico de um município."""
-    resp = requests.get(f"{BASE_URL}/geojson_muni", params={"municipio": municipio}, timeout=120)
+    local = _da_replica("propriedades", nome_municipio=municipio)
+    if local is not None:
+        return local
+    resp = _get("/geojson_muni", params={"municipio": municipio})
+    if resp.status_code == 404:
+        return {"type": "FeatureCollection", "features": []}
+    resp.raise_for_status()
+    return resp.json()
+
+@st.cache_data(ttl=3600)
+def fetch_versao_anunciada() -> Optional[str]:
+    """Versão atual da base cadastral anunciada pelo backend em /versao, ou None se ele não a expõe."""
+    try:
+        resp = _get("/versao", timeout=10)
+        if resp.ok:
+            versao = resp.json().get("versao")
+            if versao:
+                return str(versao)
+    except (requests.exceptions.RequestException, ValueError):
+        pass
+    return None
+
+def fetch_versao_backend() -> str:
+    """
+    Busca a versão atual da base cadastral no backend.
+
+    Se o backend não expõe /versao, usa a hora corrente: a versão muda no mesmo
+    ritmo em que os caches de 1 hora dos loaders expiram.
+    """
+    return fetch_versao_anunciada() or time.strftime("%Y%m%d%H")
+
+def fetch_versao_dados() -> str:
+    """
+    Versão dos dados servidos às páginas (chave dos caches derivados).
+
+    Com a réplica local sincronizada, é a versão da réplica, que é de onde os
+    loaders leem; uma versão nova anunciada pelo backend dispara a
+    sincronização em segundo plano e passa a valer quando ela termina. A
+    versão por hora de um backend sem /versao não dispara nada (seria uma
+    ressincronização estadual por hora): aí a réplica é atualizada com
+    `python -m modules.replica`. Sem réplica, é a versão do backend.
+    """
+    anunciada = fetch_versao_anunciada()
+    replica = obter_replica()
+    if REPLICA_SINCRONIZAR and anunciada:
+        replica.sincronizar_em_segundo_plano(BASE_URL, anunciada)
+    return replica.versao() or fetch_versao_backend()
+
+@st.cache_data(ttl=3600)
+def fetch_geojson_por_municipio(municipio: str) -> Dict:
+    """Busca GeoJSON das propriedades de um município (/geojson?municipio=...)."""
+    local = _da_replica("propriedades", nome_municipio=municipio)
+    if local is not None:
+        return local
+    resp = _get("/geojson", params={"municipio": municipio})
+    if resp.status_code == 404:
+        return {"type": "FeatureCollection", "features": []}
+    resp.raise_for_status()
+    return resp.json()
+
+def fetch_geojson_por_regiao(regiao: str) -> Dict:
+    """
+    Busca GeoJSON das propriedades de uma região.
+
+    A região é montada a partir dos municípios dela, pelo mesmo cache de
+    `fetch_geojson_por_municipio`: as visões por região e por município
+    compartilham um download, e só os municípios que ainda não estão no
+    cache são buscados, em paralelo. Se algum falhar em todas as
+    tentativas, levanta RequestException (os que chegaram continuam no
+    cache e não são pedidos de novo).
+    """
+    local = _da_replica("propriedades", regiao=regiao)
+    if local is not None:
+        return local
+    municipios = fetch_municipios(regiao)
+    if not municipios:
+        return {"type": "FeatureCollection", "features": []}
+    features, falhas = buscar_em_partes(
+        em_lote_na_sessao(lambda m: fetch_geojson_por_municipio(m).get("features", [])),
+        municipios,
+        workers=MAX_WORKERS,
+        tentativas=TENTATIVAS_PARTES
+    )
+    if falhas:
+        raise requests.exceptions.RequestException(
+            f"Propriedades de {len(falhas)} de {len(municipios)} municípios da região "
+            f"{regiao} não puderam ser carregadas: {', '.join(falhas)}"
+        )
+    return {"type": "FeatureCollection", "features": features}
+
+@st.cache_data(ttl=3600)
+def fetch_geojson_limites(municipio: str) -> Dict:
+    """Busca GeoJSON do limite político-administrativo de um município."""
+    local = _da_replica("limites", nome_municipio=municipio)
+    if local is not None:
+        return local
+    resp = _get("/geojson_limites", params={"municipio": municipio})
     if resp.status_code == 404:
         return {"type": "FeatureCollection", "features": []}
     resp.raise_for_status()
     return resp.json()
 
-@st.cache_data(ttl=3600, hash_funcs={dict: lambda _: None})
+def _assentamentos_da_replica(municipio: Optional[str], tolerance: Optional[float],
+                              decimals: Optional[int], tipo: Optional[str] = None) -> Optional[Dict]:
+    """Assentamentos da réplica, com os filtros, a simplificação e o arredondamento que o backend faria."""
+    tipo = tipo.lower() if tipo else None
+    geojson = _da_replica("assentamentos", nome_municipio=municipio, tipo=tipo)
+    if geojson is not None and municipio and not geojson["features"]:
+        # O backend aceita também o nome original (não normalizado) do município
+        geojson = _da_replica("assentamentos", nome_municipio_original=municipio, tipo=tipo)
+    if not geojson or not geojson["features"] or (tolerance is None and decimals is None):
+        return geojson
+    import numpy as np
+    import shapely
+    com_geometria = [f for f in geojson["features"] if f.get("geometry")]
+    geometrias = shapely.from_geojson([json.dumps(f["geometry"]) for f in com_geometria])
+    if tolerance is not None:
+        geometrias = shapely.simplify(geometrias, tolerance, preserve_topology=True)
+    if decimals is not None:
+        geometrias = shapely.transform(geometrias, lambda c: np.round(c, decimals))
+    for f, g in zip(com_geometria, shapely.to_geojson(geometrias)):
+        f["geometry"] = json.loads(g)
+    return geojson
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def _fetch_assentamentos_parte(
+    municipio: Optional[str],
+    tolerance: Optional[float],
+    decimals: Optional[int],
+    tipo: Optional[str]
+) -> Dict:
+    """
+    Uma requisição a /geojson_assentamentos (município None = estado inteiro).
+    Falhas levantam exceção e, por isso, não ficam no cache.
+    """
+    params = {}
+    if municipio:
+        params["municipio"] = municipio
+    if tipo:
+        params["tipo"] = tipo
+    if tolerance is not None:
+        params["tolerance"] = tolerance
+    if decimals is not None:
+        params["decimals"] = decimals
+
+    resp = _get("/geojson_assentamentos", params=params)
+    if resp.status_code == 404:
+        return {"type": "FeatureCollection", "features": []}
+    resp.raise_for_status()
+    return resp.json()
+
+def _fetch_assentamentos_estado(
+    tolerance: Optional[float],
+    decimals: Optional[int],
+    tipo: Optional[str]
+) -> Dict:
+    """
+    Assentamentos do estado inteiro, buscados município a município em paralelo.
+
+    Cada município fica no cache por conta própria. Se algum falhar em
+    todas as tentativas, levanta RequestException em vez de devolver um
+    estado parcial que quem chama guardaria em cache; a próxima chamada
+    busca só os que faltaram, sem repetir os que já chegaram.
+    """
+    try:
+        municipios = fetch_assentamentos_municipios()
+    except requests.exceptions.RequestException:
+        municipios = []
+    if not municipios:
+        # Sem a lista de municípios não há como repartir: uma requisição estadual
+        return _fetch_assentamentos_parte(None, tolerance, decimals, tipo)
+
+    features, falhas = buscar_em_partes(
+        em_lote_na_sessao(lambda m: _fetch_assentamentos_parte(m, tolerance, decimals, tipo).get("features", [])),
+        municipios,
+        workers=MAX_WORKERS,
+        tentativas=TENTATIVAS_PARTES
+    )
+    if falhas:
+        raise requests.exceptions.RequestException(
+            f"Assentamentos de {len(falhas)} de {len(municipios)} municípios não puderam ser "
+            f"carregados: {', '.join(falhas)}"
+        )
+    return {"type": "FeatureCollection", "features": features}
+
 def fetch_geojson_assentamentos(
     municipio: Optional[str] = None,
     tolerance: Optional[float] = None,
-    decimals: Optional[int] = None
+    decimals: Optional[int] = None,
+    tipo: Optional[str] = None
 ) -> Dict:
     """
     Busca dados de assentamentos em formato GeoJSON.
+
+    Sem município, o estado inteiro é buscado em partes (um município por
+    requisição, em paralelo) e montado num único GeoJSON. Falhas do backend
+    levantam RequestException: quem guarda o resultado em cache não guarda
+    um "nenhum assentamento" que era só uma falha passageira.
     
     Args:
         municipio: Filtro por município (opcional)
         tolerance: Tolerância de simplificação da geometria (opcional)
         decimals: Número de casas decimais nas coordenadas (opcional)
+        tipo: Filtro por tipo de assentamento, 'estadual' ou 'federal' (opcional)
     """
-    params = {}
+    local = _assentamentos_da_replica(municipio, tolerance, decimals, tipo)
+    if local is not None:
+        return local
+
     if municipio:
-        params["municipio"] = municipio
-    if tolerance is not None:
-        params["tolerance"] = tolerance
-    if decimals is not None:
-        params["decimals"] = decimals
-    
-    try:
-        resp = requests.get(f"{BASE_URL}/geojson_assentamentos", params=params, timeout=120)
-        
-        if resp.status_code == 404:
-            return {"type": "FeatureCollection", "features": []}
-        
-        resp.raise_for_status()
-        return resp.json()
-    except requests.exceptions.RequestException as e:
-        st.error(f"Erro na requisição: {str(e)}")
-        return {"type": "FeatureCollection", "features": []}
+        return _fetch_assentamentos_parte(municipio, tolerance, decimals, tipo)
+    return _fetch_assentamentos_estado(tolerance, decimals, tipo)
 
 @st.cache_data(ttl=3600)
 def fetch_assentamentos_municipios() -> List[str]:
     """Busca todos os municípios que possuem assentamentos."""
-    resp = requests.get(f"{BASE_URL}/assentamentos_municipio", timeout=120)
+    resp = _get("/assentamentos_municipio")
     if resp.status_code == 404:
         return []
     
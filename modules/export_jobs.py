@@ -0,0 +1,179 @@
+# modules/export_jobs.py
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import streamlit as st
+
+from modules.parallel_export import exportar_estado
+
+# Exportações executadas ao mesmo tempo (cada uma já usa um pool de processos)
+TRABALHOS_SIMULTANEOS = int(st.secrets.get("EXPORTACAO_TRABALHOS", 1))
+
+# Estados de um trabalho
+NA_FILA = "na fila"
+EXECUTANDO = "executando"
+CONCLUIDO = "concluído"
+FALHOU = "falhou"
+
+# Manifesto gravado na pasta do trabalho quando ele termina
+MANIFESTO = "trabalho.json"
+
+# Trabalhos terminados há mais que isso saem da fila e do disco (verificado no máximo a cada hora)
+IDADE_MAXIMA_S = float(st.secrets.get("EXPORTACAO_IDADE_MAXIMA_DIAS", 7)) * 24 * 3600
+LIMPEZA_INTERVALO_S = 3600
+
+logger = logging.getLogger(__name__)
+
+
+def identificador(parametros: Dict) -> str:
+    """Mesmos parâmetros (inclusive a versão dos dados) = mesmo trabalho, para qualquer usuário."""
+    texto = json.dumps(parametros, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()[:16]
+
+
+class TrabalhoExportacao:
+    """Estado de uma exportação, lido pelas sessões enquanto a thread da fila o atualiza."""
+
+    def __init__(self, id_trabalho: str, parametros: Dict, nome: str):
+        self.id = id_trabalho
+        self.parametros = parametros
+        self.nome = nome
+        self.estado = NA_FILA
+        self.progresso = 0.0
+        self.mensagem = ""
+        self.caminho: Optional[Path] = None
+        self.total: Optional[int] = None
+        self.erro: Optional[str] = None
+        self.criado_em = time.time()
+        self.terminado_em: Optional[float] = None
+
+    @property
+    def ativo(self) -> bool:
+        return self.estado in (NA_FILA, EXECUTANDO)
+
+
+class FilaExportacao:
+    """
+    Fila de exportações do processo, fora da thread dos scripts do Streamlit.
+
+    Cada trabalho grava em `pasta/<id>/`, e o id vem dos parâmetros: pedidos
+    iguais de sessões diferentes recebem o mesmo trabalho, em andamento ou
+    já concluído. O manifesto gravado no fim permite reaproveitar o
+    resultado depois de reiniciar o servidor. Um trabalho que falhou é
+    refeito no próximo pedido igual. Trabalhos terminados há mais de
+    `idade_maxima` segundos são esquecidos e têm a pasta apagada.
+    """
+
+    def __init__(self, pasta: Path, workers: int = TRABALHOS_SIMULTANEOS, idade_maxima: float = IDADE_MAXIMA_S):
+        self.pasta = pasta
+        self.idade_maxima = idade_maxima
+        self._ultima_limpeza = 0.0
+        self._trabalhos: Dict[str, TrabalhoExportacao] = {}
+        self._trava = threading.Lock()
+        self._pool = ThreadPoolExecutor(max(1, workers), thread_name_prefix="exportacao")
+
+    def submeter(self, parametros: Dict, regioes: Sequence[str], nome: str) -> TrabalhoExportacao:
+        """
+        Enfileira a exportação (`parametros`: categoria, area, modulo_fiscal,
+        formato e versao) das `regioes`, gravada como `nome`, ou devolve o
+        trabalho igual que já existe.
+        """
+        id_trabalho = identificador(parametros)
+        with self._trava:
+            if time.time() - self._ultima_limpeza > LIMPEZA_INTERVALO_S:
+                self._limpar()
+            trabalho = self._trabalhos.get(id_trabalho)
+            if trabalho is not None and trabalho.estado != FALHOU:
+                return trabalho
+            trabalho = self._ler_concluido(id_trabalho, parametros, nome)
+            if trabalho is None:
+                trabalho = TrabalhoExportacao(id_trabalho, parametros, nome)
+                self._pool.submit(self._executar, trabalho, list(regioes))
+            self._trabalhos[id_trabalho] = trabalho
+            return trabalho
+
+    def obter(self, id_trabalho: str) -> Optional[TrabalhoExportacao]:
+        return self._trabalhos.get(id_trabalho)
+
+    def _limpar(self) -> None:
+        """Esquece os trabalhos terminados há mais de `idade_maxima` e apaga as pastas deles (chamada com a trava)."""
+        agora = time.time()
+        self._ultima_limpeza = agora
+        limite = agora - self.idade_maxima
+        for id_trabalho, trabalho in list(self._trabalhos.items()):
+            if not trabalho.ativo and (trabalho.terminado_em or trabalho.criado_em) < limite:
+                del self._trabalhos[id_trabalho]
+        if not self.pasta.is_dir():
+            return
+        for pasta in self.pasta.iterdir():
+            # Os que ficaram na fila estão ativos ou são recentes
+            if not pasta.is_dir() or pasta.name in self._trabalhos:
+                continue
+            # Pela data do manifesto; sem ele (trabalho que falhou), pela da pasta
+            marca = pasta / MANIFESTO if (pasta / MANIFESTO).exists() else pasta
+            if marca.stat().st_mtime < limite:
+                shutil.rmtree(pasta, ignore_errors=True)
+
+    def _ler_concluido(self, id_trabalho: str, parametros: Dict, nome: str) -> Optional[TrabalhoExportacao]:
+        """Trabalho concluído numa execução anterior do servidor, se o resultado ainda estiver em disco."""
+        try:
+            manifesto = json.loads((self.pasta / id_trabalho / MANIFESTO).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        caminho = self.pasta / id_trabalho / manifesto["arquivo"]
+        # Uma exportação sem feições não deixa arquivo: aí o manifesto basta
+        if manifesto["total"] and not caminho.exists():
+            return None
+        trabalho = TrabalhoExportacao(id_trabalho, parametros, nome)
+        trabalho.estado, trabalho.progresso = CONCLUIDO, 1.0
+        trabalho.terminado_em = manifesto.get("concluido_em")
+        trabalho.caminho, trabalho.total = caminho, manifesto["total"]
+        return trabalho
+
+    def _executar(self, trabalho: TrabalhoExportacao, regioes: List[str]) -> None:
+        trabalho.estado = EXECUTANDO
+        trabalho.mensagem = f"0/{len(regioes)} regiões"
+
+        def progresso(concluidas: int, total: int) -> None:
+            trabalho.progresso = concluidas / total
+            trabalho.mensagem = f"{concluidas}/{total} regiões"
+
+        parametros = trabalho.parametros
+        pasta = self.pasta / trabalho.id
+        try:
+            pasta.mkdir(parents=True, exist_ok=True)
+            caminho, total = exportar_estado(
+                regioes, pasta / trabalho.nome, parametros["formato"],
+                categoria=parametros.get("categoria"),
+                area=parametros.get("area"),
+                modulo_fiscal=parametros.get("modulo_fiscal"),
+                progresso=progresso,
+            )
+            manifesto = {"parametros": parametros, "arquivo": caminho.name, "total": total, "concluido_em": time.time()}
+            temporario = pasta / f".{MANIFESTO}.{os.getpid()}"
+            temporario.write_text(json.dumps(manifesto, ensure_ascii=False, default=str), encoding="utf-8")
+            temporario.replace(pasta / MANIFESTO)
+        except Exception as e:
+            logger.exception("Falha na exportação %s", trabalho.id)
+            trabalho.erro = str(e)
+            trabalho.terminado_em = time.time()
+            trabalho.estado = FALHOU
+            return
+        trabalho.caminho, trabalho.total, trabalho.progresso = caminho, total, 1.0
+        trabalho.terminado_em = manifesto["concluido_em"]
+        trabalho.estado = CONCLUIDO
+
+
+@st.cache_resource
+def obter_fila(pasta: str) -> FilaExportacao:
+    """Fila de exportações compartilhada por todas as sessões do processo."""
+    return FilaExportacao(Path(pasta))
@@ -0,0 +1,244 @@
+# modules/geo_store.py
+
+import json
+import weakref
+from typing import Dict, Iterable, List, Optional, Union
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import requests
+import streamlit as st
+
+from modules.chunked_fetch import buscar_em_partes
+from modules.data_loader import (
+    TENTATIVAS_PARTES,
+    fetch_regioes,
+    fetch_municipios,
+    fetch_geojson_por_municipio,
+    fetch_geojson_limites,
+    fetch_geojson_assentamentos
+)
+from modules.replica import Replica, obter_replica
+from modules.request_scheduler import em_lote_na_sessao
+
+# Requisições simultâneas ao backend durante a carga da base estadual
+MAX_WORKERS = int(st.secrets.get("STORE_WORKERS", 8))
+
+Filtro = Union[None, str, Iterable[str]]
+
+
+class CamadaIndexada:
+    """
+    GeoDataFrame estadual com índices de posição por coluna (município, região, categoria...).
+
+    Selecionar é interseção de arrays de posições seguida de um `iloc`: nenhuma
+    varredura de features em Python e nenhuma cópia da camada inteira.
+    """
+
+    def __init__(self, gdf: gpd.GeoDataFrame, colunas_indice: List[str]):
+        self.gdf = gdf
+        self.indices: Dict[str, Dict[str, np.ndarray]] = {}
+        for coluna in colunas_indice:
+            if coluna in gdf.columns:
+                self.indices[coluna] = gdf.groupby(coluna, observed=True, sort=False).indices
+
+    def posicoes(self, **filtros: Filtro) -> np.ndarray:
+        """Posições das linhas que atendem a todos os filtros (valor ou lista de valores)."""
+        resultado = None
+        for coluna, valor in filtros.items():
+            if valor is None:
+                continue
+            indice = self.indices.get(coluna)
+            if indice is None:
+                raise KeyError(f"Coluna sem índice: {coluna}")
+            valores = [valor] if isinstance(valor, str) else list(valor)
+            partes = [indice[v] for v in valores if v in indice]
+            pos = np.sort(np.concatenate(partes)) if partes else np.empty(0, dtype=np.intp)
+            resultado = pos if resultado is None else np.intersect1d(resultado, pos, assume_unique=True)
+        return np.arange(len(self.gdf)) if resultado is None else resultado
+
+    def linhas(self, posicoes: np.ndarray) -> gpd.GeoDataFrame:
+        """Cópia das linhas nas posições dadas, com as colunas `category` de volta a texto."""
+        selecao = self.gdf.iloc[posicoes].copy()
+        for coluna in selecao.columns:
+            if isinstance(selecao[coluna].dtype, pd.CategoricalDtype):
+                selecao[coluna] = selecao[coluna].astype(object)
+        return selecao
+
+    def geojson_linhas(self, posicoes: np.ndarray) -> Dict:
+        """Linhas nas posições dadas no formato GeoJSON (FeatureCollection) que as páginas já usam."""
+        selecao = self.linhas(posicoes)
+        if selecao.empty:
+            return {"type": "FeatureCollection", "features": []}
+        return json.loads(selecao.to_json(drop_id=True))
+
+    def selecionar(self, **filtros: Filtro) -> gpd.GeoDataFrame:
+        return self.linhas(self.posicoes(**filtros))
+
+    def geojson(self, **filtros: Filtro) -> Dict:
+        return self.geojson_linhas(self.posicoes(**filtros))
+
+    def __len__(self) -> int:
+        return len(self.gdf)
+
+
+def _para_gdf(features: List[Dict], colunas_categoricas: List[str]) -> gpd.GeoDataFrame:
+    if not features:
+        return gpd.GeoDataFrame(columns=colunas_categoricas + ["geometry"], geometry="geometry", crs="EPSG:4326")
+    return _categorizar(gpd.GeoDataFrame.from_features(features, crs="EPSG:4326"), colunas_categoricas)
+
+
+def _categorizar(gdf: gpd.GeoDataFrame, colunas_categoricas: List[str]) -> gpd.GeoDataFrame:
+    # Colunas repetitivas viram `category`: um inteiro por linha em vez de uma string
+    for coluna in colunas_categoricas:
+        if coluna in gdf.columns:
+            gdf[coluna] = gdf[coluna].astype("category")
+    return gdf
+
+
+def _regioes_do_backend() -> Dict[str, str]:
+    """Município -> região, segundo o backend."""
+    return {m: r for r in fetch_regioes() for m in fetch_municipios(r)}
+
+
+def _buscar_por_municipio(fetch, regiao_de: Dict[str, str]) -> List[Dict]:
+    """
+    Features de todos os municípios de `regiao_de`, buscadas em paralelo com
+    `fetch` (ver `buscar_em_partes`) e marcadas com município e região. Se
+    algum município falhar em todas as tentativas, levanta RequestException:
+    um store estadual incompleto não chega a ser montado nem guardado em cache.
+    """
+    def _buscar(municipio):
+        feats = (fetch(municipio) or {}).get("features", [])
+        for f in feats:
+            props = f.setdefault("properties", {})
+            props.setdefault("nome_municipio", municipio)
+            props["regiao"] = regiao_de[municipio]
+        return feats
+    municipios = list(regiao_de)
+    features, falhas = buscar_em_partes(
+        em_lote_na_sessao(_buscar), municipios, workers=MAX_WORKERS, tentativas=TENTATIVAS_PARTES
+    )
+    if falhas:
+        raise requests.exceptions.RequestException(
+            f"{len(falhas)} de {len(municipios)} municípios não puderam ser carregados: {', '.join(falhas)}"
+        )
+    return features
+
+
+def carregar_limites() -> gpd.GeoDataFrame:
+    """
+    Só os limites municipais do estado (réplica ou backend), sem carregar
+    propriedades e assentamentos: para quem precisa apenas dos contornos.
+    """
+    replica = obter_replica()
+    if replica.disponivel():
+        return _categorizar(replica.ler_camada("limites"), ["nome_municipio", "regiao"])
+    return _para_gdf(_buscar_por_municipio(fetch_geojson_limites, _regioes_do_backend()), ["nome_municipio", "regiao"])
+
+
+class GeoStore:
+    """Camadas estaduais (propriedades, limites, assentamentos) indexadas em memória."""
+
+    def __init__(self, propriedades: CamadaIndexada, limites: CamadaIndexada, assentamentos: CamadaIndexada,
+                 regiao_de: Dict[str, str]):
+        self.propriedades = propriedades
+        self.limites = limites
+        self.assentamentos = assentamentos
+        self.regiao_de = regiao_de
+
+    def municipios(self, regiao: Optional[str] = None) -> List[str]:
+        return [m for m, r in self.regiao_de.items() if regiao is None or r == regiao]
+
+    @classmethod
+    def carregar(cls) -> "GeoStore":
+        """
+        Lê o estado inteiro da réplica local, se sincronizada (uma leitura por
+        camada); senão busca no backend, município a município, em paralelo.
+        Um município que falha em todas as tentativas levanta RequestException.
+        """
+        replica = obter_replica()
+        if replica.disponivel():
+            return cls.da_replica(replica)
+
+        regiao_de = _regioes_do_backend()
+
+        return cls._montar(
+            _para_gdf(_buscar_por_municipio(fetch_geojson_por_municipio, regiao_de), ["nome_municipio", "regiao", "categoria"]),
+            _para_gdf(_buscar_por_municipio(fetch_geojson_limites, regiao_de), ["nome_municipio", "regiao"]),
+            _para_gdf(
+                fetch_geojson_assentamentos(tolerance=0.001).get("features", []),
+                ["nome_municipio", "nome_municipio_original", "tipo_assentamento"]
+            ),
+            regiao_de,
+        )
+
+    @classmethod
+    def da_replica(cls, replica: Replica) -> "GeoStore":
+        """Monta o store a partir das camadas da réplica local (ver `modules.replica`)."""
+        def ler(camada: str, colunas_categoricas: List[str]) -> gpd.GeoDataFrame:
+            return _categorizar(replica.ler_camada(camada), colunas_categoricas)
+
+        assentamentos = ler("assentamentos", ["nome_municipio", "nome_municipio_original", "tipo_assentamento"])
+        if not assentamentos.empty:
+            # Mesma simplificação pedida ao backend na carga remota
+            assentamentos["geometry"] = assentamentos.geometry.simplify(0.001)
+        return cls._montar(
+            ler("propriedades", ["nome_municipio", "regiao", "categoria"]),
+            ler("limites", ["nome_municipio", "regiao"]),
+            assentamentos.drop(columns=[c for c in ["regiao"] if c in assentamentos.columns]),
+            {m: r for r, municipios in replica.regioes().items() for m in municipios},
+        )
+
+    @classmethod
+    def _montar(cls, propriedades: gpd.GeoDataFrame, limites: gpd.GeoDataFrame,
+                assentamentos: gpd.GeoDataFrame, regiao_de: Dict[str, str]) -> "GeoStore":
+        if "categoria" in propriedades.columns:
+            propriedades["categoria"] = propriedades["categoria"].cat.add_categories(
+                [c for c in ["Sem Classificação"] if c not in propriedades["categoria"].cat.categories]
+            ).fillna("Sem Classificação")
+        if "tipo_assentamento" in assentamentos.columns:
+            # Índice pelo tipo em minúsculas, como a página de assentamentos compara
+            assentamentos["tipo"] = assentamentos["tipo_assentamento"].astype(str).str.lower().astype("category")
+
+        return cls(
+            CamadaIndexada(propriedades, ["nome_municipio", "regiao", "categoria"]),
+            CamadaIndexada(limites, ["nome_municipio", "regiao"]),
+            CamadaIndexada(assentamentos, ["nome_municipio", "nome_municipio_original", "tipo"]),
+            regiao_de,
+        )
+
+    def memoria_mb(self) -> float:
+        total = 0
+        for camada in (self.propriedades, self.limites, self.assentamentos):
+            total += camada.gdf.drop(columns="geometry").memory_usage(deep=True).sum()
+            total += sum(len(g.wkb) for g in camada.gdf.geometry if g is not None)
+        return total / 1e6
+
+
+@st.cache_resource(ttl=3600, max_entries=1, show_spinner="Carregando base estadual...")
+def obter_store(versao: str) -> GeoStore:
+    """
+    Store estadual compartilhado por todas as sessões do processo.
+
+    `versao` (ver `fetch_versao_dados`) faz parte da chave: quando os dados
+    mudam, uma nova cópia é carregada e a antiga é descartada (`max_entries=1`).
+    """
+    store = GeoStore.carregar()
+    _STORES[versao] = store
+    return store
+
+
+# Stores em memória por versão. Referências fracas: quando o cache de
+# `obter_store` descarta um store (ttl ou versão nova), ele sai daqui também
+_STORES: "weakref.WeakValueDictionary[str, GeoStore]" = weakref.WeakValueDictionary()
+
+
+def store_em_memoria(versao: str) -> Optional[GeoStore]:
+    """
+    O store da versão, se ele já está em memória neste processo. Consultas
+    restritas (ver `modules.query`) só buscam o próprio recorte enquanto ele
+    não estiver: carregar o estado inteiro para um município não compensa.
+    """
+    return _STORES.get(versao)
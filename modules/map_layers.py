@@ -0,0 +1,423 @@
+# modules/map_layers.py
+
+import base64
+import json
+from typing import Dict, List, Optional, Union
+
+from folium import Map
+from folium.map import Layer
+from folium.template import Template
+from folium.utilities import get_obj_in_upper_tree
+
+from modules.asset_server import comprimir
+
+# Tooltip montado no navegador a partir dos campos da feição (equivalente ao GeoJsonTooltip)
+_TOOLTIP_JS = """
+            onEachFeature: function(feature, layer) {
+                var campos = {{ this.campos|tojson }};
+                if (!campos.length) { return; }
+                var aliases = {{ this.aliases|tojson }};
+                // Montada com textContent: valores vindos do backend não viram HTML
+                var tabela = document.createElement("table");
+                campos.forEach(function(campo, i) {
+                    var valor = feature.properties[campo];
+                    if (typeof valor === "number") { valor = valor.toLocaleString(); }
+                    var linha = tabela.insertRow();
+                    var titulo = document.createElement("th");
+                    titulo.style.textAlign = "left";
+                    titulo.textContent = aliases[i];
+                    linha.appendChild(titulo);
+                    linha.insertCell().textContent = valor === undefined || valor === null ? "" : String(valor);
+                });
+                layer.bindTooltip(tabela, {sticky: true});
+            }
+"""
+
+
+# Dados embutidos no HTML acima deste tamanho vão gzipados em base64
+EMBUTIR_COMPRIMIDO_ACIMA = 32 * 1024
+# O HTML embutido vai pelo websocket a cada render, sem cache no navegador:
+# aqui o nível 6 compensa o tempo extra (os arquivos publicados usam o 1)
+NIVEL_GZIP_EMBUTIDO = 6
+
+# Leitura dos payloads no navegador:
+# - `baixarJson(url)`: fetch que descomprime arquivos `.json.gz` (ver
+#   `modules.asset_server.publicar_json`) com o `DecompressionStream` nativo;
+# - `lerEmbutido(base64)`: o mesmo para dados gzipados embutidos no HTML;
+# - `decodificarGeojson(dados)`: desfaz a quantização em delta (ver
+#   `modules.precision.codificar`); coleções GeoJSON comuns passam sem alteração.
+DECODIFICAR_JS = """
+            window.descomprimirJson = window.descomprimirJson || function(fluxo) {
+                return new Response(fluxo.pipeThrough(new DecompressionStream("gzip"))).json();
+            };
+            window.baixarJson = window.baixarJson || function(url) {
+                return fetch(url).then(function(resp) {
+                    return /\\.gz(\\?|$)/.test(url) ? descomprimirJson(resp.body) : resp.json();
+                });
+            };
+            window.lerEmbutido = window.lerEmbutido || function(base64) {
+                var bytes = Uint8Array.from(atob(base64), function(c) { return c.charCodeAt(0); });
+                return descomprimirJson(new Blob([bytes]).stream());
+            };
+            window.decodificarGeojson = window.decodificarGeojson || function(dados) {
+                if (!dados || !dados.transform) { return dados; }
+                var escala = Math.pow(10, dados.transform.casas);
+                function anel(plano) {
+                    var pontos = new Array(plano.length / 2), x = 0, y = 0;
+                    for (var i = 0; i < plano.length; i += 2) {
+                        x += plano[i]; y += plano[i + 1];
+                        pontos[i / 2] = [x / escala, y / escala];
+                    }
+                    return pontos;
+                }
+                dados.features.forEach(function(f) {
+                    var g = f.geometry;
+                    if (!g) { return; }
+                    if (g.type === "Polygon") { g.coordinates = g.coordinates.map(anel); }
+                    else if (g.type === "MultiPolygon") {
+                        g.coordinates = g.coordinates.map(function(p) { return p.map(anel); });
+                    }
+                });
+                delete dados.transform;
+                return dados;
+            };
+"""
+
+
+def embutir_comprimido(texto: bytes) -> str:
+    """JSON gzipado em base64, para embutir no HTML e ler com `lerEmbutido`."""
+    return base64.b64encode(comprimir(texto, NIVEL_GZIP_EMBUTIDO)).decode("ascii")
+
+
+def estilos_por_categoria(cores: Dict[str, str], **estilo_base) -> Dict[str, Dict]:
+    """Monta a tabela de estilos Leaflet por categoria a partir de um dicionário de cores."""
+    return {categoria: {**estilo_base, "fillColor": cor} for categoria, cor in cores.items()}
+
+
+class GeoJsonRemoto(Layer):
+    """
+    Camada GeoJSON do Leaflet cujos dados são baixados pelo navegador a partir de uma URL.
+
+    Diferente de `folium.GeoJson`, o GeoJSON não é embutido no HTML do mapa:
+    o componente carrega apenas a URL e o navegador faz cache do arquivo.
+    """
+
+    _template = Template(
+        """
+        {% macro script(this, kwargs) %}
+        """ + DECODIFICAR_JS + """
+        var {{ this.get_name() }} = L.geoJson(null, {
+            style: {{ this.estilo|tojson }},
+            interactive: {{ this.interativo|tojson }},
+        """ + _TOOLTIP_JS + """
+        });
+        baixarJson({{ this.url|tojson }})
+            .then(function(data) { {{ this.get_name() }}.addData(decodificarGeojson(data)); });
+        {% endmacro %}
+        """
+    )
+
+    def __init__(
+        self,
+        url: str,
+        estilo: Dict,
+        name: Optional[str] = None,
+        campos: Optional[List[str]] = None,
+        aliases: Optional[List[str]] = None,
+        interativo: bool = True,
+        overlay: bool = True,
+        control: bool = True,
+        show: bool = True,
+    ):
+        super().__init__(name=name, overlay=overlay, control=control, show=show)
+        self._name = "GeoJsonRemoto"
+        self.url = url
+        self.estilo = estilo
+        self.campos = campos or []
+        self.aliases = aliases or self.campos
+        self.interativo = interativo
+
+
+class CamadaCategorias(Layer):
+    """
+    Uma única camada GeoJSON para todas as categorias, estilizada no navegador.
+
+    Em vez de um `style_function` avaliado em Python para cada feição (que grava
+    um objeto de estilo dentro de cada feature), a tabela `estilos` vai uma vez
+    só para o navegador, indexada pelo valor de `campo`. A legenda com caixas de
+    seleção liga/desliga categorias refiltrando as feições no próprio navegador.
+
+    `dados` pode ser a URL de um GeoJSON publicado (ver `modules.asset_server`)
+    ou o próprio dicionário GeoJSON, que então é embutido no HTML (gzipado em
+    base64 quando passa de `EMBUTIR_COMPRIMIDO_ACIMA`).
+    """
+
+    _template = Template(
+        """
+        {% macro script(this, kwargs) %}
+        """ + DECODIFICAR_JS + """
+        var {{ this.get_name() }}_estilos = {{ this.estilos|tojson }};
+        var {{ this.get_name() }}_visiveis = {};
+        var {{ this.get_name() }}_dados = null;
+        Object.keys({{ this.get_name() }}_estilos).forEach(function(c) {
+            {{ this.get_name() }}_visiveis[c] = true;
+        });
+
+        function {{ this.get_name() }}_categoria(feature) {
+            var c = feature.properties[{{ this.campo|tojson }}];
+            return (c in {{ this.get_name() }}_estilos) ? c : {{ this.padrao|tojson }};
+        }
+
+        var {{ this.get_name() }} = L.geoJson(null, {
+            style: function(feature) {
+                return {{ this.get_name() }}_estilos[{{ this.get_name() }}_categoria(feature)];
+            },
+            filter: function(feature) {
+                return {{ this.get_name() }}_visiveis[{{ this.get_name() }}_categoria(feature)] !== false;
+            },
+            // Pontos (propriedades reduzidas pelo orçamento de transferência) seguem o estilo da categoria
+            pointToLayer: function(feature, latlng) {
+                return L.circleMarker(latlng, {radius: 4});
+            },
+        """ + _TOOLTIP_JS + """
+        });
+
+        function {{ this.get_name() }}_redesenhar() {
+            {{ this.get_name() }}.clearLayers();
+            if ({{ this.get_name() }}_dados) {
+                {{ this.get_name() }}.addData({{ this.get_name() }}_dados);
+            }
+        }
+
+        {%- if this.stream %}
+        {{ this.get_name() }}_dados = {type: "FeatureCollection", features: []};
+        var {{ this.get_name() }}_falhas = [];
+        var {{ this.get_name() }}_aviso = null;
+
+        // Municípios que não chegaram (ou o stream inteiro) ficam avisados no mapa e no console
+        function {{ this.get_name() }}_avisar(texto) {
+            console.warn(texto);
+            if (!{{ this.get_name() }}_aviso) {
+                {{ this.get_name() }}_aviso = L.control({position: "bottomleft"});
+                {{ this.get_name() }}_aviso.onAdd = function() {
+                    var div = L.DomUtil.create("div", "leaflet-control-layers leaflet-control-layers-expanded");
+                    div.style.color = "#b00020";
+                    div.style.maxWidth = "320px";
+                    return div;
+                };
+                {{ this.get_name() }}_aviso.addTo({{ this.mapa.get_name() }});
+            }
+            {{ this.get_name() }}_aviso.getContainer().textContent = texto;
+        }
+
+        // Cada linha do stream é um município: desenha assim que chega
+        function {{ this.get_name() }}_parte(linha) {
+            if (!linha.trim()) { return; }
+            var parte = JSON.parse(linha);
+            if (parte.erro) {
+                {{ this.get_name() }}_falhas.push(parte.municipio);
+                {{ this.get_name() }}_avisar("Propriedades não carregadas em "
+                    + {{ this.get_name() }}_falhas.length + " município(s): "
+                    + {{ this.get_name() }}_falhas.join(", "));
+                return;
+            }
+            decodificarGeojson(parte.propriedades);
+            if (parte.propriedades && parte.propriedades.features.length) {
+                Array.prototype.push.apply({{ this.get_name() }}_dados.features, parte.propriedades.features);
+                {{ this.get_name() }}.addData(parte.propriedades);
+            }
+        }
+
+        fetch({{ this.url|tojson }}).then(function(resp) {
+            if (!resp.ok) {
+                {{ this.get_name() }}_avisar("Propriedades indisponíveis (HTTP " + resp.status
+                    + "): os dados podem ter mudado; recarregue a página.");
+                return;
+            }
+            var leitor = resp.body.getReader();
+            var decodificador = new TextDecoder();
+            var resto = "";
+            function ler() {
+                return leitor.read().then(function(r) {
+                    if (r.done) {
+                        {{ this.get_name() }}_parte(resto);
+                        return;
+                    }
+                    resto += decodificador.decode(r.value, {stream: true});
+                    var linhas = resto.split("\\n");
+                    resto = linhas.pop();
+                    linhas.forEach({{ this.get_name() }}_parte);
+                    return ler();
+                });
+            }
+            return ler();
+        }).catch(function(e) {
+            {{ this.get_name() }}_avisar("Falha ao carregar as propriedades: " + e);
+        });
+        {%- elif this.url %}
+        baixarJson({{ this.url|tojson }})
+            .then(function(data) {
+                {{ this.get_name() }}_dados = decodificarGeojson(data);
+                {{ this.get_name() }}_redesenhar();
+            });
+        {%- elif this.embutido %}
+        lerEmbutido({{ this.embutido|tojson }})
+            .then(function(data) {
+                {{ this.get_name() }}_dados = decodificarGeojson(data);
+                {{ this.get_name() }}_redesenhar();
+            });
+        {%- else %}
+        {{ this.get_name() }}_dados = decodificarGeojson({{ this.dados|tojson }});
+        {{ this.get_name() }}_redesenhar();
+        {%- endif %}
+
+        var {{ this.get_name() }}_legenda = L.control({position: {{ this.posicao|tojson }}});
+        {{ this.get_name() }}_legenda.onAdd = function() {
+            var div = L.DomUtil.create("div", "leaflet-control-layers leaflet-control-layers-expanded");
+            Object.keys({{ this.get_name() }}_estilos).forEach(function(c) {
+                var cor = {{ this.get_name() }}_estilos[c].fillColor;
+                var label = L.DomUtil.create("label", "", div);
+                var caixa = L.DomUtil.create("input", "", label);
+                caixa.type = "checkbox";
+                caixa.checked = true;
+                caixa.addEventListener("change", function() {
+                    {{ this.get_name() }}_visiveis[c] = caixa.checked;
+                    {{ this.get_name() }}_redesenhar();
+                });
+                var nome = document.createElement("span");
+                nome.innerHTML = ' <svg width="12" height="12"><circle cx="6" cy="6" r="6" fill="'
+                    + cor + '" /></svg> ' + c;
+                label.appendChild(nome);
+            });
+            L.DomEvent.disableClickPropagation(div);
+            return div;
+        };
+        {{ this.get_name() }}_legenda.addTo({{ this.mapa.get_name() }});
+        {% endmacro %}
+        """
+    )
+
+    def __init__(
+        self,
+        dados: Union[str, Dict],
+        estilos: Dict[str, Dict],
+        campo: str = "categoria",
+        padrao: str = "Sem Classificação",
+        campos: Optional[List[str]] = None,
+        aliases: Optional[List[str]] = None,
+        posicao: str = "topright",
+        name: Optional[str] = None,
+        overlay: bool = True,
+        control: bool = False,
+        show: bool = True,
+    ):
+        super().__init__(name=name, overlay=overlay, control=control, show=show)
+        self._name = "CamadaCategorias"
+        self.url = dados if isinstance(dados, str) else None
+        self.dados = None if isinstance(dados, str) else dados
+        self.embutido = None
+        if self.dados is not None:
+            texto = json.dumps(self.dados, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+            if len(texto) > EMBUTIR_COMPRIMIDO_ACIMA:
+                self.embutido = embutir_comprimido(texto)
+                self.dados = None
+        self.estilos = estilos
+        self.campo = campo
+        self.padrao = padrao
+        self.campos = campos or []
+        self.aliases = aliases or self.campos
+        self.posicao = posicao
+        self.stream = False
+
+    def render(self, **kwargs):
+        self.mapa = get_obj_in_upper_tree(self, Map)
+        super().render(**kwargs)
+
+
+class CamadaProgressiva(CamadaCategorias):
+    """
+    Variante de `CamadaCategorias` alimentada por um stream NDJSON (ver
+    `modules.progressive`): cada linha traz as propriedades de um município,
+    desenhadas assim que chegam. Os limites vêm à parte (ver `CamadaLimites`).
+    """
+
+    def __init__(self, url_stream: str, estilos: Dict[str, Dict], **kwargs):
+        super().__init__(url_stream, estilos, **kwargs)
+        self._name = "CamadaProgressiva"
+        self.stream = True
+
+
+class CamadaLimites(Layer):
+    """
+    Limites em dois níveis de detalhe (ver `modules.boundaries`).
+
+    Os contornos das regiões são desenhados sempre; a malha municipal só é
+    baixada e exibida quando o zoom chega a `zoom_municipios`, e some de novo
+    ao afastar. Na LayerControl as duas aparecem como uma camada só.
+    """
+
+    _template = Template(
+        """
+        {% macro script(this, kwargs) %}
+        """ + DECODIFICAR_JS + """
+        var {{ this.get_name() }}_regioes = L.geoJson(null, {
+            style: {{ this.estilo_regioes|tojson }},
+            interactive: false
+        });
+        var {{ this.get_name() }}_municipios = L.geoJson(null, {
+            style: {{ this.estilo_municipios|tojson }},
+        """ + _TOOLTIP_JS + """
+        });
+        var {{ this.get_name() }} = L.layerGroup([{{ this.get_name() }}_regioes]);
+        var {{ this.get_name() }}_baixada = false;
+
+        baixarJson({{ this.url_regioes|tojson }})
+            .then(function(data) { {{ this.get_name() }}_regioes.addData(decodificarGeojson(data)); });
+
+        function {{ this.get_name() }}_atualizar() {
+            var grupo = {{ this.get_name() }};
+            var municipios = {{ this.get_name() }}_municipios;
+            if ({{ this.mapa.get_name() }}.getZoom() < {{ this.zoom_municipios }}) {
+                grupo.removeLayer(municipios);
+                return;
+            }
+            if (!{{ this.get_name() }}_baixada) {
+                {{ this.get_name() }}_baixada = true;
+                baixarJson({{ this.url_municipios|tojson }})
+                    .then(function(data) { municipios.addData(decodificarGeojson(data)); });
+            }
+            grupo.addLayer(municipios);
+        }
+        {{ this.mapa.get_name() }}.on("zoomend", {{ this.get_name() }}_atualizar);
+        {{ this.mapa.get_name() }}.whenReady({{ this.get_name() }}_atualizar);
+        {% endmacro %}
+        """
+    )
+
+    def __init__(
+        self,
+        url_regioes: str,
+        url_municipios: str,
+        estilo_regioes: Dict,
+        estilo_municipios: Dict,
+        zoom_municipios: int = 9,
+        campos: Optional[List[str]] = None,
+        aliases: Optional[List[str]] = None,
+        name: Optional[str] = None,
+        overlay: bool = True,
+        control: bool = True,
+        show: bool = True,
+    ):
+        super().__init__(name=name, overlay=overlay, control=control, show=show)
+        self._name = "CamadaLimites"
+        self.url_regioes = url_regioes
+        self.url_municipios = url_municipios
+        self.estilo_regioes = estilo_regioes
+        self.estilo_municipios = estilo_municipios
+        self.zoom_municipios = zoom_municipios
+        self.campos = campos or []
+        self.aliases = aliases or self.campos
+
+    def render(self, **kwargs):
+        self.mapa = get_obj_in_upper_tree(self, Map)
+        super().render(**kwargs)
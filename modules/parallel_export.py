@@ -0,0 +1,161 @@
+# modules/parallel_export.py
+
+import multiprocessing
+import os
+import shutil
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import streamlit as st
+
+from modules.request_scheduler import RepasseVagas, obter_agendador
+
+# Processos simultâneos da exportação estadual (cada um exporta uma região)
+PROCESSOS = int(st.secrets.get("EXPORTACAO_PROCESSOS", os.cpu_count() or 1))
+
+# Formato -> sufixo do arquivo final ("" = pasta com uma parte por região)
+FORMATOS = {
+    "GeoPackage": ".gpkg",
+    "Shapefile": ".shp",
+    "GeoParquet particionado": "",
+}
+DRIVERS = {"GeoPackage": "GPKG", "Shapefile": "ESRI Shapefile"}
+
+# Colunas exportadas e seus nomes no arquivo (o DBF do shapefile aceita até 10 caracteres)
+COLUNAS_EXPORTACAO = {
+    'nome_municipio': 'municipio',
+    'categoria': 'tipo',
+    'nome_municipio_original': 'mun_orig',
+    'modulo_fiscal': 'mod_fisc',
+    'geometry': 'geometry'
+}
+
+
+def preparar_exportacao(gdf, completar: bool = False):
+    """
+    Só as colunas essenciais, renomeadas, com a geometria na grade de
+    exportação (ver `modules.precision.arredondar_gdf`). Com `completar`,
+    colunas ausentes entram vazias, para que todas as partes de uma
+    exportação tenham o mesmo esquema.
+    """
+    from modules.precision import arredondar_gdf
+    colunas = [c for c in COLUNAS_EXPORTACAO if completar or c in gdf.columns]
+    gdf = arredondar_gdf(gdf.reindex(columns=colunas))
+    return gdf.rename(columns={c: COLUNAS_EXPORTACAO[c] for c in colunas})
+
+
+def _iniciar_processo(pedidos, fichas) -> None:
+    """As requisições do processo ocupam vagas do agendador do processo principal (ver `RepasseVagas`)."""
+    from modules.request_scheduler import usar_vagas_remotas
+    usar_vagas_remotas(pedidos, fichas)
+
+
+def _exportar_regiao(regiao: str, filtros: Dict, pasta: str) -> Tuple[str, int, Optional[str]]:
+    """
+    Trabalho de um processo: busca a região, filtra, prepara e grava a parte
+    em GeoParquet. Devolve a região, a quantidade de feições e o caminho da
+    parte (None quando nada passou no filtro).
+    """
+    from modules.query import Consulta  # importação tardia: cada processo carrega o que usa
+    gdf = Consulta("propriedades", regiao=regiao, **filtros).no_backend().gdf()
+    if gdf.empty:
+        return regiao, 0, None
+    parte = preparar_exportacao(gdf, completar=True)
+    caminho = Path(pasta) / f"regiao={regiao}" / "parte.parquet"
+    caminho.parent.mkdir(parents=True, exist_ok=True)
+    parte.to_parquet(caminho)
+    return regiao, len(parte), str(caminho)
+
+
+def _juntar(partes: List[str], destino: Path, formato: str) -> None:
+    """Acrescenta as partes, na ordem, ao arquivo final (uma parte em memória por vez)."""
+    import geopandas as gpd
+    for i, parte in enumerate(partes):
+        gpd.read_parquet(parte).to_file(
+            destino, driver=DRIVERS[formato], mode="a" if i else "w", encoding="utf-8"
+        )
+
+
+def _remover(caminho: Path) -> None:
+    """Apaga uma exportação anterior (pasta, shapefile com os arquivos auxiliares ou arquivo único)."""
+    if caminho.is_dir():
+        shutil.rmtree(caminho)
+    elif caminho.suffix == ".shp":
+        for arquivo in caminho.parent.glob(caminho.stem + ".*"):
+            arquivo.unlink()
+    else:
+        caminho.unlink(missing_ok=True)
+
+
+def exportar_estado(
+    regioes: Sequence[str],
+    destino: Path,
+    formato: str = "GeoPackage",
+    categoria: Optional[str] = None,
+    area=None,
+    modulo_fiscal=None,
+    processos: int = PROCESSOS,
+    progresso: Optional[Callable[[int, int], None]] = None,
+) -> Tuple[Path, int]:
+    """
+    Exportação estadual repartida por região e feita num pool de processos.
+
+    Cada processo busca as propriedades de uma região (réplica ou backend),
+    aplica os filtros da consulta e grava a sua parte; o processo principal
+    só junta as partes num GeoPackage ou shapefile, ou as publica como um
+    dataset GeoParquet particionado por região (`regiao=<nome>/`). O tempo
+    cai com o número de núcleos até o limite de regiões. Cada requisição
+    dos processos ao backend espera uma vaga no agendador deste processo,
+    como lote (ver `modules.request_scheduler.RepasseVagas`): o limite de
+    requisições vale para a exportação e as páginas juntas, e as
+    requisições interativas continuam passando na frente.
+
+    `destino` é o caminho sem sufixo; devolve o caminho final e o total de
+    feições exportadas. Se alguma região falhar, nada é gravado em `destino`
+    e um RuntimeError lista as regiões com problema.
+    """
+    destino = destino.with_name(destino.name + FORMATOS[formato])
+    temporaria = destino.parent / f".{destino.name}.{uuid.uuid4().hex}"
+    filtros = {"categoria": categoria, "area": area, "modulo_fiscal": modulo_fiscal}
+    resultados: Dict[str, Tuple[int, Optional[str]]] = {}
+    falhas = []
+    try:
+        # "spawn": o processo do Streamlit tem threads (servidor, assets) que não sobrevivem a um fork
+        contexto = multiprocessing.get_context("spawn")
+        processos = max(1, min(processos, len(regioes)))
+        repasse = RepasseVagas(obter_agendador(), contexto, f"exportacao:{destino.name}")
+        with repasse, ProcessPoolExecutor(
+            processos, mp_context=contexto, initializer=_iniciar_processo, initargs=repasse.filas
+        ) as pool:
+            futuros = {pool.submit(_exportar_regiao, r, filtros, str(temporaria)): r for r in regioes}
+            for concluidas, futuro in enumerate(as_completed(futuros), start=1):
+                try:
+                    regiao, quantidade, parte = futuro.result()
+                    resultados[regiao] = (quantidade, parte)
+                except Exception as e:
+                    falhas.append(f"{futuros[futuro]} ({e})")
+                if progresso:
+                    progresso(concluidas, len(regioes))
+        if falhas:
+            raise RuntimeError("Falha ao exportar as regiões: " + "; ".join(sorted(falhas)))
+
+        partes = [resultados[r][1] for r in regioes if resultados[r][1]]
+        total = sum(quantidade for quantidade, _ in resultados.values())
+        # O arquivo final é montado na pasta temporária e só então substitui o anterior
+        if FORMATOS[formato]:
+            final = temporaria / destino.name
+            if partes:
+                _juntar(partes, final, formato)
+            _remover(destino)
+            for arquivo in temporaria.glob(final.stem + ".*"):
+                arquivo.replace(destino.parent / arquivo.name)
+        else:
+            temporaria.mkdir(parents=True, exist_ok=True)
+            _remover(destino)
+            temporaria.replace(destino)
+        return destino, total
+    finally:
+        if temporaria.exists():
+            shutil.rmtree(temporaria)
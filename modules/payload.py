@@ -0,0 +1,184 @@
+# modules/payload.py
+
+import json
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import geopandas as gpd
+import numpy as np
+import shapely
+import streamlit as st
+
+from modules.ragged import FeicoesCompactas
+
+# Orçamento de transferência de um mapa (GeoJSON serializado). Fica bem abaixo
+# do `maxMessageSize` do .streamlit/config.toml: acima de algumas dezenas de MB
+# o navegador trava no parse e no desenho muito antes de o limite estourar.
+ORCAMENTO_MB = float(st.secrets.get("ORCAMENTO_PAYLOAD_MB", 25))
+
+# Feições serializadas de verdade para estimar o tamanho de camadas grandes
+_AMOSTRA = 300
+
+# Degradações em ordem crescente de perda; cada uma é aplicada sobre a anterior
+ETAPAS = (
+    ("quantizar", 5),
+    ("quantizar", 4),
+    ("simplificar", 0.002),
+    ("simplificar", 0.005),
+    ("simplificar", 0.01),
+    ("agregar", None),
+    ("pontos", None),
+    ("amostrar", None),
+)
+# Para renderizadores que só desenham polígonos (ex.: PixiOverlay)
+ETAPAS_POLIGONOS = tuple(e for e in ETAPAS if e[0] != "pontos")
+# Camadas cujas feições precisam continuar individuais (ex.: assentamentos)
+ETAPAS_SEM_AGREGACAO = tuple(e for e in ETAPAS if e[0] not in ("agregar", "pontos"))
+
+
+def estimar_bytes(gdf: gpd.GeoDataFrame) -> int:
+    """
+    Estima o tamanho do GeoJSON de `gdf` sem serializar a camada inteira.
+
+    Uma amostra espaçada é serializada; a parte dos atributos é extrapolada
+    pelo nº de feições e a das geometrias pelo nº de vértices.
+    """
+    n = len(gdf)
+    if n <= _AMOSTRA:
+        return len(gdf.to_json(drop_id=True)) if n else 0
+    amostra = gdf.iloc[np.linspace(0, n - 1, _AMOSTRA).astype(int)]
+    total_amostra = len(amostra.to_json(drop_id=True))
+    atributos_amostra = len(amostra.drop(columns=amostra.geometry.name).to_json(orient="records"))
+    vertices_amostra = max(1, int(shapely.get_num_coordinates(amostra.geometry.values).sum()))
+    vertices = int(shapely.get_num_coordinates(gdf.geometry.values).sum())
+    return int(atributos_amostra * n / _AMOSTRA + (total_amostra - atributos_amostra) * vertices / vertices_amostra)
+
+
+def _quantizar(gdf: gpd.GeoDataFrame, casas: int) -> gpd.GeoDataFrame:
+    gdf = gdf.copy()
+    # np.round devolve o double mais próximo do decimal: o JSON sai com `casas` dígitos
+    gdf["geometry"] = shapely.transform(gdf.geometry.values, lambda xy: np.round(xy, casas))
+    return gdf
+
+
+def _simplificar(gdf: gpd.GeoDataFrame, tolerancia: float) -> gpd.GeoDataFrame:
+    gdf = gdf.copy()
+    gdf["geometry"] = gdf.geometry.simplify(tolerancia)
+    return gdf[~gdf.geometry.is_empty]
+
+
+def _agregar(gdf: gpd.GeoDataFrame, campos: List[str]) -> gpd.GeoDataFrame:
+    """Dissolve as feições por `campos`, somando área e contando as originais."""
+    campos = [c for c in campos if c in gdf.columns]
+    gdf = gdf.assign(quantidade=1)
+    funcoes = {"quantidade": "sum"}
+    if "area" in gdf.columns:
+        gdf["area"] = gdf["area"].astype(float)
+        funcoes["area"] = "sum"
+    if not campos:
+        gdf = gdf.assign(_grupo=0)
+        campos = ["_grupo"]
+    agregado = gdf[campos + list(funcoes) + [gdf.geometry.name]].dissolve(by=campos, aggfunc=funcoes, as_index=False)
+    return agregado.drop(columns=[c for c in ["_grupo"] if c in agregado.columns])
+
+
+def _pontos(gdf: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
+    gdf = gdf.copy()
+    gdf["geometry"] = gdf.geometry.representative_point()
+    return gdf
+
+
+def _descrever(etapa: str, parametro, antes: int, depois: int, campos: Sequence[str]) -> str:
+    if etapa == "quantizar":
+        metros = {5: "~1 m", 4: "~11 m"}.get(parametro, "")
+        return f"coordenadas arredondadas para {parametro} casas decimais ({metros})"
+    if etapa == "simplificar":
+        return f"geometrias simplificadas com tolerância de {parametro}° (~{parametro * 111:.1f} km)"
+    if etapa == "agregar":
+        return f"feições agregadas por {', '.join(campos)} ({antes:,} → {depois:,})"
+    if etapa == "pontos":
+        return "polígonos substituídos por pontos representativos"
+    return f"exibida uma amostra de {depois:,} de {antes:,} feições"
+
+
+def ajustar_ao_orcamento(
+    gdf: gpd.GeoDataFrame,
+    orcamento_mb: Optional[float] = None,
+    etapas: Sequence[Tuple[str, object]] = ETAPAS,
+    campos_agregacao: Sequence[str] = ("nome_municipio", "categoria"),
+) -> Tuple[gpd.GeoDataFrame, List[str]]:
+    """
+    Aplica as degradações de `etapas`, em ordem, até o GeoJSON estimado caber
+    no orçamento. Retorna a camada (original, se já cabia) e a descrição das
+    degradações aplicadas, para informar o usuário.
+    """
+    orcamento = (orcamento_mb or ORCAMENTO_MB) * 1e6
+    estimativa = estimar_bytes(gdf)
+    aplicadas: List[str] = []
+    for etapa, parametro in etapas:
+        if estimativa <= orcamento or gdf.empty:
+            break
+        antes = len(gdf)
+        if etapa == "quantizar":
+            gdf = _quantizar(gdf, parametro)
+        elif etapa == "simplificar":
+            gdf = _simplificar(gdf, parametro)
+        elif etapa == "agregar":
+            gdf = _agregar(gdf, list(campos_agregacao))
+        elif etapa == "pontos":
+            gdf = _pontos(gdf)
+        elif etapa == "amostrar":
+            # Último recurso: fica com a fração de feições que cabe no orçamento
+            passo = int(np.ceil(estimativa / orcamento))
+            gdf = gdf.iloc[::passo]
+        aplicadas.append(_descrever(etapa, parametro, antes, len(gdf), campos_agregacao))
+        estimativa = estimar_bytes(gdf)
+    return gdf, aplicadas
+
+
+def ajustar_geojson(geojson: Dict, orcamento_mb: Optional[float] = None, **kwargs) -> Tuple[Dict, List[str]]:
+    """Versão de `ajustar_ao_orcamento` para um dicionário GeoJSON (FeatureCollection)."""
+    features = (geojson or {}).get("features") or []
+    if not features:
+        return geojson, []
+    orcamento = (orcamento_mb or ORCAMENTO_MB) * 1e6
+    # Estimativa barata antes de montar um GeoDataFrame
+    passo = max(1, len(features) // _AMOSTRA)
+    amostra = features[::passo]
+    estimativa = len(json.dumps(amostra, separators=(",", ":"))) * len(features) / len(amostra)
+    if estimativa <= orcamento:
+        return geojson, []
+    gdf = gpd.GeoDataFrame.from_features(features, crs="EPSG:4326")
+    gdf, aplicadas = ajustar_ao_orcamento(gdf, orcamento_mb, **kwargs)
+    return json.loads(gdf.to_json(drop_id=True)), aplicadas
+
+
+def ajustar_feicoes(
+    feicoes: FeicoesCompactas, orcamento_mb: Optional[float] = None, **kwargs
+) -> Tuple[Union[FeicoesCompactas, Dict], List[str]]:
+    """
+    Versão de `ajustar_ao_orcamento` para uma coleção em arrays (ver
+    `modules.ragged`). Se cabe no orçamento, a coleção volta como veio, sem
+    passar por dicionários, e pode ser codificada direto (ver
+    `modules.precision.codificar_bytes`); só a degradada vira GeoJSON.
+    """
+    n = len(feicoes)
+    if not n:
+        return feicoes, []
+    orcamento = (orcamento_mb or ORCAMENTO_MB) * 1e6
+    # Mesma estimativa barata de `ajustar_geojson`, sobre uma amostra espaçada
+    amostra = feicoes.selecionar(np.arange(0, n, max(1, n // _AMOSTRA)))
+    estimativa = len(amostra.para_geojson_bytes()) * n / len(amostra)
+    if estimativa <= orcamento:
+        return feicoes, []
+    gdf, aplicadas = ajustar_ao_orcamento(feicoes.para_gdf(), orcamento_mb, **kwargs)
+    return json.loads(gdf.to_json(drop_id=True)), aplicadas
+
+
+def avisar_degradacoes(aplicadas: List[str], orcamento_mb: Optional[float] = None) -> None:
+    """Informa na página quais degradações foram aplicadas ao mapa."""
+    if not aplicadas:
+        return
+    st.info(
+        f"O mapa excedia o limite de transferência ({orcamento_mb or ORCAMENTO_MB:g} MB) e foi reduzido: "
+        + "; ".join(aplicadas) + "."
+    )
@@ -0,0 +1,162 @@
+# modules/precision.py
+
+import json
+import math
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+import shapely
+
+from modules.ragged import FeicoesCompactas
+
+# Zoom máximo dos mapas (Leaflet/folium)
+ZOOM_MAXIMO = 18
+# Quantos níveis além do zoom inicial o mapa ainda precisa mostrar sem serrilhar
+ZOOM_APROXIMACAO = 8
+# Zoom inicial dos mapas estaduais, usado quando nada mais é informado
+ZOOM_ESTADO = 7
+# Exportações (shapefile) guardam mais que o necessário para a tela (~1 cm)
+CASAS_EXPORTACAO = 7
+
+
+def zoom_para_limites(limites: Tuple[float, float, float, float], largura_px: int = 1000) -> float:
+    """Zoom em que a extensão (oeste, sul, leste, norte) cabe em `largura_px` pixels."""
+    oeste, sul, leste, norte = limites
+    extensao = max(leste - oeste, norte - sul)
+    if not extensao > 0:
+        return ZOOM_MAXIMO
+    return min(ZOOM_MAXIMO, max(0.0, math.log2(360 * largura_px / (256 * extensao))))
+
+
+def casas_para(zoom: Optional[float] = None, limites: Optional[Tuple[float, float, float, float]] = None) -> int:
+    """
+    Casas decimais das coordenadas de um mapa aberto em `zoom` (ou ajustado
+    a `limites`): a grade fica em meio pixel do zoom mais próximo que o
+    usuário deve alcançar (`ZOOM_APROXIMACAO` níveis adiante). Um mapa
+    estadual sai com 5 casas (~1 m); um município, com 6 (~0,1 m).
+    """
+    if zoom is None:
+        zoom = zoom_para_limites(limites) if limites else ZOOM_ESTADO
+    zoom_detalhe = min(ZOOM_MAXIMO, zoom + ZOOM_APROXIMACAO)
+    meio_pixel = 360 / (256 * 2 ** zoom_detalhe) / 2
+    return int(math.ceil(-math.log10(meio_pixel)))
+
+
+def _poligonal(feicoes: FeicoesCompactas) -> bool:
+    return feicoes.tipo in (shapely.GeometryType.POLYGON, shapely.GeometryType.MULTIPOLYGON)
+
+
+def _features_codificadas(feicoes: FeicoesCompactas, casas: int) -> List[Dict]:
+    """
+    Feições com as coordenadas na grade de 10^-casas graus, em inteiros,
+    sem vértices consecutivos repetidos e com cada anel em delta: o primeiro
+    vértice é absoluto e os demais são a diferença para o anterior, num
+    array plano [x0, y0, dx1, dy1, ...].
+    """
+    q = np.round(feicoes.coordenadas * 10 ** casas).astype(np.int64)
+    aneis = feicoes.offsets[0]
+    inicio_anel = np.zeros(len(q), dtype=bool)
+    inicio_anel[aneis[:-1][aneis[:-1] < aneis[1:]]] = True
+    repetido = np.zeros(len(q), dtype=bool)
+    repetido[1:] = (q[1:] == q[:-1]).all(axis=1)
+    manter = ~repetido | inicio_anel
+
+    mantidos = np.zeros(len(q) + 1, dtype=np.int64)
+    np.cumsum(manter, out=mantidos[1:])
+    aneis = mantidos[aneis]
+    q = q[manter]
+    delta = q.copy()
+    delta[1:] -= q[:-1]
+    inicios = aneis[:-1][aneis[:-1] < aneis[1:]]
+    delta[inicios] = q[inicios]
+
+    plano = delta.ravel().tolist()
+    nivel = [plano[2 * a:2 * b] for a, b in zip(aneis[:-1].tolist(), aneis[1:].tolist())]
+    for offsets in feicoes.offsets[1:]:
+        nivel = [nivel[a:b] for a, b in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+    tipo = "Polygon" if feicoes.tipo == shapely.GeometryType.POLYGON else "MultiPolygon"
+    return [
+        {"type": "Feature", "properties": p, "geometry": {"type": tipo, "coordinates": c}}
+        for p, c in zip(feicoes.propriedades(), nivel)
+    ]
+
+
+def codificar_features(feicoes: FeicoesCompactas, casas: int) -> List[str]:
+    """Uma string JSON codificada (ver `_features_codificadas`) por feição, para compor coleções."""
+    return [json.dumps(f, separators=(",", ":"), ensure_ascii=False) for f in _features_codificadas(feicoes, casas)]
+
+
+def colecao_codificada(features: Iterable[str], casas: int) -> bytes:
+    """FeatureCollection a partir de feições já codificadas com as mesmas `casas`."""
+    return (
+        '{"type":"FeatureCollection","transform":{"casas":' + str(casas) + '},"features":['
+        + ",".join(features) + "]}"
+    ).encode("utf-8")
+
+
+def arredondar_geojson(geojson: Optional[Dict], casas: int) -> Optional[Dict]:
+    """
+    GeoJSON comum com as coordenadas arredondadas a `casas` e sem vértices
+    consecutivos repetidos. Para quem lê GeoJSON padrão (ex.: `folium.GeoJson`).
+    """
+    features = (geojson or {}).get("features") or []
+    if not features:
+        return geojson
+    com_geometria = [f for f in features if f.get("geometry")]
+    geometrias = shapely.from_geojson([json.dumps(f["geometry"]) for f in com_geometria])
+    geometrias = shapely.transform(geometrias, lambda xy: np.round(xy, casas))
+    geometrias = shapely.remove_repeated_points(geometrias)
+    arredondadas = [
+        {**f, "geometry": json.loads(g)} for f, g in zip(com_geometria, shapely.to_geojson(geometrias))
+    ]
+    return {**geojson, "features": arredondadas + [f for f in features if not f.get("geometry")]}
+
+
+def codificar(geojson: Optional[Dict], casas: int) -> Optional[Dict]:
+    """
+    FeatureCollection com as coordenadas quantizadas e em delta, marcada com
+    `"transform": {"casas": ...}` para o decodificador do navegador (ver
+    `modules.map_layers.DECODIFICAR_JS`). Coleções que não são só de
+    polígonos (ex.: reduzidas a pontos pelo orçamento) saem só arredondadas.
+    """
+    features = (geojson or {}).get("features") or []
+    if not features:
+        return geojson
+    try:
+        feicoes = FeicoesCompactas.de_geojson(geojson)
+    except (ValueError, shapely.errors.GEOSException):
+        feicoes = None
+    if feicoes is None or not _poligonal(feicoes):
+        return arredondar_geojson(geojson, casas)
+    return {**geojson, **codificar_feicoes(feicoes, casas)}
+
+
+def codificar_feicoes(feicoes: FeicoesCompactas, casas: int) -> Dict:
+    """Versão de `codificar` para uma coleção que já está em arrays (ver `modules.ragged`)."""
+    if not len(feicoes):
+        return {"type": "FeatureCollection", "features": []}
+    return {"type": "FeatureCollection", "transform": {"casas": casas},
+            "features": _features_codificadas(feicoes, casas)}
+
+
+def codificar_bytes(dados: Union[None, Dict, FeicoesCompactas], casas: int) -> bytes:
+    """
+    `codificar` serializado. Uma coleção em arrays (ver `modules.ragged`) é
+    codificada direto, sem ida e volta por dicionários GeoJSON.
+    """
+    if isinstance(dados, FeicoesCompactas):
+        dados = (
+            codificar_feicoes(dados, casas) if not len(dados) or _poligonal(dados)
+            else arredondar_geojson(dados.para_geojson(), casas)
+        )
+    else:
+        dados = codificar(dados, casas)
+    return json.dumps(dados, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def arredondar_gdf(gdf, casas: int = CASAS_EXPORTACAO):
+    """Cópia de `gdf` com a geometria na grade de `casas` decimais, sem vértices repetidos."""
+    gdf = gdf.copy()
+    geometrias = shapely.transform(gdf.geometry.values, lambda xy: np.round(xy, casas))
+    gdf[gdf.geometry.name] = shapely.remove_repeated_points(geometrias)
+    return gdf
@@ -0,0 +1,124 @@
+# modules/progressive.py
+
+import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import quote, unquote
+
+import numpy as np
+import streamlit as st
+
+from modules.asset_server import iniciar_servidor, registrar_rota
+from modules.data_loader import (
+    fetch_regioes,
+    fetch_municipios,
+    fetch_geojson_por_municipio,
+    fetch_versao_dados
+)
+
+# Requisições simultâneas ao backend durante uma carga progressiva
+MAX_WORKERS = int(st.secrets.get("PROGRESSIVO_WORKERS", 8))
+_POOL = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="progressivo")
+
+# Marcador de "sem filtro" nos segmentos da URL
+TODOS = "_"
+
+# Casas decimais das coordenadas no stream: mapas regionais abrem no zoom 8
+# (ver `modules.precision.casas_para(8)`); a camada decodifica no navegador
+CASAS = 5
+
+
+@st.cache_data(ttl=3600, max_entries=1024, show_spinner=False)
+def carregar_municipio(municipio: str, categoria: Optional[str] = None, tolerancia: float = 0.001,
+                       versao: str = "") -> Dict:
+    """
+    Busca as propriedades (filtradas e simplificadas) de um município. Os
+    limites não vão no stream: vêm prontos de `modules.boundaries`. A
+    versão dos dados entra na chave do cache.
+    """
+    # Importações tardias: mantêm leve o import das páginas
+    from modules.precision import codificar_feicoes
+    from modules.ragged import FeicoesCompactas
+
+    # Filtro e simplificação sobre arrays planos, sem percorrer dicionários
+    feicoes = FeicoesCompactas.de_geojson(fetch_geojson_por_municipio(municipio))
+    if categoria and len(feicoes):
+        if "categoria" in feicoes.atributos.columns:
+            categorias = feicoes.atributos["categoria"].astype(object).fillna("Sem Classificação").to_numpy()
+        else:
+            categorias = np.full(len(feicoes), "Sem Classificação", dtype=object)
+        feicoes = feicoes.filtrar(categorias == categoria)
+    return {
+        "municipio": municipio,
+        "propriedades": codificar_feicoes(feicoes.simplificar(tolerancia), CASAS),
+    }
+
+
+def carregar_em_paralelo(municipios: List[str], categoria: Optional[str] = None,
+                         tolerancia: float = 0.001, versao: str = "") -> Iterator[Dict]:
+    """
+    Busca os municípios em paralelo e devolve cada resultado (ver
+    `carregar_municipio`) na ordem em que as respostas chegam. Um município
+    que falha vira `{"municipio", "erro"}`, que a camada mostra no mapa.
+    """
+    futuros = {_POOL.submit(carregar_municipio, m, categoria, tolerancia, versao): m for m in municipios}
+    for futuro in as_completed(futuros):
+        try:
+            yield futuro.result()
+        except Exception as e:
+            yield {"municipio": futuros[futuro], "erro": str(e)}
+
+
+def transmitir(municipios: List[str], categoria: Optional[str] = None, tolerancia: float = 0.001,
+               versao: str = "") -> Iterator[bytes]:
+    """Gera uma linha NDJSON por município, o mais rápido primeiro."""
+    for parte in carregar_em_paralelo(municipios, categoria, tolerancia, versao):
+        yield (json.dumps(parte, separators=(",", ":"), ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def municipios_do_escopo(regiao: Optional[str]) -> List[str]:
+    """Municípios de uma região, ou de todas as regiões quando `regiao` é None."""
+    if regiao:
+        return fetch_municipios(regiao)
+    municipios = []
+    for r in fetch_regioes():
+        municipios.extend(fetch_municipios(r))
+    return municipios
+
+
+def _servir_stream(caminho: str) -> Optional[Tuple[Iterator[bytes], str]]:
+    """
+    Rota do servidor de assets: `<versao>/<regiao>/<categoria>/<tolerancia>.ndjson`.
+
+    Só a versão atual dos dados é servida: uma página cacheada de outra
+    versão recebe 404 (e avisa no mapa) em vez de misturar dados novos.
+    """
+    partes = caminho.split("/")
+    if len(partes) != 4 or not partes[3].endswith(".ndjson"):
+        return None
+    versao, regiao, categoria, tolerancia = (unquote(p) for p in partes)
+    try:
+        tolerancia = float(tolerancia[:-len(".ndjson")])
+    except ValueError:
+        return None
+    if versao != fetch_versao_dados():
+        return None
+    municipios = municipios_do_escopo(None if regiao == TODOS else regiao)
+    return (
+        transmitir(municipios, None if categoria == TODOS else categoria, tolerancia, versao),
+        "application/x-ndjson",
+    )
+
+
+def url_progressiva(regiao: Optional[str], categoria: Optional[str], tolerancia: float, versao: str) -> str:
+    """
+    URL do stream NDJSON com os municípios de `regiao` (None = estado inteiro).
+
+    A URL depende só dos parâmetros e da versão dos dados, então pode ser
+    guardada em HTML cacheado. A resposta em si vai com `no-store`: um
+    município que falhou não fica gravado no navegador.
+    """
+    registrar_rota("progressivo", _servir_stream)
+    base_url = iniciar_servidor()
+    segmentos = [versao, regiao or TODOS, categoria or TODOS, f"{tolerancia}.ndjson"]
+    return f"{base_url}/progressivo/" + "/".join(quote(s, safe="") for s in segmentos)
@@ -0,0 +1,237 @@
+# modules/query.py
+
+from typing import Dict, List, Optional, Tuple
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+
+from modules.data_loader import (
+    fetch_geojson_assentamentos,
+    fetch_geojson_por_municipio,
+    fetch_geojson_por_regiao,
+)
+from modules.geo_store import CamadaIndexada, Filtro, obter_store, store_em_memoria
+
+# Faixa numérica (mínimo, máximo), inclusiva; None deixa a ponta aberta
+Faixa = Optional[Tuple[Optional[float], Optional[float]]]
+
+# Filtro de igualdade -> colunas indexadas onde procurar o valor, em ordem.
+# Nos assentamentos o município pode vir normalizado ou com o nome original
+COLUNAS = {
+    "propriedades": {"municipio": ["nome_municipio"], "regiao": ["regiao"], "categoria": ["categoria"]},
+    "assentamentos": {"municipio": ["nome_municipio", "nome_municipio_original"], "tipo": ["tipo"]},
+}
+
+# Filtros que o backend (e a réplica) aplicam na própria requisição
+FILTROS_BACKEND = {
+    "propriedades": ("municipio", "regiao"),
+    "assentamentos": ("municipio", "tipo"),
+}
+
+# Simplificação da camada de assentamentos no store (ver GeoStore) e no backend
+TOLERANCIA_ASSENTAMENTOS = 0.001
+
+
+def _numerico(valores) -> np.ndarray:
+    """Valores da coluna como float; texto ou ausente vira NaN."""
+    return pd.to_numeric(pd.Series(valores), errors="coerce").to_numpy(dtype=float)
+
+
+def _mascara_igualdade(atributos: pd.DataFrame, colunas: List[str], valor: Filtro) -> np.ndarray:
+    """Linhas em que alguma das `colunas` (as que existirem) tem o valor (ou um dos valores)."""
+    valores = [valor] if isinstance(valor, str) else list(valor)
+    colunas = [c for c in colunas if c in atributos.columns]
+    if not colunas:
+        return np.zeros(len(atributos), dtype=bool)
+    return atributos[colunas].isin(valores).any(axis=1).to_numpy()
+
+
+def _mascara_faixa(valores: np.ndarray, faixa: Tuple[Optional[float], Optional[float]]) -> np.ndarray:
+    minimo, maximo = faixa
+    mascara = ~np.isnan(valores)
+    if minimo is not None:
+        mascara &= valores >= minimo
+    if maximo is not None:
+        mascara &= valores <= maximo
+    return mascara
+
+
+class Resultado:
+    """
+    Linhas de uma camada que atendem a uma consulta.
+
+    Guarda só as posições: contagens e somas são calculadas sobre as colunas,
+    e as feições só são copiadas quando se pede o GeoDataFrame ou o GeoJSON.
+    """
+
+    def __init__(self, camada: CamadaIndexada, posicoes: np.ndarray):
+        self.camada = camada
+        self.posicoes = posicoes
+
+    def __len__(self) -> int:
+        return len(self.posicoes)
+
+    def valores(self, coluna: str) -> np.ndarray:
+        if coluna not in self.camada.gdf.columns:
+            return np.full(len(self.posicoes), np.nan)
+        return _numerico(self.camada.gdf[coluna].to_numpy()[self.posicoes])
+
+    def soma(self, coluna: str) -> float:
+        valores = self.valores(coluna)
+        return float(np.nansum(valores)) if len(valores) else 0.0
+
+    def media(self, coluna: str) -> float:
+        valores = self.valores(coluna)
+        validos = valores[~np.isnan(valores)]
+        return float(validos.mean()) if len(validos) else 0.0
+
+    def distintos(self, coluna: str) -> int:
+        if coluna not in self.camada.gdf.columns:
+            return 0
+        return int(pd.Series(self.camada.gdf[coluna].to_numpy()[self.posicoes]).nunique())
+
+    def gdf(self) -> gpd.GeoDataFrame:
+        return self.camada.linhas(self.posicoes)
+
+    def geojson(self) -> Dict:
+        return self.camada.geojson_linhas(self.posicoes)
+
+
+class Consulta:
+    """
+    Consulta por atributos sobre uma camada ("propriedades" ou "assentamentos").
+
+    Igualdade (município, região, categoria, tipo de assentamento) e faixas
+    numéricas (área, módulo fiscal). Com a base estadual já em memória, a
+    igualdade usa os índices do store e as faixas viram máscaras numpy sobre
+    as linhas já selecionadas. Com o store ainda frio, uma consulta restrita
+    vai aos loaders com os filtros que o backend aceita como parâmetros da
+    requisição; o resto é filtrado nas colunas de atributos antes de montar
+    as geometrias, então só as feições que passam são materializadas.
+    """
+
+    def __init__(self, camada: str, municipio: Filtro = None, regiao: Filtro = None,
+                 categoria: Filtro = None, tipo: Filtro = None,
+                 area: Faixa = None, modulo_fiscal: Faixa = None):
+        if camada not in COLUNAS:
+            raise ValueError(f"Camada sem suporte a consultas: {camada}")
+        if isinstance(tipo, str):
+            tipo = tipo.lower()
+        elif tipo is not None:
+            tipo = [t.lower() for t in tipo]
+        igualdade = {"municipio": municipio, "regiao": regiao, "categoria": categoria, "tipo": tipo}
+        for nome, valor in igualdade.items():
+            if valor is not None and nome not in COLUNAS[camada]:
+                raise ValueError(f"Filtro '{nome}' não se aplica à camada {camada}")
+        self.camada = camada
+        self.igualdade: Dict[str, Filtro] = {k: v for k, v in igualdade.items() if v is not None}
+        self.faixas: Dict[str, Tuple[Optional[float], Optional[float]]] = {
+            coluna: faixa for coluna, faixa in {"area": area, "modulo_fiscal": modulo_fiscal}.items()
+            if faixa is not None and any(v is not None for v in faixa)
+        }
+
+    # --- planejamento ----------------------------------------------------------
+
+    def parametros_backend(self) -> Dict[str, str]:
+        """Filtros de igualdade que vão na requisição (o backend aceita um valor por parâmetro)."""
+        return {
+            nome: self.igualdade[nome] for nome in FILTROS_BACKEND[self.camada]
+            if isinstance(self.igualdade.get(nome), str)
+        }
+
+    def restrita(self) -> bool:
+        """
+        Se vale mais buscar só o recorte nos loaders do que carregar a base
+        estadual: assentamentos vêm numa requisição só; propriedades, quando
+        há um município ou uma região para mandar ao backend.
+        """
+        return self.camada == "assentamentos" or bool(self.parametros_backend())
+
+    # --- execução --------------------------------------------------------------
+
+    def _posicoes_igualdade(self, camada: CamadaIndexada) -> np.ndarray:
+        filtros: Dict[str, Filtro] = {}
+        for nome, valor in self.igualdade.items():
+            valores = [valor] if isinstance(valor, str) else list(valor)
+            candidatas = [c for c in COLUNAS[self.camada][nome] if c in camada.indices]
+            coluna = next((c for c in candidatas if any(v in camada.indices[c] for v in valores)), None)
+            if coluna is None:
+                return np.empty(0, dtype=np.intp)
+            filtros[coluna] = valor
+        return camada.posicoes(**filtros)
+
+    def _filtrar_faixas(self, gdf: pd.DataFrame, posicoes: np.ndarray) -> np.ndarray:
+        for coluna, faixa in self.faixas.items():
+            if coluna not in gdf.columns:
+                return np.empty(0, dtype=np.intp)
+            valores = _numerico(gdf[coluna].to_numpy()[posicoes])
+            posicoes = posicoes[_mascara_faixa(valores, faixa)]
+        return posicoes
+
+    def no_store(self, store) -> Resultado:
+        camada: CamadaIndexada = getattr(store, self.camada)
+        posicoes = self._posicoes_igualdade(camada)
+        return Resultado(camada, self._filtrar_faixas(camada.gdf, posicoes))
+
+    def _buscar(self) -> List[Dict]:
+        parametros = self.parametros_backend()
+        if self.camada == "assentamentos":
+            geojson = fetch_geojson_assentamentos(
+                parametros.get("municipio"), tolerance=TOLERANCIA_ASSENTAMENTOS, tipo=parametros.get("tipo")
+            )
+        elif "municipio" in parametros:
+            geojson = fetch_geojson_por_municipio(parametros["municipio"])
+        else:
+            geojson = fetch_geojson_por_regiao(parametros["regiao"])
+        return (geojson or {}).get("features", [])
+
+    def no_backend(self) -> Resultado:
+        features = self._buscar()
+        atributos = pd.DataFrame.from_records([f.get("properties") or {} for f in features])
+        self._derivar_colunas(atributos)
+        enviados = self.parametros_backend()
+        restantes = {k: v for k, v in self.igualdade.items() if k not in enviados}
+
+        mascara = np.ones(len(atributos), dtype=bool)
+        for nome, valor in restantes.items():
+            mascara &= _mascara_igualdade(atributos, COLUNAS[self.camada][nome], valor)
+        posicoes = self._filtrar_faixas(atributos, np.flatnonzero(mascara))
+
+        selecionadas = [features[i] for i in posicoes]
+        if selecionadas:
+            gdf = gpd.GeoDataFrame.from_features(selecionadas, crs="EPSG:4326")
+            self._derivar_colunas(gdf)
+        else:
+            gdf = gpd.GeoDataFrame(columns=["geometry"], geometry="geometry", crs="EPSG:4326")
+        return Resultado(CamadaIndexada(gdf, []), np.arange(len(gdf)))
+
+    def _derivar_colunas(self, atributos: pd.DataFrame) -> None:
+        """Colunas que o store também deriva (ver GeoStore), para filtrar igual nos dois caminhos."""
+        if self.camada == "assentamentos" and "tipo_assentamento" in atributos.columns:
+            atributos["tipo"] = atributos["tipo_assentamento"].astype(str).str.lower()
+
+    def refinar(self, resultado: Resultado) -> Resultado:
+        """
+        Aplica a consulta às linhas de um resultado já obtido (ex.: guardado em
+        cache), sem nova busca: só máscaras sobre as colunas de atributos.
+        """
+        gdf, posicoes = resultado.camada.gdf, resultado.posicoes
+        for nome, valor in self.igualdade.items():
+            mascara = _mascara_igualdade(gdf.iloc[posicoes], COLUNAS[self.camada][nome], valor)
+            posicoes = posicoes[mascara]
+        return Resultado(resultado.camada, self._filtrar_faixas(gdf, posicoes))
+
+
+def executar(consulta: Consulta, versao: str) -> Resultado:
+    """
+    Executa a consulta no lugar mais barato: no store estadual quando ele já
+    está em memória (ou quando a consulta cobre o estado inteiro), senão só o
+    recorte é buscado, com os filtros empurrados para o backend/réplica.
+    """
+    store = store_em_memoria(versao)
+    if store is None:
+        if consulta.restrita():
+            return consulta.no_backend()
+        store = obter_store(versao)
+    return consulta.no_store(store)
@@ -0,0 +1,262 @@
+# modules/ragged.py
+
+import json
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import shapely
+
+# Colunas de texto com poucos valores distintos (proporção) viram `category`
+_PROPORCAO_CATEGORICA = 0.5
+
+
+def _expandir(offsets: np.ndarray, indices: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Para os elementos `indices` de um nível, devolve os índices dos filhos no
+    nível de baixo (na mesma ordem) e os offsets já renumerados.
+    """
+    inicio, fim = offsets[indices], offsets[indices + 1]
+    tamanhos = fim - inicio
+    novos = np.zeros(len(indices) + 1, dtype=offsets.dtype)
+    np.cumsum(tamanhos, out=novos[1:])
+    filhos = np.repeat(inicio - novos[:-1], tamanhos) + np.arange(novos[-1], dtype=offsets.dtype)
+    return filhos, novos
+
+
+def _tipar(atributos: pd.DataFrame) -> pd.DataFrame:
+    """Textos repetitivos viram `category` (números já chegam tipados do JSON)."""
+    for coluna in atributos.columns:
+        serie = atributos[coluna]
+        texto = serie.dtype == object or pd.api.types.is_string_dtype(serie.dtype)
+        if texto and serie.nunique() <= max(1, len(serie) * _PROPORCAO_CATEGORICA):
+            atributos[coluna] = serie.astype("category")
+    return atributos
+
+
+def _ragged_de_poligonos(geometrias: List[Optional[Dict]], dtype):
+    """
+    Layout de `shapely.to_ragged_array` montado direto das listas de
+    coordenadas do GeoJSON, sem criar geometrias GEOS. Só para coleções 2D
+    de Polygon/MultiPolygon (mistas viram MultiPolygon, como no shapely);
+    devolve None para o resto.
+    """
+    tipos = {g.get("type") for g in geometrias if g}
+    if not geometrias or not tipos <= {"Polygon", "MultiPolygon"}:
+        return None
+    multi = "MultiPolygon" in tipos
+    pontos: List = []
+    aneis, partes, feicoes = [0], [0], [0]
+    for g in geometrias:
+        poligonos = [] if not g else g["coordinates"] if g["type"] == "MultiPolygon" else [g["coordinates"]]
+        for poligono in poligonos:
+            for anel in poligono:
+                pontos.extend(anel)
+                aneis.append(len(pontos))
+            partes.append(len(aneis) - 1)
+        feicoes.append(len(partes) - 1 if multi else len(aneis) - 1)
+    try:
+        coordenadas = np.array(pontos, dtype=dtype) if pontos else np.empty((0, 2), dtype=dtype)
+    except ValueError:
+        return None
+    if coordenadas.ndim != 2 or coordenadas.shape[1] != 2:
+        return None
+    offsets = [np.asarray(aneis, dtype=np.int64)]
+    if multi:
+        offsets.append(np.asarray(partes, dtype=np.int64))
+    offsets.append(np.asarray(feicoes, dtype=np.int64))
+    tipo = shapely.GeometryType.MULTIPOLYGON if multi else shapely.GeometryType.POLYGON
+    return tipo, coordenadas, tuple(offsets)
+
+
+class FeicoesCompactas:
+    """
+    Coleção de polígonos em arrays planos, no lugar de listas de dicionários.
+
+    As coordenadas de todas as feições ficam num único array (n, 2) e a
+    estrutura (anéis → partes → feições) em arrays de offsets, no layout de
+    `shapely.to_ragged_array`; os atributos ficam em colunas tipadas. Um
+    recorte contíguo (ex.: uma categoria depois de `agrupar`) é só uma view
+    das coordenadas, e limites, centro e filtros são operações numpy.
+    """
+
+    def __init__(self, tipo: shapely.GeometryType, coordenadas: np.ndarray,
+                 offsets: Tuple[np.ndarray, ...], atributos: pd.DataFrame):
+        self.tipo = tipo
+        self.coordenadas = coordenadas
+        # Do nível mais interno (anel → coordenadas) ao mais externo (feição → partes)
+        self.offsets = offsets
+        self.atributos = atributos.reset_index(drop=True)
+
+    # --- conversões ------------------------------------------------------------
+
+    @classmethod
+    def de_geometrias(cls, geometrias: np.ndarray, atributos: pd.DataFrame,
+                      dtype=np.float64) -> "FeicoesCompactas":
+        geometrias = np.asarray(geometrias, dtype=object)
+        vazias = pd.isna(geometrias)
+        if vazias.any():
+            geometrias = geometrias.copy()
+            geometrias[vazias] = shapely.Polygon()
+        if not len(geometrias):
+            vazio = np.zeros(1, dtype=np.int64)
+            return cls(shapely.GeometryType.POLYGON, np.empty((0, 2), dtype=dtype), (vazio, vazio), atributos)
+        tipo, coordenadas, offsets = shapely.to_ragged_array(geometrias)
+        return cls(tipo, np.ascontiguousarray(coordenadas, dtype=dtype), offsets, atributos)
+
+    @classmethod
+    def de_geojson(cls, geojson: Optional[Dict], dtype=np.float64) -> "FeicoesCompactas":
+        """Coleção a partir de um FeatureCollection (polígonos e multipolígonos)."""
+        features = (geojson or {}).get("features") or []
+        atributos = _tipar(pd.DataFrame.from_records([f.get("properties") or {} for f in features]))
+        direto = _ragged_de_poligonos([f.get("geometry") for f in features], dtype)
+        if direto is not None:
+            return cls(*direto, atributos)
+        geometrias = shapely.from_geojson(
+            [json.dumps(f["geometry"]) if f.get("geometry") else None for f in features]
+        ) if features else np.array([], dtype=object)
+        return cls.de_geometrias(geometrias, atributos, dtype)
+
+    @classmethod
+    def de_gdf(cls, gdf, dtype=np.float64) -> "FeicoesCompactas":
+        return cls.de_geometrias(
+            gdf.geometry.values, pd.DataFrame(gdf.drop(columns=gdf.geometry.name)), dtype
+        )
+
+    def geometrias(self) -> np.ndarray:
+        if not len(self):
+            return np.array([], dtype=object)
+        return shapely.from_ragged_array(self.tipo, self.coordenadas.astype(np.float64, copy=False), self.offsets)
+
+    def para_gdf(self):
+        import geopandas as gpd  # importação tardia: só quem converte paga o import
+        return gpd.GeoDataFrame(self.atributos.copy(), geometry=self.geometrias(), crs="EPSG:4326")
+
+    def propriedades(self) -> List[Dict]:
+        """Atributos de cada feição como dicionário (ausentes viram None)."""
+        atributos = self.atributos.astype(object)
+        return atributos.where(pd.notna(atributos), None).to_dict("records")
+
+    def para_geojson(self) -> Dict:
+        geometrias = shapely.to_geojson(self.geometrias())
+        return {
+            "type": "FeatureCollection",
+            "features": [
+                {"type": "Feature", "properties": p, "geometry": json.loads(g)}
+                for p, g in zip(self.propriedades(), geometrias)
+            ],
+        }
+
+    def para_geojson_bytes(self) -> bytes:
+        """FeatureCollection serializado direto das geometrias, sem montar dicionários de coordenadas."""
+        geometrias = shapely.to_geojson(self.geometrias())
+        features = ",".join(
+            '{"type":"Feature","properties":' + json.dumps(p, separators=(",", ":"), ensure_ascii=False)
+            + ',"geometry":' + g + "}"
+            for p, g in zip(self.propriedades(), geometrias)
+        )
+        return ('{"type":"FeatureCollection","features":[' + features + "]}").encode("utf-8")
+
+    # --- acesso e recortes -----------------------------------------------------
+
+    def __len__(self) -> int:
+        return len(self.offsets[-1]) - 1 if self.offsets else 0
+
+    def intervalos(self) -> np.ndarray:
+        """Para cada feição, (início, fim) das suas coordenadas no array plano."""
+        limites = self.offsets[-1]
+        for offsets in reversed(self.offsets[:-1]):
+            limites = offsets[limites]
+        return np.column_stack([limites[:-1], limites[1:]])
+
+    def coordenadas_de(self, posicao: int) -> np.ndarray:
+        """Coordenadas (view, sem cópia) de uma feição."""
+        inicio, fim = self.intervalos()[posicao]
+        return self.coordenadas[inicio:fim]
+
+    def fatia(self, inicio: int, fim: int) -> "FeicoesCompactas":
+        """Feições [inicio, fim): as coordenadas são uma view das originais."""
+        offsets, de, ate = [], inicio, fim
+        for nivel in reversed(self.offsets):
+            trecho = nivel[de:ate + 1]
+            offsets.append(trecho - trecho[0])
+            de, ate = int(trecho[0]), int(trecho[-1])
+        return FeicoesCompactas(
+            self.tipo, self.coordenadas[de:ate], tuple(reversed(offsets)), self.atributos.iloc[inicio:fim]
+        )
+
+    def selecionar(self, posicoes: np.ndarray) -> "FeicoesCompactas":
+        """Feições nas posições dadas (cópia compacta só do que foi selecionado)."""
+        indices = np.asarray(posicoes, dtype=self.offsets[-1].dtype)
+        offsets = []
+        for nivel in reversed(self.offsets):
+            indices, novos = _expandir(nivel, indices)
+            offsets.append(novos)
+        return FeicoesCompactas(
+            self.tipo, self.coordenadas[indices], tuple(reversed(offsets)), self.atributos.iloc[posicoes]
+        )
+
+    def filtrar(self, mascara: np.ndarray) -> "FeicoesCompactas":
+        return self.selecionar(np.flatnonzero(mascara))
+
+    def agrupar(self, coluna: str) -> Dict[str, "FeicoesCompactas"]:
+        """
+        Uma coleção por valor de `coluna`. As feições são reordenadas uma vez;
+        cada grupo é então uma fatia contígua, com as coordenadas em view.
+        """
+        if coluna not in self.atributos.columns or not len(self):
+            return {}
+        codigos, valores = pd.factorize(self.atributos[coluna].astype(object), use_na_sentinel=True)
+        ordem = np.argsort(codigos, kind="stable")
+        ordenada = self.selecionar(ordem)
+        codigos = codigos[ordem]
+        mudancas = np.flatnonzero(codigos[1:] != codigos[:-1]) + 1
+        inicios = np.concatenate([[0], mudancas])
+        fins = np.concatenate([mudancas, [len(codigos)]])
+        return {
+            (valores[codigos[i]] if codigos[i] >= 0 else None): ordenada.fatia(int(i), int(f))
+            for i, f in zip(inicios, fins)
+        }
+
+    # --- operações vetorizadas -------------------------------------------------
+
+    def limites(self) -> np.ndarray:
+        """(oeste, sul, leste, norte) de cada feição; NaN para feições vazias."""
+        intervalos = self.intervalos()
+        resultado = np.full((len(intervalos), 4), np.nan)
+        cheias = intervalos[:, 1] > intervalos[:, 0]
+        if cheias.any():
+            inicios = intervalos[cheias, 0]
+            x, y = self.coordenadas[:, 0], self.coordenadas[:, 1]
+            resultado[cheias] = np.column_stack([
+                np.minimum.reduceat(x, inicios), np.minimum.reduceat(y, inicios),
+                np.maximum.reduceat(x, inicios), np.maximum.reduceat(y, inicios),
+            ])
+        return resultado
+
+    def limites_totais(self) -> Optional[Tuple[float, float, float, float]]:
+        if not len(self.coordenadas):
+            return None
+        # Por coluna: a redução em axis=0 de um array (n, 2) é bem mais lenta no numpy
+        x, y = self.coordenadas[:, 0], self.coordenadas[:, 1]
+        return float(x.min()), float(y.min()), float(x.max()), float(y.max())
+
+    def centro(self) -> Optional[List[float]]:
+        """Centro [lat, lng] do retângulo que envolve a coleção."""
+        limites = self.limites_totais()
+        if limites is None:
+            return None
+        oeste, sul, leste, norte = limites
+        return [(sul + norte) / 2, (oeste + leste) / 2]
+
+    def simplificar(self, tolerancia: float) -> "FeicoesCompactas":
+        if not tolerancia or not len(self):
+            return self
+        geometrias = shapely.simplify(self.geometrias(), tolerancia)
+        return FeicoesCompactas.de_geometrias(geometrias, self.atributos, self.coordenadas.dtype)
+
+    def memoria_bytes(self) -> int:
+        return int(
+            self.coordenadas.nbytes + sum(o.nbytes for o in self.offsets)
+            + self.atributos.memory_usage(deep=True).sum()
+        )
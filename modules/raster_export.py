@@ -0,0 +1,257 @@
+# modules/raster_export.py
+
+import math
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import geopandas as gpd
+import numpy as np
+import shapely
+from PIL import Image, ImageChops, ImageColor, ImageDraw, ImageFont
+
+# Metade da circunferência da Terra em EPSG:3857
+ORIGEM = 20037508.342789244
+
+COR_FUNDO = (255, 255, 255, 255)
+COR_LIMITES = "#003366"
+
+
+def _fonte(tamanho: int):
+    # A fonte embutida do Pillow não tem acentos; prefere uma TrueType do sistema
+    for nome in ("DejaVuSans.ttf", "Arial.ttf", "LiberationSans-Regular.ttf"):
+        try:
+            return ImageFont.truetype(nome, tamanho)
+        except OSError:
+            continue
+    try:
+        return ImageFont.load_default(size=tamanho)
+    except TypeError:
+        # Pillow < 10.1 não aceita tamanho na fonte padrão
+        return ImageFont.load_default()
+
+
+class _Enquadramento:
+    """Converte coordenadas EPSG:3857 em pixels da imagem (vetorizado com NumPy)."""
+
+    def __init__(self, bounds, largura: int, margem: float = 0.03):
+        minx, miny, maxx, maxy = bounds
+        dx, dy = (maxx - minx) or 1.0, (maxy - miny) or 1.0
+        minx, maxx = minx - dx * margem, maxx + dx * margem
+        miny, maxy = miny - dy * margem, maxy + dy * margem
+        self.bounds = (minx, miny, maxx, maxy)
+        self.escala = largura / (maxx - minx)
+        self.largura = largura
+        self.altura = max(1, int(round((maxy - miny) * self.escala)))
+
+    def pixels(self, xy: np.ndarray) -> np.ndarray:
+        minx, _, _, maxy = self.bounds
+        return np.column_stack(((xy[:, 0] - minx) * self.escala, (maxy - xy[:, 1]) * self.escala))
+
+
+def _aneis_em_pixels(
+    geometrias, enq: _Enquadramento, tolerancia: float
+) -> Tuple[List[np.ndarray], List[Tuple[np.ndarray, List[np.ndarray]]]]:
+    """
+    Extrai os anéis dos polígonos, já em pixels: os externos dos polígonos
+    sem buraco e, à parte, cada polígono com buracos como (externo, internos).
+
+    Os vértices de todos os anéis são transformados de uma vez e depois
+    fatiados pelos índices retornados pelo shapely.
+    """
+    partes = shapely.get_parts(np.asarray(geometrias))
+    partes = partes[shapely.get_type_id(partes) == 3]  # só Polygon
+    if tolerancia > 0:
+        partes = shapely.simplify(partes, tolerancia)
+
+    def converter(aneis) -> List[Optional[np.ndarray]]:
+        """Anéis em pixels, alinhados à entrada (None para anel vazio ou degenerado)."""
+        saida: List[Optional[np.ndarray]] = [None] * len(aneis)
+        xy, idx = shapely.get_coordinates(aneis, return_index=True)
+        if not len(idx):
+            return saida
+        px = enq.pixels(xy)
+        cortes = np.flatnonzero(np.diff(idx)) + 1
+        for i, p in zip(idx[np.r_[0, cortes]], np.split(px, cortes)):
+            if len(p) >= 3:
+                saida[i] = p
+        return saida
+
+    externos = converter(shapely.get_exterior_ring(partes))
+    n_internos = shapely.get_num_interior_rings(partes)
+    simples = [anel for anel, n in zip(externos, n_internos) if anel is not None and n == 0]
+
+    # Poucos polígonos têm buracos: o k-ésimo buraco de todos sai de uma vez
+    buracos: Dict[int, List[np.ndarray]] = {int(i): [] for i in np.flatnonzero(n_internos > 0)}
+    for k in range(int(n_internos.max()) if len(partes) else 0):
+        alvo = np.flatnonzero(n_internos > k)
+        for i, anel in zip(alvo, converter(shapely.get_interior_ring(partes[alvo], k))):
+            if anel is not None:
+                buracos[int(i)].append(anel)
+    com_buracos = [(externos[i], aneis) for i, aneis in buracos.items() if externos[i] is not None]
+    return simples, com_buracos
+
+
+def _desenhar_poligonos(base: Image.Image, geometrias, enq: _Enquadramento, cor: str,
+                        opacidade: float, cor_borda: str, largura_borda: int) -> None:
+    """Preenche polígonos (respeitando buracos) e desenha as bordas sobre `base`."""
+    simples, com_buracos = _aneis_em_pixels(geometrias, enq, tolerancia=0.5 / enq.escala)
+    if not simples and not com_buracos:
+        return
+
+    if opacidade > 0:
+        mascara = Image.new("L", base.size, 0)
+        desenho = ImageDraw.Draw(mascara)
+        for anel in simples:
+            desenho.polygon(anel.ravel().tolist(), fill=255)
+        # Cada polígono com buracos ganha a sua máscara, somada à da camada:
+        # uma parcela dentro do buraco de outra da mesma cor continua preenchida
+        for externo, internos in com_buracos:
+            x0, y0 = np.maximum(np.floor(externo.min(axis=0)).astype(int), 0)
+            x1, y1 = np.minimum(np.ceil(externo.max(axis=0)).astype(int) + 1, base.size)
+            if x1 <= x0 or y1 <= y0:
+                continue
+            recorte = Image.new("L", (int(x1 - x0), int(y1 - y0)), 0)
+            desenho_recorte = ImageDraw.Draw(recorte)
+            desenho_recorte.polygon((externo - (x0, y0)).ravel().tolist(), fill=255)
+            for anel in internos:
+                desenho_recorte.polygon((anel - (x0, y0)).ravel().tolist(), fill=0)
+            caixa = (int(x0), int(y0), int(x1), int(y1))
+            mascara.paste(ImageChops.lighter(mascara.crop(caixa), recorte), caixa)
+        mascara = mascara.point(lambda v: int(v * opacidade))
+        camada = Image.new("RGBA", base.size, ImageColor.getrgb(cor)[:3] + (255,))
+        base.paste(camada, (0, 0), mascara)
+
+    if largura_borda > 0:
+        desenho = ImageDraw.Draw(base)
+        aneis = simples + [a for externo, internos in com_buracos for a in [externo] + internos]
+        for anel in aneis:
+            desenho.line(anel.ravel().tolist(), fill=cor_borda, width=largura_borda)
+
+
+def _desenhar_basemap(base: Image.Image, enq: _Enquadramento, tiles_dir: Path) -> None:
+    """
+    Compõe o fundo com tiles XYZ de um cache local (`tiles_dir/z/x/y.png`).
+
+    Nada é baixado: tiles ausentes no cache ficam em branco.
+    """
+    minx, miny, maxx, maxy = enq.bounds
+    # Zoom cujo pixel (tile de 256 px) mais se aproxima do pixel da imagem
+    z = int(max(0, min(19, round(math.log2(2 * ORIGEM * enq.escala / 256)))))
+    tamanho = 2 * ORIGEM / 2 ** z
+    x0, x1 = int((minx + ORIGEM) // tamanho), int((maxx + ORIGEM) // tamanho)
+    y0, y1 = int((ORIGEM - maxy) // tamanho), int((ORIGEM - miny) // tamanho)
+    lado = max(1, int(round(tamanho * enq.escala)))
+    for x in range(x0, x1 + 1):
+        for y in range(y0, y1 + 1):
+            arquivo = tiles_dir / str(z) / str(x) / f"{y}.png"
+            if not arquivo.exists():
+                continue
+            tile = Image.open(arquivo).convert("RGBA").resize((lado, lado))
+            px, py = enq.pixels(np.array([[-ORIGEM + x * tamanho, ORIGEM - y * tamanho]]))[0]
+            base.alpha_composite(tile, (int(round(px)), int(round(py))))
+
+
+def _desenhar_legenda(base: Image.Image, cores: Dict[str, str], titulo: Optional[str]) -> None:
+    """Desenha a legenda de categorias no canto inferior direito."""
+    escala = max(1, base.width // 1000)
+    fonte = _fonte(14 * escala)
+    desenho = ImageDraw.Draw(base)
+    linhas = ([titulo] if titulo else []) + list(cores)
+    largura_texto = max(desenho.textlength(t, font=fonte) for t in linhas)
+    passo = 20 * escala
+    caixa = 14 * escala
+    margem = 10 * escala
+    largura = int(largura_texto + caixa + 3 * margem)
+    altura = int(passo * len(linhas) + 2 * margem)
+    x0, y0 = base.width - largura - margem, base.height - altura - margem
+    desenho.rectangle([x0, y0, x0 + largura, y0 + altura], fill=(255, 255, 255, 235), outline="#888")
+    y = y0 + margem
+    if titulo:
+        desenho.text((x0 + margem, y), titulo, fill="#333", font=fonte)
+        y += passo
+    for categoria, cor in cores.items():
+        desenho.rectangle([x0 + margem, y, x0 + margem + caixa, y + caixa], fill=cor, outline="#888")
+        desenho.text((x0 + 2 * margem + caixa, y), categoria, fill="#333", font=fonte)
+        y += passo
+
+
+def renderizar_png(
+    propriedades: gpd.GeoDataFrame,
+    cores: Dict[str, str],
+    limites: Optional[gpd.GeoDataFrame] = None,
+    largura: int = 2000,
+    titulo: Optional[str] = None,
+    legenda: bool = True,
+    opacidade: float = 0.7,
+    basemap_dir: Optional[Path] = None,
+    padrao: str = "Sem Classificação",
+) -> bytes:
+    """
+    Rasteriza propriedades e limites municipais direto do GeoDataFrame para PNG.
+
+    Não usa navegador nem rede: as geometrias são projetadas em Web Mercator,
+    convertidas em pixels com NumPy e desenhadas com Pillow, uma máscara por
+    categoria. `basemap_dir` aponta para um cache local de tiles XYZ opcional.
+    """
+    propriedades = propriedades.to_crs(3857) if propriedades.crs else propriedades.set_crs(4326).to_crs(3857)
+    if limites is not None and not limites.empty:
+        limites = limites.to_crs(3857) if limites.crs else limites.set_crs(4326).to_crs(3857)
+        bounds = np.vstack([propriedades.total_bounds, limites.total_bounds])
+        bounds = (*bounds[:, :2].min(axis=0), *bounds[:, 2:].max(axis=0))
+    else:
+        limites = None
+        bounds = tuple(propriedades.total_bounds)
+
+    enq = _Enquadramento(bounds, largura)
+    base = Image.new("RGBA", (enq.largura, enq.altura), COR_FUNDO)
+    if basemap_dir is not None:
+        _desenhar_basemap(base, enq, Path(basemap_dir))
+
+    categorias = propriedades["categoria"].where(propriedades["categoria"].isin(list(cores)), padrao) \
+        if "categoria" in propriedades.columns else None
+    for categoria, cor in cores.items():
+        geometrias = propriedades.geometry if categorias is None else propriedades.geometry[categorias == categoria]
+        if len(geometrias):
+            _desenhar_poligonos(base, geometrias.values, enq, cor, opacidade, "#000000", 1)
+        if categorias is None:
+            break
+
+    if limites is not None:
+        _desenhar_poligonos(base, limites.geometry.values, enq, COR_LIMITES, 0, COR_LIMITES, 2 * max(1, largura // 1000))
+
+    if legenda:
+        _desenhar_legenda(base, cores, titulo)
+
+    buf = BytesIO()
+    base.convert("RGB").save(buf, format="PNG", optimize=True)
+    return buf.getvalue()
+
+
+def renderizar_lote(
+    propriedades: gpd.GeoDataFrame,
+    coluna: str,
+    cores: Dict[str, str],
+    pasta: Path,
+    limites: Optional[gpd.GeoDataFrame] = None,
+    **kwargs,
+) -> List[Path]:
+    """
+    Gera um PNG por valor de `coluna` (ex.: 'categoria' ou 'regiao') em `pasta`.
+
+    Quando `limites` tem a mesma coluna, cada imagem leva só os limites do grupo.
+    """
+    pasta = Path(pasta)
+    pasta.mkdir(parents=True, exist_ok=True)
+    arquivos = []
+    for valor, grupo in propriedades.groupby(coluna):
+        limites_grupo = limites
+        if limites is not None and coluna in limites.columns:
+            limites_grupo = limites[limites[coluna] == valor]
+        cores_grupo = {valor: cores[valor]} if coluna == "categoria" and valor in cores else cores
+        png = renderizar_png(grupo, cores_grupo, limites_grupo, titulo=str(valor), **kwargs)
+        nome = str(valor).lower().replace(" ", "_").replace("<", "lt")
+        arquivo = pasta / f"mapa_{nome}.png"
+        arquivo.write_bytes(png)
+        arquivos.append(arquivo)
+    return arquivos
@@ -0,0 +1,220 @@
+# modules/raster_tiles.py
+
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import shapely
+from PIL import Image, ImageColor
+
+from modules.asset_server import iniciar_servidor, registrar_rota
+from modules.vector_tiles import (
+    ORIGEM,
+    TILES_DIR,
+    ZOOM_MIN_PROPRIEDADES,
+    camadas,
+    limites_tile,
+    preparar_camadas,
+    remover_versoes_antigas,
+    segmento_valido
+)
+
+TAMANHO_TILE = 256
+MODOS = ("categoria", "densidade")
+
+# Rampa de cores do modo densidade (amarelo claro -> vermelho escuro)
+RAMPA_DENSIDADE = np.array([[255, 255, 178], [254, 204, 92], [253, 141, 60], [240, 59, 32], [189, 0, 38]], dtype=float)
+
+
+class Agregacao:
+    """
+    Centroides das propriedades em arrays NumPy, ordenados por x.
+
+    É tudo o que a agregação precisa: a ordenação permite achar os pontos de
+    um tile com `searchsorted` em vez de varrer o estado inteiro.
+    """
+
+    def __init__(self, x: np.ndarray, y: np.ndarray, codigo: np.ndarray, peso: np.ndarray, paleta: np.ndarray):
+        self.x, self.y, self.codigo, self.peso, self.paleta = x, y, codigo, peso, paleta
+
+    @classmethod
+    def de_propriedades(cls, gdf, cores: Dict[str, str], padrao: str = "Sem Classificação") -> "Agregacao":
+        xy = shapely.get_coordinates(shapely.centroid(gdf.geometry.values))
+        categorias = gdf["categoria"].where(gdf["categoria"].isin(list(cores)), padrao)
+        codigo = pd.Categorical(categorias, categories=list(cores)).codes.astype(np.int32)
+        codigo[codigo < 0] = list(cores).index(padrao) if padrao in cores else 0
+        peso = pd.to_numeric(gdf["area"], errors="coerce").fillna(1.0).clip(lower=0).to_numpy(float)
+        ordem = np.argsort(xy[:, 0], kind="stable")
+        paleta = np.array([ImageColor.getrgb(c)[:3] for c in cores.values()], dtype=np.uint8)
+        return cls(xy[ordem, 0].copy(), xy[ordem, 1].copy(), codigo[ordem], peso[ordem], paleta)
+
+    def bounds(self) -> Tuple[float, float, float, float]:
+        if not len(self.x):
+            return 0.0, 0.0, 0.0, 0.0
+        return float(self.x[0]), float(self.y.min()), float(self.x[-1]), float(self.y.max())
+
+
+def renderizar_tile(ag: Agregacao, z: int, x: int, y: int, modo: str) -> bytes:
+    """Agrega os centroides do tile em uma grade 256x256 e devolve o PNG."""
+    minx, miny, maxx, maxy = limites_tile(z, x, y)
+    i0, i1 = np.searchsorted(ag.x, [minx, maxx])
+    xs, ys = ag.x[i0:i1], ag.y[i0:i1]
+    dentro = (ys >= miny) & (ys < maxy)
+    rgba = np.zeros((TAMANHO_TILE * TAMANHO_TILE, 4), dtype=np.uint8)
+
+    if dentro.any():
+        escala = TAMANHO_TILE / (maxx - minx)
+        px = ((xs[dentro] - minx) * escala).astype(np.int64).clip(0, TAMANHO_TILE - 1)
+        py = ((maxy - ys[dentro]) * escala).astype(np.int64).clip(0, TAMANHO_TILE - 1)
+        pixel = py * TAMANHO_TILE + px
+        contagem = np.bincount(pixel, minlength=TAMANHO_TILE * TAMANHO_TILE)
+        ocupado = contagem > 0
+        # Intensidade em escala log: poucos pixels muito densos não apagam o resto
+        intensidade = np.log1p(contagem) / np.log1p(contagem.max())
+
+        if modo == "densidade":
+            pos = intensidade * (len(RAMPA_DENSIDADE) - 1)
+            base = np.minimum(pos.astype(int), len(RAMPA_DENSIDADE) - 2)
+            frac = (pos - base)[:, None]
+            cor = RAMPA_DENSIDADE[base] * (1 - frac) + RAMPA_DENSIDADE[base + 1] * frac
+            rgba[:, :3] = cor.astype(np.uint8)
+            rgba[:, 3] = np.where(ocupado, 90 + 150 * intensidade, 0).astype(np.uint8)
+        else:
+            # Categoria dominante por pixel, ponderada pela área das propriedades
+            n_cat = len(ag.paleta)
+            soma = np.bincount(
+                pixel * n_cat + ag.codigo[i0:i1][dentro],
+                weights=ag.peso[i0:i1][dentro],
+                minlength=TAMANHO_TILE * TAMANHO_TILE * n_cat
+            ).reshape(-1, n_cat)
+            rgba[:, :3] = ag.paleta[soma.argmax(axis=1)]
+            rgba[:, 3] = np.where(ocupado, 120 + 120 * intensidade, 0).astype(np.uint8)
+
+    img = Image.fromarray(rgba.reshape(TAMANHO_TILE, TAMANHO_TILE, 4), "RGBA")
+    buf = BytesIO()
+    img.save(buf, format="PNG", optimize=True)
+    return buf.getvalue()
+
+
+# Agregações prontas por chave (versão dos dados + paleta)
+_AGREGACOES: Dict[str, Agregacao] = {}
+_PRE_RENDER: Dict[str, threading.Thread] = {}
+
+
+def _arquivo_tile(chave: str, modo: str, z: int, x: int, y: int):
+    return TILES_DIR / "raster" / chave / modo / str(z) / str(x) / f"{y}.png"
+
+
+def _gravar(arquivo, dados: bytes) -> None:
+    arquivo.parent.mkdir(parents=True, exist_ok=True)
+    temporario = arquivo.with_name(f"{arquivo.stem}.{os.getpid()}.{threading.get_ident()}.tmp")
+    temporario.write_bytes(dados)
+    temporario.replace(arquivo)
+
+
+def gerar_tile(chave: str, modo: str, z: int, x: int, y: int) -> Optional[bytes]:
+    """Lê o tile do cache em disco ou o gera a partir da agregação em memória."""
+    arquivo = _arquivo_tile(chave, modo, z, x, y)
+    if arquivo.exists():
+        return arquivo.read_bytes()
+    ag = _AGREGACOES.get(chave)
+    if ag is None:
+        return None
+    dados = renderizar_tile(ag, z, x, y, modo)
+    _gravar(arquivo, dados)
+    return dados
+
+
+def _servir_tile(caminho: str) -> Optional[Tuple[bytes, str]]:
+    """Rota do servidor de assets: `<chave>/<modo>/<z>/<x>/<y>.png`."""
+    partes = caminho.split("/")
+    if len(partes) != 5 or partes[1] not in MODOS or not partes[4].endswith(".png"):
+        return None
+    if not segmento_valido(partes[0]):
+        return None
+    try:
+        z, x, y = int(partes[2]), int(partes[3]), int(partes[4][:-4])
+    except ValueError:
+        return None
+    if not (0 <= z <= 22 and 0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        return None
+    dados = gerar_tile(partes[0], partes[1], z, x, y)
+    return (dados, "image/png") if dados is not None else None
+
+
+def tiles_cobertos(bounds, zooms) -> Iterator[Tuple[int, int, int]]:
+    """Enumera os tiles (z, x, y) que cobrem `bounds` (EPSG:3857) em cada zoom."""
+    minx, miny, maxx, maxy = bounds
+    for z in zooms:
+        tamanho = 2 * ORIGEM / 2 ** z
+        x0, x1 = int((minx + ORIGEM) // tamanho), int((maxx + ORIGEM) // tamanho)
+        y0, y1 = int((ORIGEM - maxy) // tamanho), int((ORIGEM - miny) // tamanho)
+        for x in range(max(x0, 0), min(x1, 2 ** z - 1) + 1):
+            for y in range(max(y0, 0), min(y1, 2 ** z - 1) + 1):
+                yield z, x, y
+
+
+# Estado de cada processo do pool (recebido uma vez no initializer)
+_AG_WORKER: Optional[Agregacao] = None
+
+
+def _iniciar_worker(ag: Agregacao) -> None:
+    global _AG_WORKER
+    _AG_WORKER = ag
+
+
+def _renderizar_no_worker(args) -> None:
+    chave, modo, z, x, y = args
+    arquivo = _arquivo_tile(chave, modo, z, x, y)
+    if not arquivo.exists():
+        _gravar(arquivo, renderizar_tile(_AG_WORKER, z, x, y, modo))
+
+
+def pre_renderizar(chave: str, zooms: List[int], modos=MODOS, processos: Optional[int] = None) -> int:
+    """
+    Gera em paralelo (um processo por núcleo) todos os tiles dos zooms dados.
+
+    Retorna a quantidade de tiles processados.
+    """
+    ag = _AGREGACOES[chave]
+    tarefas = [(chave, modo, z, x, y) for modo in modos for z, x, y in tiles_cobertos(ag.bounds(), zooms)]
+    contexto = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(processos or os.cpu_count(), mp_context=contexto,
+                             initializer=_iniciar_worker, initargs=(ag,)) as pool:
+        list(pool.map(_renderizar_no_worker, tarefas, chunksize=16))
+    return len(tarefas)
+
+
+def preparar_tiles_raster(cores: Dict[str, str], modo: str = "categoria") -> str:
+    """
+    Prepara a agregação estadual e registra a rota de tiles raster.
+
+    Na primeira chamada de cada versão dos dados, dispara em segundo plano a
+    pré-renderização dos zooms baixos. Retorna o template de URL `{z}/{x}/{y}`.
+    """
+    versao = preparar_camadas()
+    paleta = hashlib.sha256(json.dumps(cores, sort_keys=True).encode()).hexdigest()[:6]
+    chave = f"{versao}-{paleta}"
+    if chave not in _AGREGACOES:
+        carregadas = camadas(versao)
+        _AGREGACOES.clear()
+        _AGREGACOES[chave] = Agregacao.de_propriedades(carregadas["propriedades"], cores)
+        # Tiles de versões anteriores dos dados (de qualquer paleta) saem do disco
+        remover_versoes_antigas(TILES_DIR / "raster", lambda nome: nome.startswith(f"{versao}-"))
+
+    registrar_rota("raster", _servir_tile)
+    if chave not in _PRE_RENDER:
+        _PRE_RENDER[chave] = threading.Thread(
+            target=pre_renderizar, args=(chave, list(range(5, ZOOM_MIN_PROPRIEDADES))), daemon=True
+        )
+        _PRE_RENDER[chave].start()
+
+    base_url = iniciar_servidor()
+    return f"{base_url}/raster/{chave}/{modo}/{{z}}/{{x}}/{{y}}.png"
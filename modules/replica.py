@@ -0,0 +1,443 @@
+# modules/replica.py
+#
+# Réplica local (GeoPackage) das camadas do TerraGeo. Sincronização manual:
+#
+#   python -m modules.replica            # incremental
+#   python -m modules.replica --forcar   # revisa todos os municípios
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import requests
+import streamlit as st
+
+from modules.chunked_fetch import buscar_em_partes
+from modules.request_scheduler import LOTE, obter_agendador
+
+REPLICA_PATH = Path(st.secrets.get("REPLICA_GPKG", "replica/terrageo.gpkg"))
+# Sincroniza em segundo plano quando o backend anuncia uma versão nova
+REPLICA_SINCRONIZAR = bool(st.secrets.get("REPLICA_SINCRONIZAR", True))
+# Requisições simultâneas ao backend durante a sincronização
+MAX_WORKERS = int(st.secrets.get("REPLICA_WORKERS", 8))
+# Intervalo mínimo entre tentativas de sincronizar a mesma versão após uma falha
+ESPERA_APOS_FALHA_S = 300
+
+logger = logging.getLogger(__name__)
+
+# Camada -> (endpoint por município, colunas indexadas além de nome_municipio/regiao)
+CAMADAS: Dict[str, Tuple[Optional[str], List[str]]] = {
+    "propriedades": ("/geojson", ["categoria"]),
+    "limites": ("/geojson_limites", []),
+    # Assentamentos vêm numa requisição estadual só e são repartidos por município
+    "assentamentos": (None, ["nome_municipio_original", "tipo"]),
+}
+
+# Cabeçalho da geometria GeoPackage: "GP", versão, flags, SRID e envelope
+# (minx, maxx, miny, maxy), seguido do WKB
+_CABECALHO = struct.Struct("<2sBBi4d")
+_TAMANHO_ENVELOPE = {0: 0, 1: 32, 2: 48, 3: 48, 4: 64}
+
+
+def _hash(conteudo: bytes) -> str:
+    return hashlib.sha256(conteudo).hexdigest()
+
+
+def _texto(valor) -> Optional[str]:
+    return None if valor is None else str(valor)
+
+
+def _para_gpkg(geometrias: Sequence) -> List[Optional[bytes]]:
+    """Geometrias shapely no formato binário do GeoPackage (little-endian, envelope xy)."""
+    import shapely
+
+    blobs = []
+    for g, wkb, (minx, miny, maxx, maxy) in zip(geometrias, shapely.to_wkb(geometrias), shapely.bounds(geometrias)):
+        if g is None:
+            blobs.append(None)
+        elif g.is_empty:
+            blobs.append(struct.pack("<2sBBi", b"GP", 0, 0x11, 4326) + wkb)
+        else:
+            blobs.append(_CABECALHO.pack(b"GP", 0, 0x03, 4326, minx, maxx, miny, maxy) + wkb)
+    return blobs
+
+
+def _wkb(blob: bytes) -> bytes:
+    return blob[8 + _TAMANHO_ENVELOPE[(blob[3] >> 1) & 0x07]:]
+
+
+def _envelope(blob: Optional[bytes], i: int) -> Optional[float]:
+    if blob is None:
+        return None
+    if (blob[3] >> 1) & 0x07:
+        return struct.unpack_from("<4d" if blob[3] & 1 else ">4d", blob, 8)[i]
+    import shapely  # sem envelope no cabeçalho (gravado por outro programa)
+    minx, miny, maxx, maxy = shapely.from_wkb(_wkb(blob)).bounds
+    return (minx, maxx, miny, maxy)[i]
+
+
+class Replica:
+    """
+    Espelho em disco das propriedades, limites e assentamentos.
+
+    Cada camada é uma tabela do GeoPackage com índice espacial (R-tree) e
+    índice por município; os atributos originais de cada feição ficam em
+    `props` (JSON), de modo que a leitura devolve exatamente o GeoJSON do
+    backend. Uma tabela de hashes por camada e município permite sincronizar
+    só o que mudou.
+
+    O GDAL só cria o arquivo (tabelas do padrão e gatilhos do R-tree); todo o
+    resto passa pelo `sqlite3` do Python. Duas bibliotecas SQLite abrindo o
+    mesmo arquivo no mesmo processo desfazem os locks uma da outra e corrompem
+    o banco.
+    """
+
+    def __init__(self, caminho: Path):
+        self.caminho = caminho
+        self._escrita = threading.Lock()
+        # Uma sincronização em segundo plano por vez (ver `sincronizar_em_segundo_plano`)
+        self._sincronizacao = threading.Lock()
+        self._falhas: Dict[str, float] = {}
+        # Metadados já lidos, com a marca do arquivo na hora da leitura (ver `_marca`)
+        self._metas: Dict[str, Tuple[tuple, Optional[str]]] = {}
+
+    # --- metadados -----------------------------------------------------------
+
+    def _conectar(self) -> sqlite3.Connection:
+        conexao = sqlite3.connect(self.caminho, timeout=30)
+        # Funções usadas pelos gatilhos do R-tree criados pelo GDAL
+        conexao.create_function("ST_IsEmpty", 1, lambda b: None if b is None else (b[3] >> 4) & 1, deterministic=True)
+        for i, nome in enumerate(["ST_MinX", "ST_MaxX", "ST_MinY", "ST_MaxY"]):
+            conexao.create_function(nome, 1, lambda b, i=i: _envelope(b, i), deterministic=True)
+        conexao.execute("CREATE TABLE IF NOT EXISTS replica_meta (chave TEXT PRIMARY KEY, valor TEXT)")
+        conexao.execute(
+            "CREATE TABLE IF NOT EXISTS replica_hashes "
+            "(camada TEXT, municipio TEXT, hash TEXT, PRIMARY KEY (camada, municipio))"
+        )
+        return conexao
+
+    def _marca(self) -> tuple:
+        """Tamanho e mtime do GeoPackage e do seu WAL: mudam a cada escrita, de qualquer processo."""
+        marca = []
+        for caminho in (self.caminho, self.caminho.with_name(self.caminho.name + "-wal")):
+            try:
+                estado = caminho.stat()
+            except OSError:
+                marca.append(None)
+                continue
+            marca.append((estado.st_mtime_ns, estado.st_size))
+        return tuple(marca)
+
+    def _meta(self, chave: str) -> Optional[str]:
+        """
+        Lê um metadado. Como as páginas consultam a versão a cada rerun, o
+        valor lido fica guardado enquanto o arquivo não mudar (um `stat` em
+        vez de abrir o GeoPackage).
+        """
+        marca = self._marca()
+        if marca[0] is None:
+            return None
+        guardado = self._metas.get(chave)
+        if guardado is not None and guardado[0] == marca:
+            return guardado[1]
+        try:
+            with self._conectar() as conexao:
+                linha = conexao.execute("SELECT valor FROM replica_meta WHERE chave = ?", (chave,)).fetchone()
+        except sqlite3.Error:
+            return None
+        valor = linha[0] if linha else None
+        self._metas[chave] = (marca, valor)
+        return valor
+
+    def versao(self) -> Optional[str]:
+        """Versão dos dados da última sincronização completa, ou None."""
+        return self._meta("versao")
+
+    def disponivel(self) -> bool:
+        return self.versao() is not None
+
+    def regioes(self) -> Dict[str, List[str]]:
+        """Municípios de cada região, como estavam na última sincronização."""
+        return json.loads(self._meta("regioes") or "{}")
+
+    def _hashes(self, camada: str) -> Dict[str, str]:
+        with self._conectar() as conexao:
+            return dict(conexao.execute("SELECT municipio, hash FROM replica_hashes WHERE camada = ?", (camada,)))
+
+    # --- leitura -------------------------------------------------------------
+
+    def _consultar(self, camada: str, colunas: List[str], bbox: Optional[Tuple[float, float, float, float]],
+                   filtros: Dict[str, object]) -> List[tuple]:
+        condicoes, parametros = [], []
+        for coluna, valor in filtros.items():
+            if valor is None:
+                continue
+            valores = list(valor) if isinstance(valor, (list, tuple, set)) else [valor]
+            condicoes.append(f'"{coluna}" IN ({", ".join("?" * len(valores))})')
+            parametros.extend(valores)
+        if bbox is not None:
+            oeste, sul, leste, norte = bbox
+            condicoes.append(
+                f'fid IN (SELECT id FROM "rtree_{camada}_geom" '
+                "WHERE maxx >= ? AND minx <= ? AND maxy >= ? AND miny <= ?)"
+            )
+            parametros.extend([oeste, leste, sul, norte])
+        sql = f'SELECT {", ".join(colunas)}, geom FROM "{camada}"'
+        if condicoes:
+            sql += " WHERE " + " AND ".join(condicoes)
+        with self._conectar() as conexao:
+            return conexao.execute(sql, parametros).fetchall()
+
+    def features(self, camada: str, bbox: Optional[Tuple[float, float, float, float]] = None,
+                 **filtros) -> List[Dict]:
+        """
+        Feições da camada que atendem aos filtros de igualdade por coluna
+        (valor ou lista; None = sem filtro); `bbox` (oeste, sul, leste, norte)
+        usa o índice espacial.
+        """
+        import shapely
+
+        linhas = self._consultar(camada, ["props"], bbox, filtros)
+        geometrias = shapely.to_geojson(shapely.from_wkb([_wkb(g) if g else None for _, g in linhas]))
+        return [
+            {"type": "Feature", "properties": json.loads(p), "geometry": json.loads(g) if g else None}
+            for (p, _), g in zip(linhas, geometrias)
+        ]
+
+    def geojson(self, camada: str, **filtros) -> Dict:
+        return {"type": "FeatureCollection", "features": self.features(camada, **filtros)}
+
+    def ler_camada(self, camada: str):
+        """
+        Camada inteira como GeoDataFrame, com os atributos de `props` em colunas.
+        `nome_municipio`/`regiao` ausentes nos atributos vêm das colunas da réplica.
+        """
+        import geopandas as gpd
+        import pandas as pd
+        import shapely
+
+        linhas = self._consultar(camada, ["nome_municipio", "regiao", "props"], None, {})
+        atributos = pd.DataFrame.from_records([json.loads(l[2]) for l in linhas], index=pd.RangeIndex(len(linhas)))
+        for i, coluna in enumerate(("nome_municipio", "regiao")):
+            chave = pd.Series([l[i] for l in linhas], index=atributos.index, dtype=object)
+            atributos[coluna] = atributos[coluna].fillna(chave) if coluna in atributos.columns else chave
+        geometrias = shapely.from_wkb([_wkb(l[3]) if l[3] else None for l in linhas])
+        return gpd.GeoDataFrame(atributos, geometry=geometrias, crs="EPSG:4326")
+
+    # --- escrita -------------------------------------------------------------
+
+    def _inicializar(self) -> None:
+        """Cria o GeoPackage (pelo GDAL) com as camadas vazias e os índices por município."""
+        if not self.caminho.exists():
+            import geopandas as gpd
+            import pandas as pd
+            import pyogrio
+
+            self.caminho.parent.mkdir(parents=True, exist_ok=True)
+            # Criado ao lado e movido pronto: ninguém abre um GeoPackage pela metade
+            temporario = self.caminho.with_name(f"{self.caminho.stem}.{os.getpid()}.tmp.gpkg")
+            temporario.unlink(missing_ok=True)
+            for i, (camada, (_, extras)) in enumerate(CAMADAS.items()):
+                colunas = ["nome_municipio", "regiao", *extras, "props"]
+                vazio = gpd.GeoDataFrame({c: pd.Series([], dtype=object) for c in colunas}, geometry=[], crs="EPSG:4326")
+                pyogrio.write_dataframe(vazio, temporario, layer=camada, driver="GPKG",
+                                        append=i > 0, geometry_type="Unknown")
+            os.replace(temporario, self.caminho)
+        with self._conectar() as conexao:
+            conexao.execute("PRAGMA journal_mode=WAL")  # leitores não esperam a escrita
+            for camada in CAMADAS:
+                conexao.execute(f'CREATE INDEX IF NOT EXISTS "idx_{camada}_municipio" ON "{camada}" (nome_municipio)')
+
+    def substituir(self, camada: str, municipio: str, regiao: Optional[str], features: List[Dict], hash_: str) -> None:
+        """Troca as feições de um município na camada (numa transação) e registra o novo hash."""
+        with self._escrita, self._conectar() as conexao:
+            self._substituir(conexao, camada, municipio, regiao, features, hash_)
+
+    def _substituir(self, conexao: sqlite3.Connection, camada: str, municipio: str, regiao: Optional[str],
+                    features: List[Dict], hash_: str) -> None:
+        from shapely.geometry import shape
+
+        extras = CAMADAS[camada][1]
+        geometrias = _para_gpkg([shape(f["geometry"]) if f.get("geometry") else None for f in features])
+        linhas = []
+        for f, geometria in zip(features, geometrias):
+            props = f.get("properties") or {}
+            valores = []
+            for c in extras:
+                valor = props.get("tipo_assentamento") if c == "tipo" else props.get(c)
+                valores.append(valor.lower() if c == "tipo" and isinstance(valor, str) else _texto(valor))
+            linhas.append((geometria, municipio, regiao, *valores,
+                           json.dumps(props, separators=(",", ":"), ensure_ascii=False)))
+
+        colunas = ["geom", "nome_municipio", "regiao", *extras, "props"]
+        conexao.execute(f'DELETE FROM "{camada}" WHERE nome_municipio = ?', (municipio,))
+        conexao.executemany(
+            f'INSERT INTO "{camada}" ({", ".join(colunas)}) VALUES ({", ".join("?" * len(colunas))})', linhas
+        )
+        conexao.execute("INSERT OR REPLACE INTO replica_hashes VALUES (?, ?, ?)", (camada, municipio, hash_))
+
+    def remover(self, camada: str, municipio: str) -> None:
+        with self._escrita, self._conectar() as conexao:
+            self._remover(conexao, camada, municipio)
+
+    def _remover(self, conexao: sqlite3.Connection, camada: str, municipio: str) -> None:
+        conexao.execute(f'DELETE FROM "{camada}" WHERE nome_municipio = ?', (municipio,))
+        conexao.execute("DELETE FROM replica_hashes WHERE camada = ? AND municipio = ?", (camada, municipio))
+
+    def _gravar_meta(self, conexao: sqlite3.Connection, **valores: str) -> None:
+        conexao.executemany("INSERT OR REPLACE INTO replica_meta VALUES (?, ?)", valores.items())
+
+    # --- sincronização -------------------------------------------------------
+
+    def sincronizar(self, base_url: str, versao: str, forcar: bool = False) -> Dict[str, int]:
+        """
+        Atualiza a réplica para a `versao` do backend e devolve o nº de
+        municípios regravados por camada.
+
+        Se o backend expõe `/versoes_municipios` (hash por camada e município),
+        só os municípios com hash diferente do local são baixados. Sem ele,
+        tudo é baixado, mas só o que mudou (hash do conteúdo) é regravado.
+
+        Todas as escritas e a nova versão vão numa única transação: até o
+        commit final, quem lê (em WAL, sem esperar) continua vendo a versão
+        anterior inteira, e uma falha no meio desfaz tudo.
+        """
+        if self.versao() == versao and not forcar:
+            return {}
+        self._inicializar()
+
+        sessao = requests.Session()
+
+        def obter(caminho: str, **params) -> requests.Response:
+            # Sincronização é lote: cede a vez às páginas que usam o mesmo backend
+            with obter_agendador().vaga(LOTE, "replica"):
+                resp = sessao.get(f"{base_url}{caminho}", params=params, timeout=120)
+            if resp.status_code != 404:
+                resp.raise_for_status()
+            return resp
+
+        regioes = {}
+        for r in obter("/regioes").json().get("regioes", []):
+            resp = obter("/municipios", regiao=r)
+            regioes[r] = resp.json().get("municipios", []) if resp.ok else []
+        regiao_de = {m: r for r, ms in regioes.items() for m in ms}
+        try:
+            resp = obter("/versoes_municipios")
+            remotos = resp.json() if resp.ok else {}
+        except (requests.exceptions.RequestException, ValueError):
+            remotos = {}
+
+        alterados: Dict[str, int] = {}
+        with self._escrita, self._conectar() as conexao:
+            for camada, (endpoint, _) in CAMADAS.items():
+                locais = self._hashes(camada)
+                remotos_camada = remotos.get(camada, {})
+                if endpoint is None and remotos_camada and remotos_camada == locais and not forcar:
+                    baixados, presentes = [], set(locais)  # nada mudou: dispensa a requisição estadual
+                elif endpoint is None:
+                    # Camada estadual buscada em partes (um município por requisição,
+                    # em paralelo) e repartida pelo município de cada feição
+                    resp = obter("/assentamentos_municipio")
+                    partes = resp.json().get("municipios", []) if resp.ok else []
+                    if partes:
+                        def baixar_parte(municipio: str) -> List[Dict]:
+                            resp = obter("/geojson_assentamentos", municipio=municipio)
+                            return resp.json().get("features", []) if resp.ok else []
+                        features, falhas = buscar_em_partes(baixar_parte, partes, workers=MAX_WORKERS)
+                        if falhas:
+                            # Desfaz a transação inteira: a réplica fica na versão anterior
+                            raise RuntimeError(f"Assentamentos de {len(falhas)} municípios não foram baixados")
+                    else:
+                        resp = obter("/geojson_assentamentos")
+                        features = resp.json().get("features", []) if resp.ok else []
+                    por_municipio: Dict[str, List[Dict]] = {}
+                    for f in features:
+                        municipio = (f.get("properties") or {}).get("nome_municipio")
+                        if municipio is not None:
+                            por_municipio.setdefault(municipio, []).append(f)
+                    baixados = [
+                        (m, fs, remotos_camada.get(m) or _hash(json.dumps(fs, sort_keys=True).encode()))
+                        for m, fs in por_municipio.items()
+                    ]
+                    presentes = set(por_municipio)
+                else:
+                    pendentes = [
+                        m for m in regiao_de
+                        if forcar or remotos_camada.get(m) is None or remotos_camada[m] != locais.get(m)
+                    ]
+
+                    def baixar(municipio: str):
+                        resp = obter(endpoint, municipio=municipio)
+                        features = resp.json().get("features", []) if resp.ok else []
+                        return municipio, features, remotos_camada.get(municipio) or _hash(resp.content)
+                    with ThreadPoolExecutor(MAX_WORKERS, thread_name_prefix="replica") as pool:
+                        baixados = list(pool.map(baixar, pendentes))
+                    presentes = set(regiao_de)
+
+                alterados[camada] = 0
+                for municipio, features, hash_ in baixados:
+                    if hash_ != locais.get(municipio):
+                        self._substituir(conexao, camada, municipio, regiao_de.get(municipio), features, hash_)
+                        alterados[camada] += 1
+                for municipio in set(locais) - presentes:
+                    self._remover(conexao, camada, municipio)
+
+            # A versão nova só fica visível com o resto, no commit
+            self._gravar_meta(conexao, versao=versao, regioes=json.dumps(regioes, ensure_ascii=False),
+                              sincronizado_em=time.strftime("%Y-%m-%dT%H:%M:%S"))
+        self._metas.clear()
+        return alterados
+
+    def sincronizar_em_segundo_plano(self, base_url: str, versao: str) -> bool:
+        """
+        Dispara `sincronizar` numa thread, se a réplica não está em `versao` e
+        nenhuma sincronização está em andamento. Retorna True se disparou.
+        """
+        if self.versao() == versao:
+            return False
+        if time.monotonic() - self._falhas.get(versao, -ESPERA_APOS_FALHA_S) < ESPERA_APOS_FALHA_S:
+            return False
+        if not self._sincronizacao.acquire(blocking=False):
+            return False
+
+        def executar():
+            try:
+                alterados = self.sincronizar(base_url, versao)
+                logger.info("Réplica sincronizada na versão %s: %s", versao, alterados)
+            except (requests.exceptions.RequestException, sqlite3.Error, RuntimeError, ValueError) as e:
+                self._falhas[versao] = time.monotonic()
+                logger.warning("Falha ao sincronizar a réplica: %s", e)
+            finally:
+                self._sincronizacao.release()
+
+        try:
+            threading.Thread(target=executar, name="replica-sync", daemon=True).start()
+        except RuntimeError:
+            self._sincronizacao.release()
+            raise
+        return True
+
+
+@st.cache_resource
+def obter_replica() -> Replica:
+    """Réplica local compartilhada por todas as sessões do processo."""
+    return Replica(REPLICA_PATH)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from modules.data_loader import BASE_URL, fetch_versao_backend
+
+    parser = argparse.ArgumentParser(description="Sincroniza a réplica local com o TerraGeo")
+    parser.add_argument("--forcar", action="store_true", help="revisa todos os municípios")
+    args = parser.parse_args()
+    print(Replica(REPLICA_PATH).sincronizar(BASE_URL, fetch_versao_backend(), forcar=args.forcar))
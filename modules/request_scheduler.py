@@ -0,0 +1,277 @@
+# modules/request_scheduler.py
+
+import contextvars
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Callable, Deque, Dict, Iterator, Optional, TypeVar, Union
+
+import streamlit as st
+
+# Requisições simultâneas ao TerraGeo somando todas as sessões do processo
+LIMITE_REQUISICOES = int(st.secrets.get("TERRAGEO_CONCORRENCIA", 8))
+# Vagas que requisições em lote nunca ocupam, para um clique não esperar uma exportação
+RESERVA_INTERATIVA = 1
+# Esperas acima disso vão para o log
+ESPERA_REGISTRO_S = 1.0
+
+# Classes de prioridade (menor = atendida antes)
+INTERATIVA = 0
+LOTE = 1
+NOMES_CLASSES = {INTERATIVA: "interativa", LOTE: "lote"}
+
+logger = logging.getLogger(__name__)
+
+R = TypeVar("R")
+
+_PRIORIDADE: contextvars.ContextVar[int] = contextvars.ContextVar("prioridade", default=INTERATIVA)
+_SESSAO: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("sessao", default=None)
+
+
+def sessao_atual() -> str:
+    """Sessão do Streamlit que originou a requisição ("processo" fora de um script)."""
+    sessao = _SESSAO.get()
+    if sessao is not None:
+        return sessao
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    ctx = get_script_run_ctx(suppress_warning=True)
+    return ctx.session_id if ctx else "processo"
+
+
+@contextmanager
+def em_lote() -> Iterator[None]:
+    """Requisições feitas dentro do bloco entram na fila de lote."""
+    token = _PRIORIDADE.set(LOTE)
+    try:
+        yield
+    finally:
+        _PRIORIDADE.reset(token)
+
+
+def em_lote_na_sessao(funcao: Callable[..., R]) -> Callable[..., R]:
+    """
+    Envolve `funcao` para rodar em outra thread (ex.: `buscar_em_partes`)
+    como lote da sessão atual: threads de pool não herdam as variáveis de
+    contexto, então a sessão é lida aqui e fixada em cada chamada.
+    """
+    sessao = sessao_atual()
+
+    def envolvida(*args, **kwargs) -> R:
+        token = _SESSAO.set(sessao)
+        try:
+            with em_lote():
+                return funcao(*args, **kwargs)
+        finally:
+            _SESSAO.reset(token)
+
+    return envolvida
+
+
+class AgendadorRequisicoes:
+    """
+    Limite global de requisições ao backend, com filas por prioridade.
+
+    Uma requisição só sai quando há vaga; quem espera é atendido pela
+    classe (interativas antes de lote) e, dentro da classe, em rodízio
+    entre sessões, uma requisição de cada por vez: a exportação de um
+    usuário não segura o mapa de outro, e uma sessão com centenas de
+    pedidos na fila não passa na frente de quem pediu um só. Requisições
+    em lote deixam `reserva` vagas livres para as interativas.
+    """
+
+    def __init__(self, limite: int = LIMITE_REQUISICOES, reserva: int = RESERVA_INTERATIVA):
+        self._cond = threading.Condition()
+        self._filas: Dict[int, "OrderedDict[str, Deque[object]]"] = {c: OrderedDict() for c in NOMES_CLASSES}
+        self._ativas = {c: 0 for c in NOMES_CLASSES}
+        self._esperas: Dict[int, Deque[float]] = {c: deque(maxlen=1000) for c in NOMES_CLASSES}
+        self._atendidas = {c: 0 for c in NOMES_CLASSES}
+        self.definir_limite(limite, reserva)
+
+    def definir_limite(self, limite: int, reserva: int = RESERVA_INTERATIVA) -> None:
+        with self._cond:
+            self.limite = max(1, limite)
+            # Com uma vaga só, reservá-la pararia os lotes de vez
+            self.reserva = min(reserva, self.limite - 1)
+            self._cond.notify_all()
+
+    def _liberada(self, classe: int, vez: object) -> bool:
+        """`vez` é a próxima da sua classe e há vaga para ela."""
+        ativas = sum(self._ativas.values())
+        if classe == LOTE:
+            if self._filas[INTERATIVA] or ativas >= self.limite - self.reserva:
+                return False
+        elif ativas >= self.limite:
+            return False
+        fila = next(iter(self._filas[classe].values()))
+        return fila[0] is vez
+
+    def ocupar(self, classe: Optional[int] = None, sessao: Optional[str] = None) -> int:
+        """Espera a vez da requisição e ocupa uma vaga; devolve a classe, para `liberar`."""
+        classe = _PRIORIDADE.get() if classe is None else classe
+        sessao = sessao_atual() if sessao is None else sessao
+        vez = object()
+        inicio = time.perf_counter()
+        with self._cond:
+            filas = self._filas[classe]
+            filas.setdefault(sessao, deque()).append(vez)
+            while not self._liberada(classe, vez):
+                self._cond.wait()
+            # Atendida: a sessão vai para o fim do rodízio (ou sai dele, se não pediu mais nada)
+            fila = filas[sessao]
+            fila.popleft()
+            if fila:
+                filas.move_to_end(sessao)
+            else:
+                del filas[sessao]
+            self._ativas[classe] += 1
+            espera = time.perf_counter() - inicio
+            self._esperas[classe].append(espera)
+            self._atendidas[classe] += 1
+            # A próxima da fila pode já ter vaga também
+            self._cond.notify_all()
+        if espera > ESPERA_REGISTRO_S:
+            logger.info("Requisição %s esperou %.1f s por uma vaga no backend", NOMES_CLASSES[classe], espera)
+        return classe
+
+    def liberar(self, classe: int) -> None:
+        with self._cond:
+            self._ativas[classe] -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def vaga(self, classe: Optional[int] = None, sessao: Optional[str] = None) -> Iterator[None]:
+        """Espera a vez da requisição e ocupa uma vaga até o fim do bloco."""
+        classe = self.ocupar(classe, sessao)
+        try:
+            yield
+        finally:
+            self.liberar(classe)
+
+    def executar(self, funcao: Callable[..., R], *args, **kwargs) -> R:
+        with self.vaga():
+            return funcao(*args, **kwargs)
+
+    def metricas(self) -> Dict:
+        """Fila, vagas em uso e tempo de espera (últimas 1000 requisições) por classe."""
+        with self._cond:
+            dados = {"limite": self.limite, "reserva_interativa": self.reserva}
+            for classe, nome in NOMES_CLASSES.items():
+                esperas = sorted(self._esperas[classe])
+                dados[nome] = {
+                    "em_andamento": self._ativas[classe],
+                    "na_fila": sum(len(f) for f in self._filas[classe].values()),
+                    "sessoes_na_fila": len(self._filas[classe]),
+                    "atendidas": self._atendidas[classe],
+                    "espera_media_s": sum(esperas) / len(esperas) if esperas else 0.0,
+                    "espera_p95_s": esperas[int(0.95 * (len(esperas) - 1))] if esperas else 0.0,
+                    "espera_max_s": esperas[-1] if esperas else 0.0,
+                }
+            return dados
+
+
+# Pedidos que passam pelas filas de `RepasseVagas`
+_OCUPAR = "ocupar"
+_LIBERAR = "liberar"
+
+
+class RepasseVagas:
+    """
+    Vagas deste processo repassadas a processos filhos (ex.: o pool da
+    exportação estadual), para que o limite continue valendo para o
+    conjunto: cada requisição de um filho espera aqui, como lote da
+    `sessao`, na mesma fila das páginas, e as interativas passam na frente.
+    Os filhos chamam `usar_vagas_remotas(*repasse.filas)` (ex.: no
+    `initializer` do pool); vagas que um filho não devolveu são liberadas
+    ao sair do bloco `with`.
+    """
+
+    def __init__(self, agendador: AgendadorRequisicoes, contexto, sessao: str):
+        self._agendador = agendador
+        self._sessao = sessao
+        self.filas = (contexto.Queue(), contexto.Queue())
+        self._trava = threading.Lock()
+        self._ocupadas = 0
+        self._encerrado = False
+        self._thread = threading.Thread(target=self._atender, name="repasse-vagas", daemon=True)
+
+    def __enter__(self) -> "RepasseVagas":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *excecao) -> None:
+        pedidos, _ = self.filas
+        pedidos.put(None)
+        self._thread.join()
+        with self._trava:
+            self._encerrado = True
+            restantes, self._ocupadas = self._ocupadas, 0
+        for _ in range(restantes):
+            self._agendador.liberar(LOTE)
+
+    def _atender(self) -> None:
+        pedidos, _ = self.filas
+        while True:
+            pedido = pedidos.get()
+            if pedido is None:
+                return
+            if pedido == _OCUPAR:
+                # A espera pela vaga não pode segurar as devoluções que chegam depois
+                threading.Thread(target=self._ocupar, daemon=True).start()
+            else:
+                with self._trava:
+                    self._ocupadas -= 1
+                self._agendador.liberar(LOTE)
+
+    def _ocupar(self) -> None:
+        _, fichas = self.filas
+        self._agendador.ocupar(LOTE, self._sessao)
+        with self._trava:
+            if not self._encerrado:
+                self._ocupadas += 1
+                fichas.put(True)
+                return
+        self._agendador.liberar(LOTE)
+
+
+class VagasRemotas:
+    """Lado do filho de `RepasseVagas`: cada requisição pede uma vaga ao processo principal e a devolve no fim."""
+
+    def __init__(self, pedidos, fichas):
+        self._pedidos = pedidos
+        self._fichas = fichas
+
+    @contextmanager
+    def vaga(self, classe: Optional[int] = None, sessao: Optional[str] = None) -> Iterator[None]:
+        # Classe e sessão são as do repasse: tudo que um filho pede é lote de quem o criou
+        self._pedidos.put(_OCUPAR)
+        self._fichas.get()
+        try:
+            yield
+        finally:
+            self._pedidos.put(_LIBERAR)
+
+    def executar(self, funcao: Callable[..., R], *args, **kwargs) -> R:
+        with self.vaga():
+            return funcao(*args, **kwargs)
+
+
+# Preenchido nos processos filhos que usam as vagas do principal
+_VAGAS_REMOTAS: Optional[VagasRemotas] = None
+
+
+def usar_vagas_remotas(pedidos, fichas) -> None:
+    """Faz as requisições deste processo (filho) ocuparem vagas do agendador do processo principal."""
+    global _VAGAS_REMOTAS
+    _VAGAS_REMOTAS = VagasRemotas(pedidos, fichas)
+
+
+@st.cache_resource
+def _agendador_do_processo() -> AgendadorRequisicoes:
+    return AgendadorRequisicoes()
+
+
+def obter_agendador() -> Union[AgendadorRequisicoes, VagasRemotas]:
+    """Agendador compartilhado por todas as sessões do processo (num filho de `RepasseVagas`, o do principal)."""
+    return _VAGAS_REMOTAS or _agendador_do_processo()
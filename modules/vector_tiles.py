@@ -0,0 +1,215 @@
+# modules/vector_tiles.py
+
+import hashlib
+import re
+import shutil
+import threading
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import geopandas as gpd
+import mapbox_vector_tile
+import pandas as pd
+import shapely
+import streamlit as st
+
+from modules.asset_server import iniciar_servidor, registrar_rota
+from modules.data_loader import fetch_versao_dados
+from modules.geo_store import obter_store
+
+# Cache em disco dos tiles já gerados: TILES_DIR/<versao>/<z>/<x>/<y>.pbf
+TILES_DIR = Path(st.secrets.get("TILES_DIR", "tiles_cache"))
+
+# Resolução interna de cada tile MVT e margem (em unidades do tile) contra costuras
+EXTENT = 4096
+MARGEM = 64
+
+# Abaixo desse zoom só os limites municipais vão nos tiles (propriedades viram ruído)
+ZOOM_MIN_PROPRIEDADES = 9
+# Acima desse zoom o navegador amplia os tiles existentes em vez de pedir novos
+ZOOM_MAX_NATIVO = 14
+
+# Metade da circunferência da Terra em EPSG:3857
+ORIGEM = 20037508.342789244
+
+# Poda de atributos: só o que os estilos e tooltips usam vai para os tiles
+ATRIBUTOS = {
+    "propriedades": ["categoria", "area", "nome_municipio"],
+    "limites": ["nome_municipio"],
+}
+
+# Segmento aceito nas rotas de tiles (versão, chave; ex.: "2024-05-01T10:00"): sem "/" nem ".."
+_SEGMENTO = re.compile(r"\w[\w.:-]*")
+
+# Camadas carregadas por versão dos dados; lidas pela thread do servidor de assets
+_CAMADAS: Dict[str, Dict[str, gpd.GeoDataFrame]] = {}
+
+
+def _projetar_camada(gdf: gpd.GeoDataFrame, colunas: List[str]) -> gpd.GeoDataFrame:
+    """Projeção em EPSG:3857 de uma camada do store, só com as colunas dos tiles."""
+    if gdf.empty:
+        return gpd.GeoDataFrame(columns=colunas + ["geometry"], geometry="geometry", crs="EPSG:3857")
+    gdf = gdf[[c for c in colunas if c in gdf.columns] + ["geometry"]].to_crs(3857)
+    for coluna in colunas:
+        if coluna not in gdf.columns:
+            gdf[coluna] = None
+    gdf = gdf[~gdf.geometry.is_empty & gdf.geometry.notna()].reset_index(drop=True)
+    # Constrói o índice espacial agora, e não no primeiro tile pedido
+    gdf.sindex
+    return gdf
+
+
+def _versao_dados(camadas: Dict[str, gpd.GeoDataFrame]) -> str:
+    """Hash barato dos dados (atributos, bounds e nº de vértices) para versionar os tiles."""
+    h = hashlib.sha256()
+    for nome, gdf in sorted(camadas.items()):
+        h.update(nome.encode())
+        if gdf.empty:
+            continue
+        h.update(pd.util.hash_pandas_object(gdf.drop(columns="geometry"), index=False).values.tobytes())
+        h.update(pd.util.hash_pandas_object(gdf.geometry.bounds, index=False).values.tobytes())
+        h.update(shapely.get_num_coordinates(gdf.geometry.values).tobytes())
+    return h.hexdigest()[:12]
+
+
+@st.cache_resource(ttl=3600, show_spinner="Preparando camadas estaduais para os tiles...")
+def preparar_camadas() -> str:
+    """
+    Projeta propriedades e limites do store estadual (ver `modules.geo_store`)
+    para EPSG:3857, uma vez por processo.
+
+    Retorna a versão dos dados; as camadas ficam acessíveis por `camadas(versao)`.
+    """
+    store = obter_store(fetch_versao_dados())
+    carregadas = {
+        "propriedades": _projetar_camada(store.propriedades.gdf, ATRIBUTOS["propriedades"]),
+        "limites": _projetar_camada(store.limites.gdf, ATRIBUTOS["limites"]),
+    }
+    versao = _versao_dados(carregadas)
+    _CAMADAS.clear()
+    _CAMADAS[versao] = carregadas
+    # Tiles de outras versões não são mais pedidos por páginas novas
+    remover_versoes_antigas(TILES_DIR, lambda nome: nome in (versao, "raster"))
+    return versao
+
+
+def remover_versoes_antigas(pasta: Path, manter: Callable[[str], bool]) -> None:
+    """Apaga as subpastas de `pasta` (uma por versão dos dados) cujo nome `manter` recusa."""
+    if not pasta.is_dir():
+        return
+    for subpasta in pasta.iterdir():
+        if subpasta.is_dir() and not manter(subpasta.name):
+            shutil.rmtree(subpasta, ignore_errors=True)
+
+
+def camadas(versao: str) -> Optional[Dict[str, gpd.GeoDataFrame]]:
+    """Camadas estaduais (EPSG:3857) carregadas para `versao`, se ainda em memória."""
+    return _CAMADAS.get(versao)
+
+
+def preparar_tiles() -> str:
+    """
+    Garante as camadas estaduais carregadas e registra a rota de tiles vetoriais.
+
+    Retorna o template de URL `{z}/{x}/{y}` que o Leaflet deve usar.
+    """
+    versao = preparar_camadas()
+    registrar_rota("tiles", _servir_tile)
+    base_url = iniciar_servidor()
+    return f"{base_url}/tiles/{versao}/{{z}}/{{x}}/{{y}}.pbf"
+
+
+def limites_tile(z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """Retorna (minx, miny, maxx, maxy) do tile XYZ em EPSG:3857."""
+    tamanho = 2 * ORIGEM / (2 ** z)
+    minx = -ORIGEM + x * tamanho
+    maxy = ORIGEM - y * tamanho
+    return minx, maxy - tamanho, minx + tamanho, maxy
+
+
+def _features_do_tile(nome: str, gdf: gpd.GeoDataFrame, bounds, recorte) -> List[Dict]:
+    """Seleciona, recorta e simplifica as feições de uma camada para um tile."""
+    idx = gdf.sindex.query(shapely.box(*recorte), predicate="intersects")
+    if len(idx) == 0:
+        return []
+    sub = gdf.iloc[idx]
+
+    # Tamanho de um pixel (tile de 256 px) neste zoom
+    pixel = (bounds[2] - bounds[0]) / 256
+    if nome == "propriedades":
+        # Propriedades menores que um pixel não aparecem; não vale enviá-las
+        sub = sub[sub.geometry.area >= pixel * pixel]
+        if sub.empty:
+            return []
+
+    geometrias = sub.geometry.clip_by_rect(*recorte).simplify(pixel / 2, preserve_topology=False)
+    atributos = sub[ATRIBUTOS[nome]].to_dict("records")
+
+    features = []
+    for geometria, props in zip(geometrias, atributos):
+        if geometria is None or geometria.is_empty:
+            continue
+        props = {k: v for k, v in props.items() if v is not None and not pd.isna(v)}
+        features.append({"geometry": geometria, "properties": props})
+    return features
+
+
+def gerar_tile(versao: str, z: int, x: int, y: int) -> Optional[bytes]:
+    """Gera (ou lê do cache em disco) o tile MVT z/x/y de uma versão dos dados."""
+    arquivo = TILES_DIR / versao / str(z) / str(x) / f"{y}.pbf"
+    if arquivo.exists():
+        return arquivo.read_bytes()
+
+    camadas = _CAMADAS.get(versao)
+    if camadas is None:
+        return None
+
+    bounds = limites_tile(z, x, y)
+    folga = (bounds[2] - bounds[0]) * MARGEM / EXTENT
+    recorte = (bounds[0] - folga, bounds[1] - folga, bounds[2] + folga, bounds[3] + folga)
+
+    layers = []
+    for nome, gdf in camadas.items():
+        if gdf.empty or (nome == "propriedades" and z < ZOOM_MIN_PROPRIEDADES):
+            continue
+        features = _features_do_tile(nome, gdf, bounds, recorte)
+        if features:
+            layers.append({"name": nome, "features": features})
+
+    dados = b""
+    if layers:
+        dados = mapbox_vector_tile.encode(
+            layers,
+            default_options={"quantize_bounds": bounds, "extents": EXTENT},
+        )
+
+    arquivo.parent.mkdir(parents=True, exist_ok=True)
+    temporario = arquivo.with_name(f"{y}.{threading.get_ident()}.tmp")
+    temporario.write_bytes(dados)
+    temporario.replace(arquivo)
+    return dados
+
+
+def segmento_valido(segmento: str) -> bool:
+    """Segmento que pode entrar em um caminho sob TILES_DIR sem sair dele."""
+    return bool(_SEGMENTO.fullmatch(segmento)) and ".." not in segmento
+
+
+def _servir_tile(caminho: str) -> Optional[Tuple[bytes, str]]:
+    """Rota do servidor de assets: `<versao>/<z>/<x>/<y>.pbf`."""
+    partes = caminho.split("/")
+    if len(partes) != 4 or not partes[3].endswith(".pbf"):
+        return None
+    versao, z, x, y = partes[0], partes[1], partes[2], partes[3][:-4]
+    if not segmento_valido(versao):
+        return None
+    try:
+        z, x, y = int(z), int(x), int(y)
+    except ValueError:
+        return None
+    if not (0 <= z <= 22 and 0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        return None
+    dados = gerar_tile(versao, z, x, y)
+    if dados is None:
+        return None
+    return dados, "application/x-protobuf"